@@ -0,0 +1,292 @@
+"""
+agreement.py
+人手アノテーションと機械アノテーションの一致度（重み付きκ・相関・MAE・混同行列）を計算するモジュール（CLIとしても実行可能）
+
+人手のスコアは次の2つから集める。
+    - 出力JSONの human_annotations（グラフ編集で保存したもの。corpus_export の列指向データセット経由で読む）
+    - 出力ディレクトリの記入済み人手アノテーション用CSV（`{出力名}_annotation*.csv`）
+同じ発言・指標にJSONの人手アノテーションがある場合はそちらを使い、CSVのスコアはJSONにない発言・指標だけに使う
+（CSVを取り込んだ後のJSONと元のCSVを二重に数えないため）。
+
+使用例:
+    python agreement.py                        # 指標ごと・アノテーションモデルごとの一致度を表示
+    python agreement.py --by profile           # プロフィールごと
+    python agreement.py --no-csv --json        # JSONの人手アノテーションだけを使い、JSONで出力
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from dotenv import load_dotenv
+
+from analytics import SCORE_RANGE
+from annotation_csv import AnnotationSheet, align_sheet, find_annotation_csvs, output_stem, read_annotation_csv
+from corpus_export import Corpus, CorpusExporter, load_corpus
+
+
+# グループ別の集計に使う列（APIの by_* キー → データセットの列）
+GROUP_COLUMNS = {
+    "annotation_model": "annotation_model",
+    "profile": "profile_filename",
+}
+
+
+def _round(value: Optional[float], digits: int = 3) -> Optional[float]:
+    return None if value is None or np.isnan(value) else round(float(value), digits)
+
+
+def _rankdata(values: np.ndarray) -> np.ndarray:
+    """順位（同順位は平均順位）"""
+    order = np.argsort(values, kind="mergesort")
+    sorted_values = values[order]
+    # 同じ値の区間ごとに平均順位を割り当てる
+    starts = np.flatnonzero(np.r_[True, sorted_values[1:] != sorted_values[:-1]])
+    ends = np.r_[starts[1:], len(values)]
+    average = (starts + ends - 1) / 2 + 1
+    ranks = np.empty(len(values))
+    ranks[order] = np.repeat(average, ends - starts)
+    return ranks
+
+
+def _pearson(x: np.ndarray, y: np.ndarray) -> Optional[float]:
+    if len(x) < 2 or x.std() == 0 or y.std() == 0:
+        return None
+    return float(np.corrcoef(x, y)[0, 1])
+
+
+def confusion_matrix(human: np.ndarray, machine: np.ndarray) -> np.ndarray:
+    """混同行列（行: 人手のスコア、列: 機械のスコア。0-9の10×10、範囲外のスコアは端に寄せる）"""
+    low, high = SCORE_RANGE
+    k = high - low + 1
+    h = np.clip(np.rint(human), low, high).astype(np.int64) - low
+    m = np.clip(np.rint(machine), low, high).astype(np.int64) - low
+    return np.bincount(h * k + m, minlength=k * k).reshape(k, k)
+
+
+def weighted_kappa(confusion: np.ndarray) -> Optional[float]:
+    """二次重み付きCohenのκ（期待不一致が0の場合はNone）"""
+    n = confusion.sum()
+    if n == 0:
+        return None
+    k = confusion.shape[0]
+    index = np.arange(k)
+    weights = (index[:, None] - index[None, :]) ** 2 / (k - 1) ** 2
+    expected = np.outer(confusion.sum(axis=1), confusion.sum(axis=0)) / n
+    denominator = (weights * expected).sum()
+    if denominator == 0:
+        return None
+    return float(1 - (weights * confusion).sum() / denominator)
+
+
+def agreement_stats(human: np.ndarray, machine: np.ndarray) -> Dict[str, Any]:
+    """人手・機械のスコアの組（同じ長さの配列）の一致度"""
+    if len(human) == 0:
+        return {"count": 0}
+    confusion = confusion_matrix(human, machine)
+    pearson = _pearson(human, machine)
+    spearman = _pearson(_rankdata(human), _rankdata(machine))
+    return {
+        "count": int(len(human)),
+        "kappa": _round(weighted_kappa(confusion)),
+        "pearson": _round(pearson),
+        "spearman": _round(spearman),
+        "mae": _round(np.abs(human - machine).mean()),
+        "exact": _round((np.rint(human) == np.rint(machine)).mean()),
+        # 機械のスコアが人手より平均でどれだけ高いか
+        "bias": _round((machine - human).mean()),
+        "confusion": confusion.tolist(),
+    }
+
+
+class ScorePairs:
+    """指標ごとの人手・機械のスコアの組（データセットの行番号付き）"""
+
+    def __init__(self):
+        self.rows: Dict[str, List[np.ndarray]] = {}
+        self.human: Dict[str, List[np.ndarray]] = {}
+
+    def add(self, metric: str, rows: np.ndarray, human: np.ndarray) -> None:
+        self.rows.setdefault(metric, []).append(rows)
+        self.human.setdefault(metric, []).append(human)
+
+    def get(self, metric: str) -> Tuple[np.ndarray, np.ndarray]:
+        if metric not in self.rows:
+            return np.zeros(0, dtype=np.int64), np.zeros(0)
+        return np.concatenate(self.rows[metric]), np.concatenate(self.human[metric])
+
+
+def collect_pairs(corpus: Corpus, sheets: List[AnnotationSheet]) -> Tuple[ScorePairs, Dict[str, Any]]:
+    """
+    データセットの人手アノテーションとCSVのスコアを、機械アノテーションのある発言について集める
+
+    Returns:
+        (ScorePairs, 読み込み結果 {"human_annotations", "csv", "csv_files", "mismatches"})
+    """
+    pairs = ScorePairs()
+    sources = {"human_annotations": 0, "csv": 0, "csv_files": 0, "mismatches": []}
+    machine = {m: np.asarray(corpus[f"machine.{m}"]) for m in corpus.metrics}
+    human = {m: np.asarray(corpus[f"human.{m}"]) for m in corpus.metrics}
+
+    for m in corpus.metrics:
+        rows = np.flatnonzero(~np.isnan(human[m]) & ~np.isnan(machine[m]))
+        pairs.add(m, rows, human[m][rows].astype(np.float64))
+        sources["human_annotations"] += len(rows)
+
+    if not sheets:
+        return pairs, sources
+
+    # 出力名（scenario_idの最後の部分）→ データセットの行の範囲
+    offsets: Dict[str, Tuple[str, int, int]] = {}
+    start = 0
+    for sid, info in corpus.manifest["files"].items():
+        offsets.setdefault(Path(sid).name, (sid, start, info["rows"]))
+        start += info["rows"]
+    texts = corpus["text"]
+
+    for sheet in sheets:
+        stem = output_stem(sheet.path)
+        if stem not in offsets:
+            sources["mismatches"].append({"csv": sheet.path.name, "reason": "missing_output"})
+            continue
+        sid, start, length = offsets[stem]
+        usable, mismatches = align_sheet(sheet, texts[start:start + length])
+        for mismatch in mismatches + [{"reason": "invalid_score", **cell} for cell in sheet.invalid]:
+            sources["mismatches"].append({"csv": sheet.path.name, "scenario_id": sid, **mismatch})
+        sources["csv_files"] += 1
+
+        turns = np.flatnonzero(usable)
+        rows = start + turns
+        for m, scores in sheet.scores.items():
+            if m not in machine:
+                continue
+            values = scores[turns]
+            keep = ~np.isnan(values) & np.isnan(human[m][rows]) & ~np.isnan(machine[m][rows])
+            pairs.add(m, rows[keep], values[keep])
+            sources["csv"] += int(keep.sum())
+
+    return pairs, sources
+
+
+def compute_agreement(corpus: Corpus, sheets: List[AnnotationSheet]) -> Dict[str, Any]:
+    """指標ごと・グループ（アノテーションモデル・プロフィール）ごとの一致度"""
+    pairs, sources = collect_pairs(corpus, sheets)
+    machine = {m: np.asarray(corpus[f"machine.{m}"]) for m in corpus.metrics}
+    group_codes = {key: np.asarray(corpus.codes(column)) for key, column in GROUP_COLUMNS.items()}
+
+    result: Dict[str, Any] = {"metrics": {}, **{f"by_{key}": {} for key in GROUP_COLUMNS}, "sources": sources}
+    for m in corpus.metrics:
+        rows, human = pairs.get(m)
+        scores = machine[m][rows].astype(np.float64)
+        result["metrics"][m] = agreement_stats(human, scores)
+
+        for key, column in GROUP_COLUMNS.items():
+            codes = group_codes[key][rows]
+            labels = corpus.vocabulary(column)
+            for code in np.unique(codes):
+                mask = codes == code
+                result[f"by_{key}"].setdefault(labels[code], {})[m] = agreement_stats(human[mask], scores[mask])
+    return result
+
+
+class AgreementEngine:
+    """データセットとCSVを更新分だけ読み込み、変更があった場合だけ一致度を計算し直すクラス"""
+
+    def __init__(self, exporter: CorpusExporter):
+        self.exporter = exporter
+        self._lock = threading.Lock()
+        self._sheets: Dict[str, Tuple[Tuple[int, int], Optional[AnnotationSheet]]] = {}
+        self._key: Optional[Tuple[Any, ...]] = None
+        self._result: Optional[Dict[str, Any]] = None
+
+    def get(self, include_csv: bool = True) -> Dict[str, Any]:
+        """最新の一致度（データセット・CSVに変更がなければキャッシュ済みの結果）"""
+        with self._lock:
+            self.exporter.export()
+            corpus = load_corpus(str(self.exporter.corpus_dir))
+            sheets, errors = self._read_sheets() if include_csv else ([], [])
+            key = (corpus.manifest["version"], include_csv, tuple(self._sheets[str(s.path)][0] for s in sheets))
+            if self._result is None or key != self._key:
+                self._result = compute_agreement(corpus, sheets)
+                self._result["sources"]["mismatches"] += errors
+                self._key = key
+            return self._result
+
+    def _read_sheets(self) -> Tuple[List[AnnotationSheet], List[Dict[str, Any]]]:
+        """出力ディレクトリのCSVを読み込む（前回から変更のないファイルは読み直さない）"""
+        sheets, errors = [], []
+        paths = find_annotation_csvs(str(self.exporter.outputs_dir))
+        for path in paths:
+            stat = path.stat()
+            signature = (stat.st_mtime_ns, stat.st_size)
+            cached = self._sheets.get(str(path))
+            if cached is None or cached[0] != signature:
+                try:
+                    cached = (signature, read_annotation_csv(path))
+                except (OSError, ValueError) as e:
+                    cached = (signature, None)
+                    print(f"警告: {path} を読み込めませんでした: {e}")
+                self._sheets[str(path)] = cached
+            if cached[1] is None:
+                errors.append({"csv": path.name, "reason": "unreadable"})
+            else:
+                sheets.append(cached[1])
+        for stale in set(self._sheets) - {str(p) for p in paths}:
+            del self._sheets[stale]
+        return sheets, errors
+
+
+def format_table(result: Dict[str, Any], by: str) -> str:
+    """一致度を表形式の文字列にする"""
+    lines = [f"{'グループ':<28} {'指標':<8} {'件数':>6} {'κ':>7} {'Spearman':>9} {'Pearson':>8} {'MAE':>6} {'差':>6}"]
+
+    def cell(value: Any) -> str:
+        return "-" if value is None else f"{value:.3f}"
+
+    groups = {"(全体)": result["metrics"]} if by == "all" else result[f"by_{by}"]
+    for group, metrics in groups.items():
+        for m, stats in metrics.items():
+            if not stats["count"]:
+                continue
+            lines.append(
+                f"{group:<28} {m:<8} {stats['count']:>6} {cell(stats['kappa']):>7} {cell(stats['spearman']):>9} "
+                f"{cell(stats['pearson']):>8} {cell(stats['mae']):>6} {cell(stats['bias']):>6}"
+            )
+    return "\n".join(lines)
+
+
+def main(argv: List[str] = None) -> int:
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description="人手アノテーションと機械アノテーションの一致度を計算する")
+    parser.add_argument("--outputs-dir", default=os.getenv("OUTPUTS_DIR", "data/outputs"), help="出力JSONのディレクトリ")
+    parser.add_argument("--corpus-dir", default=os.getenv("CORPUS_DIR", "data/corpus"), help="データセットの保存先")
+    parser.add_argument("--by", choices=["all", *GROUP_COLUMNS], default="annotation_model", help="集計の単位")
+    parser.add_argument("--no-csv", action="store_true", help="人手アノテーション用CSVを使わない")
+    parser.add_argument("--json", action="store_true", help="結果をJSONで出力する")
+    args = parser.parse_args(argv)
+
+    engine = AgreementEngine(CorpusExporter(args.outputs_dir, args.corpus_dir))
+    result = engine.get(include_csv=not args.no_csv)
+
+    if args.json:
+        print(json.dumps(result, ensure_ascii=False, indent=2))
+        return 0
+
+    sources = result["sources"]
+    print(
+        f"人手アノテーション: JSON {sources['human_annotations']}件・"
+        f"CSV {sources['csv']}件（{sources['csv_files']}ファイル）"
+    )
+    for mismatch in sources["mismatches"]:
+        print(f"警告: {json.dumps(mismatch, ensure_ascii=False)}")
+    print(format_table(result, args.by))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,166 @@
+"""
+analytics.py
+保存済みシナリオ全体の集計（スコア分布・目標割合の達成度・発言者/プロフィール別平均・モデル間の差）を行うモジュール
+
+集計は corpus_export の列指向データセットに対してNumPyでまとめて計算する。
+データセットは追加・変更されたファイルだけを読み込んで更新し、集計結果はデータセットのバージョンごとにキャッシュする。
+"""
+import threading
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from corpus_export import Corpus, CorpusExporter, load_corpus
+
+
+# 高スコアとみなすスコア（extra.jsonの「高スコア（7-9）」）
+HIGH_SCORE_THRESHOLD = 7
+# スコアの範囲（アノテーションは0-9の10段階評価）
+SCORE_RANGE = (0, 9)
+
+
+def _round(value: float, digits: int = 3) -> Optional[float]:
+    return None if value is None or np.isnan(value) else round(float(value), digits)
+
+
+def _histogram(scores: np.ndarray) -> Dict[str, int]:
+    """スコアごとの件数（範囲外のスコアは端に寄せる、評価なしは数えない）"""
+    low, high = SCORE_RANGE
+    valid = scores[~np.isnan(scores)]
+    counts = np.bincount(np.clip(np.rint(valid), low, high).astype(np.int64) - low, minlength=high - low + 1)
+    return {str(low + i): int(count) for i, count in enumerate(counts)}
+
+
+def _group_stats(codes: np.ndarray, labels: List[str], scores: np.ndarray) -> Dict[str, Dict[str, Any]]:
+    """グループ（category列のコード）ごとの評価件数・平均スコア・高スコア割合"""
+    valid = ~np.isnan(scores)
+    n_groups = len(labels)
+    counts = np.bincount(codes[valid], minlength=n_groups)
+    sums = np.bincount(codes[valid], weights=scores[valid], minlength=n_groups)
+    highs = np.bincount(codes[valid], weights=(scores[valid] >= HIGH_SCORE_THRESHOLD), minlength=n_groups)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        means = sums / counts
+        high_ratios = highs / counts
+    return {
+        labels[i]: {"count": int(counts[i]), "mean": _round(means[i]), "high_ratio": _round(high_ratios[i])}
+        for i in range(n_groups) if counts[i]
+    }
+
+
+def compute_analytics(corpus: Corpus) -> Dict[str, Any]:
+    """データセット全体の集計"""
+    metrics = corpus.metrics
+    num_rows = len(corpus)
+    scenario_codes = np.asarray(corpus.codes("scenario_id"))
+    scenario_labels = corpus.vocabulary("scenario_id")
+    n_scenarios = len(scenario_labels)
+
+    machine = {m: np.asarray(corpus[f"machine.{m}"]) for m in metrics}
+    human = {m: np.asarray(corpus[f"human.{m}"]) for m in metrics}
+
+    result: Dict[str, Any] = {
+        "num_scenarios": n_scenarios,
+        "num_utterances": num_rows,
+        "high_score_threshold": HIGH_SCORE_THRESHOLD,
+        "metrics": {},
+        "target_attainment": {},
+        "by_speaker": {},
+        "by_profile": {},
+        "by_annotation_model": {},
+        "by_scenario_model": {},
+    }
+
+    for m in metrics:
+        scores = machine[m]
+        valid = ~np.isnan(scores)
+        result["metrics"][m] = {
+            "count": int(valid.sum()),
+            "mean": _round(scores[valid].mean()) if valid.any() else None,
+            "high_ratio": _round((scores[valid] >= HIGH_SCORE_THRESHOLD).mean()) if valid.any() else None,
+            "histogram": _histogram(scores),
+            "human_count": int((~np.isnan(human[m])).sum()),
+            "human_histogram": _histogram(human[m]),
+        }
+
+    # 目標割合の達成度: シナリオごとに重点指標の高スコア発言の割合を求め、生成時の目標割合と比べる
+    if num_rows:
+        focus_codes = np.asarray(corpus.codes("focus_metrics"))
+        focus_labels = corpus.vocabulary("focus_metrics")
+        target_ratio = np.asarray(corpus["target_ratio"])
+        # シナリオごとの値（行はシナリオごとに連続しているため、各シナリオの先頭行の値を使う）
+        first_rows = np.unique(scenario_codes, return_index=True)[1]
+        scenario_focus = np.empty(n_scenarios, dtype=np.int64)
+        scenario_focus[scenario_codes[first_rows]] = focus_codes[first_rows]
+        scenario_target = np.full(n_scenarios, np.nan)
+        scenario_target[scenario_codes[first_rows]] = target_ratio[first_rows]
+
+        for m in metrics:
+            focused = np.array([m in label.split(",") for label in focus_labels], dtype=bool)[scenario_focus]
+            focused &= ~np.isnan(scenario_target)
+            if not focused.any():
+                continue
+            scores = machine[m]
+            valid = ~np.isnan(scores)
+            counts = np.bincount(scenario_codes[valid], minlength=n_scenarios)
+            highs = np.bincount(scenario_codes[valid], weights=(scores[valid] >= HIGH_SCORE_THRESHOLD), minlength=n_scenarios)
+            focused &= counts > 0
+            if not focused.any():
+                continue
+            achieved = highs[focused] / counts[focused]
+            target_percent = scenario_target[focused]
+            target = target_percent / 100
+            result["target_attainment"][m] = {
+                "scenarios": int(focused.sum()),
+                "mean_target_ratio": _round(target.mean()),
+                "mean_high_ratio": _round(achieved.mean()),
+                "mean_gap": _round((achieved - target).mean()),
+                "mean_abs_gap": _round(np.abs(achieved - target).mean()),
+                # 目標割合以上の高スコア発言を含むシナリオの割合
+                "attained_ratio": _round((achieved >= target).mean()),
+                "by_target_ratio": {
+                    str(int(t)): {
+                        "scenarios": int((target_percent == t).sum()),
+                        "mean_high_ratio": _round(achieved[target_percent == t].mean()),
+                    }
+                    for t in np.unique(target_percent)
+                },
+            }
+
+    for key, column in (("by_speaker", "speaker"), ("by_profile", "profile_filename"),
+                        ("by_annotation_model", "annotation_model"), ("by_scenario_model", "scenario_model")):
+        codes = np.asarray(corpus.codes(column))
+        labels = corpus.vocabulary(column)
+        groups: Dict[str, Dict[str, Any]] = {}
+        for m in metrics:
+            for label, stats in _group_stats(codes, labels, machine[m]).items():
+                groups.setdefault(label, {})[m] = stats
+        result[key] = groups
+
+    # モデル間の差: アノテーションモデルごとの平均スコアと全体平均との差
+    for model, model_stats in result["by_annotation_model"].items():
+        for m, stats in model_stats.items():
+            overall = result["metrics"][m]["mean"]
+            stats["drift"] = _round(stats["mean"] - overall) if stats["mean"] is not None and overall is not None else None
+
+    return result
+
+
+class CorpusAnalytics:
+    """データセットを増分更新し、変更があった場合だけ集計し直すクラス"""
+
+    def __init__(self, exporter: CorpusExporter):
+        self.exporter = exporter
+        self._lock = threading.Lock()
+        self._version: Optional[str] = None
+        self._result: Optional[Dict[str, Any]] = None
+
+    def get(self) -> Dict[str, Any]:
+        """最新の集計結果（出力ファイルに変更がなければキャッシュ済みの結果）"""
+        with self._lock:
+            summary = self.exporter.export()
+            corpus = load_corpus(str(self.exporter.corpus_dir))
+            version = corpus.manifest["version"]
+            if self._result is None or version != self._version:
+                self._result = compute_analytics(corpus)
+                self._version = version
+            return {**self._result, "corpus": {"version": version, **summary}}
@@ -0,0 +1,235 @@
+"""
+annotation_csv.py
+人手アノテーション用CSV（GET /api/output/<filename>/csv でダウンロードする `{出力名}_annotation.csv`）を読み書きするモジュール
+
+CSVの形式:
+    Speaker,Content,威圧度,逸脱度,発言無効度,偏り度   （BOM付きUTF-8、1行目がヘッダー、2行目以降が発言順）
+    機械アノテーションを含める場合は `威圧度_機械`・`威圧度_理由` などの参考列が後ろに付く（読み込み時は無視する）
+
+複数シナリオのCSVは、1ファイルずつ作りながら圧縮したZIPとして少しずつ書き出せる（iter_annotation_zip）。
+
+評価者ごとに複製したシート（`{出力名}_annotation_佐藤.csv` など）も `_annotation` より前の部分で出力JSONと対応付ける。
+"""
+import csv
+import io
+import re
+import unicodedata
+import zipfile
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+
+CSV_SUFFIX = "_annotation"
+SPEAKER_COLUMN = "Speaker"
+CONTENT_COLUMN = "Content"
+# 機械アノテーションの参考列（評価者が記入する列ではない）
+MACHINE_SCORE_SUFFIX = "_機械"
+MACHINE_REASON_SUFFIX = "_理由"
+# CSV・ZIPを書き出すときに一度に渡す大きさの目安
+CHUNK_SIZE = 64 * 1024
+
+
+class AnnotationSheet(NamedTuple):
+    """読み込んだ人手アノテーション用CSV"""
+    path: Path
+    speakers: List[str]
+    texts: List[str]
+    scores: Dict[str, np.ndarray]  # 指標名 → 行ごとのスコア（float64、空欄・不正な値はNaN）
+    invalid: List[Dict[str, Any]]  # 数値として読めなかったセル
+
+
+def output_stem(csv_path: Path) -> Optional[str]:
+    """CSVのファイル名から対応する出力JSONのファイル名（拡張子なし）を求める（対応しない名前ならNone）"""
+    stem = Path(csv_path).stem
+    if CSV_SUFFIX not in stem:
+        return None
+    return stem.rsplit(CSV_SUFFIX, 1)[0] or None
+
+
+def find_annotation_csvs(outputs_dir: str) -> List[Path]:
+    """出力ディレクトリ（サブディレクトリを含む）の人手アノテーション用CSVの一覧"""
+    return sorted(
+        path for path in Path(outputs_dir).rglob(f"*{CSV_SUFFIX}*.csv")
+        if not path.name.startswith(".") and output_stem(path)
+    )
+
+
+def _cell(row: List[str], col: int) -> str:
+    return row[col] if col < len(row) else ""
+
+
+def parse_annotation_csv(content: bytes, path: Path = Path("<upload>")) -> AnnotationSheet:
+    """
+    人手アノテーション用CSVを解析する
+
+    Raises:
+        ValueError: ヘッダーにSpeaker・Contentの列がない場合
+    """
+    # Excelで保存し直したシートはBOMなし・CP932のこともある
+    try:
+        text = content.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        text = content.decode("cp932")
+    rows = list(csv.reader(io.StringIO(text)))
+    if not rows:
+        raise ValueError(f"空のCSVです: {path}")
+
+    header = [cell.strip() for cell in rows[0]]
+    if SPEAKER_COLUMN not in header or CONTENT_COLUMN not in header:
+        raise ValueError(f"ヘッダーに {SPEAKER_COLUMN}・{CONTENT_COLUMN} の列がありません: {path}")
+    speaker_col = header.index(SPEAKER_COLUMN)
+    content_col = header.index(CONTENT_COLUMN)
+    metric_cols = [
+        (i, name) for i, name in enumerate(header)
+        if name and i not in (speaker_col, content_col)
+        and not name.endswith((MACHINE_SCORE_SUFFIX, MACHINE_REASON_SUFFIX))
+    ]
+
+    body = [row for row in rows[1:] if any(cell.strip() for cell in row)]
+    scores = {name: np.full(len(body), np.nan) for _, name in metric_cols}
+    invalid = []
+    for line, row in enumerate(body):
+        for col, name in metric_cols:
+            cell = _cell(row, col).strip()
+            if not cell:
+                continue
+            try:
+                scores[name][line] = float(unicodedata.normalize("NFKC", cell))
+            except ValueError:
+                invalid.append({"row": line, "metric": name, "value": cell})
+
+    return AnnotationSheet(
+        path=Path(path),
+        speakers=[_cell(row, speaker_col) for row in body],
+        texts=[_cell(row, content_col) for row in body],
+        scores=scores,
+        invalid=invalid,
+    )
+
+
+def read_annotation_csv(path: Path) -> AnnotationSheet:
+    """人手アノテーション用CSVを読み込む"""
+    with open(path, 'rb') as f:
+        return parse_annotation_csv(f.read(), Path(path))
+
+
+def _normalize(text: str) -> str:
+    # Excelでの保存による全角/半角・改行・空白の違いは無視して比較する
+    return re.sub(r"\s+", "", unicodedata.normalize("NFKC", text or ""))
+
+
+def align_sheet(sheet: AnnotationSheet, texts: List[str]) -> Tuple[np.ndarray, List[Dict[str, Any]]]:
+    """
+    CSVの行を発言番号で出力JSONの発言に対応付け、発言内容が一致するかを確かめる
+
+    Args:
+        sheet: 読み込んだCSV
+        texts: 出力JSONの発言内容（発言順）
+
+    Returns:
+        (使える行のマスク（bool配列、CSVの行数）, 一致しなかった行の一覧)
+    """
+    mismatches = []
+    if len(sheet.texts) != len(texts):
+        mismatches.append({"reason": "row_count", "csv_rows": len(sheet.texts), "utterances": len(texts)})
+
+    usable = np.zeros(len(sheet.texts), dtype=bool)
+    for i, text in enumerate(sheet.texts[:len(texts)]):
+        if _normalize(text) == _normalize(texts[i]):
+            usable[i] = True
+        else:
+            mismatches.append({"reason": "text", "row": i, "csv_text": text[:40], "utterance_text": texts[i][:40]})
+    return usable, mismatches
+
+
+def csv_name(output_name: str) -> str:
+    """出力JSONの名前（相対パス可）に対応するCSVの名前"""
+    return str(Path(output_name).with_suffix("")) + f"{CSV_SUFFIX}.csv"
+
+
+def iter_annotation_csv(
+    scenario: List[Dict[str, Any]],
+    metric_names: List[str],
+    include_machine: bool = False
+) -> Iterator[bytes]:
+    """
+    人手アノテーション用CSVをBOM付きUTF-8のバイト列として少しずつ返す
+
+    Args:
+        scenario: 出力JSONのシナリオ
+        metric_names: 評価者が記入する指標の列（空欄で出力する）
+        include_machine: Trueの場合は機械アノテーションのスコア・理由を参考列として加える
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    header = [SPEAKER_COLUMN, CONTENT_COLUMN, *metric_names]
+    if include_machine:
+        header += [name + suffix for name in metric_names for suffix in (MACHINE_SCORE_SUFFIX, MACHINE_REASON_SUFFIX)]
+    writer.writerow(header)
+
+    first = True
+    for utt in scenario:
+        row = [utt.get("speaker", ""), utt.get("text", ""), *([""] * len(metric_names))]
+        if include_machine:
+            machine = utt.get("machine_annotations") or utt.get("metrics") or {}
+            for name in metric_names:
+                value = machine.get(name) or {}
+                row += [value.get("score", ""), value.get("reason", "")] if isinstance(value, dict) else [value, ""]
+        writer.writerow(row)
+        if buffer.tell() >= CHUNK_SIZE:
+            # Excelで文字化けしないようにBOM付きUTF-8
+            yield buffer.getvalue().encode("utf-8-sig" if first else "utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+            first = False
+    if buffer.tell() or first:
+        yield buffer.getvalue().encode("utf-8-sig" if first else "utf-8")
+
+
+class _ChunkSink(io.RawIOBase):
+    """ZipFileの書き込み先（書き込まれたバイト列を取り出すまで溜めておくだけの、シークできないストリーム）"""
+
+    def __init__(self):
+        super().__init__()
+        self._chunks: List[bytes] = []
+        self._size = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        self._size += len(data)
+        return len(data)
+
+    def pending(self) -> int:
+        return self._size
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        self._size = 0
+        return data
+
+
+def iter_annotation_zip(entries: Iterable[Tuple[str, Callable[[], Iterable[bytes]]]]) -> Iterator[bytes]:
+    """
+    ZIPファイルを少しずつ作って返す（メモリに載るのは作成中のCSVの一部と圧縮途中のデータだけ）
+
+    Args:
+        entries: (ZIP内のファイル名, そのファイルの中身を少しずつ返す関数) の並び。
+                 関数は順番が来たときに呼ぶため、出力JSONの読み込みもその時点まで遅らせられる
+    """
+    sink = _ChunkSink()
+    with zipfile.ZipFile(sink, mode="w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for name, content in entries:
+            with archive.open(name, mode="w", force_zip64=True) as f:
+                for chunk in content():
+                    f.write(chunk)
+                    if sink.pending() >= CHUNK_SIZE:
+                        yield sink.drain()
+            yield sink.drain()
+    # 中央ディレクトリ（ZIPの末尾の目次）
+    yield sink.drain()
@@ -0,0 +1,199 @@
+"""
+annotation_import.py
+記入済みの人手アノテーション用CSVをまとめて出力JSONの human_annotations に取り込むモジュール（CLIとしても実行可能）
+
+- CSVは `{出力名}_annotation*.csv` の名前で出力JSONに対応付け、行を発言番号で発言に対応付ける
+- 発言内容が一致しない行・範囲外のスコアは取り込まずに報告する
+- 出力JSONごとに、そのファイルに対応する全CSVのスコアを1回の書き換え（一時ファイル経由のリネーム）で保存する
+- 既に同じスコアが保存されている発言・指標は書き換えない（同じCSVを何度取り込んでも結果は同じ）
+- 同じ発言・指標を複数のCSV（評価者ごとのシート）が評価している場合は、後に渡したCSVのスコアを保存する
+
+使用例:
+    python annotation_import.py                                   # data/outputs の全CSVを取り込む
+    python annotation_import.py ~/Downloads/*_annotation.csv      # 指定したCSVを取り込む
+    python annotation_import.py --dry-run                         # 保存せずに結果だけ表示
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from dotenv import load_dotenv
+
+from analytics import SCORE_RANGE
+from annotation_csv import AnnotationSheet, align_sheet, find_annotation_csvs, output_stem, read_annotation_csv
+from annotation_store import AnnotationStore, apply_edits
+
+
+def _output_paths(outputs_dir: Path) -> Dict[str, List[Path]]:
+    """出力名（拡張子なし）→ 出力JSONのパス"""
+    paths: Dict[str, List[Path]] = {}
+    for path in sorted(outputs_dir.rglob("*.json")):
+        if not path.name.startswith("."):
+            paths.setdefault(path.stem, []).append(path)
+    return paths
+
+
+def _resolve_output(sheet: AnnotationSheet, outputs: Dict[str, List[Path]]) -> Tuple[Optional[Path], Optional[str]]:
+    """CSVに対応する出力JSON（見つからなければ (None, 理由)）"""
+    stem = output_stem(sheet.path)
+    candidates = outputs.get(stem or "", [])
+    # 出力ディレクトリ内のCSVは同じディレクトリの出力JSONを優先する
+    sibling = sheet.path.with_name(f"{stem}.json").resolve()
+    for path in candidates:
+        if path.resolve() == sibling:
+            return path, None
+    if not candidates:
+        return None, "missing_output"
+    if len(candidates) > 1:
+        return None, "ambiguous_output"
+    return candidates[0], None
+
+
+def import_annotation_sheets(
+    sheets: List[AnnotationSheet],
+    outputs_dir: str,
+    store: Optional[AnnotationStore] = None,
+    metric_names: Optional[List[str]] = None,
+    dry_run: bool = False
+) -> Dict[str, Any]:
+    """
+    記入済みCSVのスコアを対応する出力JSONの human_annotations に保存する
+
+    Args:
+        sheets: 読み込んだCSV
+        outputs_dir: 出力JSONのディレクトリ（サブディレクトリを含む）
+        store: 出力JSONの読み書きに使うAnnotationStore（ファイルごとのロック・未反映の編集ログを扱う）
+        metric_names: 取り込む指標（Noneの場合は metric_annotator.METRIC_NAMES）
+        dry_run: Trueの場合は保存せずに結果だけ返す
+
+    Returns:
+        {"sheets": [CSVごとの結果], "updated_files", "applied", "unchanged", "mismatches", "seconds"}
+    """
+    if metric_names is None:
+        from metric_annotator import METRIC_NAMES
+        metric_names = list(METRIC_NAMES)
+    start = time.perf_counter()
+    store = store or AnnotationStore()
+    outputs_dir = Path(outputs_dir)
+    outputs = _output_paths(outputs_dir)
+    low, high = SCORE_RANGE
+    edited_at = datetime.now().isoformat()
+
+    reports = []
+    by_output: Dict[Path, List[Tuple[AnnotationSheet, Dict[str, Any]]]] = {}
+    for sheet in sheets:
+        report = {"csv": sheet.path.name, "output": None, "applied": 0, "unchanged": 0, "superseded": 0, "mismatches": []}
+        reports.append(report)
+        path, reason = _resolve_output(sheet, outputs)
+        if path is None:
+            report["mismatches"].append({"reason": reason})
+            continue
+        report["output"] = path.relative_to(outputs_dir).as_posix()
+        report["mismatches"] += [
+            {"reason": "unknown_metric", "metric": name} for name in sheet.scores if name not in metric_names
+        ]
+        report["mismatches"] += [
+            {"reason": "invalid_score", **cell} for cell in sheet.invalid if cell["metric"] in metric_names
+        ]
+        by_output.setdefault(path, []).append((sheet, report))
+
+    def apply(entries: List[Tuple[AnnotationSheet, Dict[str, Any]]]):
+        def func(data: Dict[str, Any]) -> bool:
+            scenario = data.get("scenario", [])
+            texts = [utt.get("text", "") if isinstance(utt, dict) else "" for utt in scenario]
+            # 同じ発言・指標を複数のCSVが評価している場合は後に渡したCSVのスコアを使う
+            latest: Dict[Tuple[int, str], Tuple[int, Dict[str, Any]]] = {}
+            for sheet, report in entries:
+                usable, mismatches = align_sheet(sheet, texts)
+                report["mismatches"] += mismatches
+                for metric, scores in sheet.scores.items():
+                    if metric not in metric_names:
+                        continue
+                    for turn in np.flatnonzero(usable & ~np.isnan(scores)):
+                        score = scores[turn]
+                        if score != int(score) or not low <= score <= high:
+                            report["mismatches"].append(
+                                {"reason": "out_of_range", "row": int(turn), "metric": metric, "value": float(score)}
+                            )
+                            continue
+                        previous = latest.get((int(turn), metric))
+                        if previous is not None:
+                            previous[1]["superseded"] += 1
+                        latest[(int(turn), metric)] = (int(score), report)
+
+            edits = []
+            for (turn, metric), (score, report) in latest.items():
+                saved = (scenario[turn].get("human_annotations") or {}).get(metric)
+                if isinstance(saved, dict) and saved.get("score") == score:
+                    report["unchanged"] += 1
+                    continue
+                edits.append({"utterance": turn, "metric": metric, "score": score, "note": "", "edited_at": edited_at})
+                report["applied"] += 1
+            if not edits or dry_run:
+                return False
+            apply_edits(data, edits)
+            return True
+        return func
+
+    updated = []
+    for path, entries in by_output.items():
+        try:
+            store.update(path, apply(entries))
+        except (OSError, ValueError) as e:
+            for _, report in entries:
+                report["applied"] = report["unchanged"] = report["superseded"] = 0
+                report["mismatches"].append({"reason": "unreadable_output", "error": str(e)})
+            continue
+        if not dry_run and any(report["applied"] for _, report in entries):
+            updated.append(path)
+
+    return {
+        "sheets": reports,
+        "updated_files": [path.relative_to(outputs_dir).as_posix() for path in updated],
+        "applied": sum(report["applied"] for report in reports),
+        "unchanged": sum(report["unchanged"] for report in reports),
+        "mismatches": sum(len(report["mismatches"]) for report in reports),
+        "seconds": round(time.perf_counter() - start, 3),
+    }
+
+
+def main(argv: List[str] = None) -> int:
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description="記入済みの人手アノテーション用CSVを出力JSONに取り込む")
+    parser.add_argument("files", nargs="*", help="CSVファイル（省略時は出力ディレクトリの *_annotation*.csv）")
+    parser.add_argument("--outputs-dir", default=os.getenv("OUTPUTS_DIR", "data/outputs"), help="出力JSONのディレクトリ")
+    parser.add_argument("--dry-run", action="store_true", help="保存せずに結果だけ表示する")
+    args = parser.parse_args(argv)
+
+    paths = [Path(f) for f in args.files] or find_annotation_csvs(args.outputs_dir)
+    sheets = []
+    for path in paths:
+        try:
+            sheets.append(read_annotation_csv(path))
+        except (OSError, ValueError) as e:
+            print(f"失敗: {path}: {e}")
+
+    result = import_annotation_sheets(sheets, args.outputs_dir, dry_run=args.dry_run)
+    for report in result["sheets"]:
+        print(
+            f"{report['csv']} → {report['output'] or '-'}: {report['applied']}件を取り込み"
+            f"（変更なし{report['unchanged']}件・後のCSVで上書き{report['superseded']}件）"
+        )
+        for mismatch in report["mismatches"]:
+            print(f"  警告: {mismatch}")
+    print(
+        f"{len(result['updated_files'])}ファイルを更新しました"
+        f"（取り込み{result['applied']}件・変更なし{result['unchanged']}件・不一致{result['mismatches']}件、{result['seconds']}秒）"
+        + ("（--dry-run のため保存していません）" if args.dry_run else "")
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
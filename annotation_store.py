@@ -0,0 +1,263 @@
+"""
+annotation_store.py
+人手アノテーションの保存を、出力JSONの全体書き換えではなく追記型の編集ログで行うモジュール
+
+- 保存時は編集（発言番号・指標・スコア・メモ・日時）を編集ログ（.{ファイル名}.edits.jsonl）に追記するだけ
+- 編集ログが一定件数たまったら、出力JSONに反映して一時ファイル経由で書き換え、ログを空にする（コンパクション）
+- 読み込み時は出力JSONに未反映の編集ログを重ねて返す
+- 同じファイルへの読み書きはファイルごとのロック（プロセス間はファイルごとのロックファイル .{ファイル名}.lock）で直列化する。
+  別のファイルの読み書きは互いに待たない。ロックは同じスレッドから入れ子で取得できる
+"""
+import json
+import os
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Tuple
+
+from output_store import read_json, write_json_atomic
+
+try:
+    import fcntl
+except ImportError:  # Windowsではプロセス間ロックなし（同一プロセス内のロックのみ）
+    fcntl = None
+
+
+# 編集ログをコンパクションする件数の既定値
+DEFAULT_COMPACT_EVERY = 200
+
+
+class _FileLock:
+    """1ファイル分のロック（スレッド間はRLock、プロセス間はロックファイルのflock。入れ子の深さを数える）"""
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.depth = 0
+        self.file = None
+
+
+# ファイルごとのロック（AnnotationStoreのインスタンス間で共有する）
+_locks: Dict[str, _FileLock] = {}
+_locks_guard = threading.Lock()
+
+
+def edit_log_path(path: Path) -> Path:
+    """出力JSONに対応する編集ログのパス"""
+    path = Path(path)
+    return path.with_name(f".{path.name}.edits.jsonl")
+
+
+def lock_path(path: Path) -> Path:
+    """出力JSONに対応するプロセス間ロックファイルのパス"""
+    path = Path(path)
+    return path.with_name(f".{path.name}.lock")
+
+
+@contextmanager
+def file_lock(path: Path) -> Iterator[None]:
+    """
+    出力JSONと編集ログの読み書きを直列化するロック
+
+    同じスレッドでロック中に再び取得した場合（update の func から load を呼ぶなど）は、
+    ロックファイルを開き直さずにそのまま通す（最も外側のロックを抜けるときに解放する）。
+    """
+    path = Path(path).resolve()
+    with _locks_guard:
+        entry = _locks.setdefault(str(path), _FileLock())
+
+    with entry.lock:
+        if entry.depth == 0 and fcntl is not None:
+            entry.file = open(lock_path(path), 'a')
+            try:
+                fcntl.flock(entry.file, fcntl.LOCK_EX)
+            except OSError:
+                entry.file.close()
+                entry.file = None
+                raise
+        entry.depth += 1
+        try:
+            yield
+        finally:
+            entry.depth -= 1
+            if entry.depth == 0 and entry.file is not None:
+                fcntl.flock(entry.file, fcntl.LOCK_UN)
+                entry.file.close()
+                entry.file = None
+
+
+def apply_edits(data: Dict[str, Any], edits: List[Dict[str, Any]]) -> None:
+    """編集ログの内容を出力JSONに反映する（同じ編集を何度反映しても結果は同じ）"""
+    scenario = data.get("scenario", [])
+    metadata = data.setdefault("metadata", {})
+
+    for edit in edits:
+        index = edit["utterance"]
+        if index < 0 or index >= len(scenario):
+            continue
+        utterance = scenario[index]
+
+        # 初回の場合、metricsをmachine_annotationsにリネーム
+        if "metrics" in utterance and "machine_annotations" not in utterance:
+            utterance["machine_annotations"] = utterance.pop("metrics")
+
+        utterance.setdefault("human_annotations", {})[edit["metric"]] = {
+            "score": edit.get("score"),
+            "edited_at": edit["edited_at"],
+            "note": edit.get("note", "")
+        }
+        metadata["last_human_annotation"] = edit["edited_at"]
+
+
+class AnnotationStore:
+    """人手アノテーションを編集ログ経由で保存・読み込みするクラス"""
+
+    def __init__(self, compact_every: int = DEFAULT_COMPACT_EVERY):
+        """
+        Args:
+            compact_every: 編集ログがこの件数以上になったら出力JSONに反映する（0以下で毎回反映）
+        """
+        self.compact_every = compact_every
+        self._lengths: Dict[str, Tuple[Tuple[float, int], int]] = {}
+        self._pending: Dict[str, int] = {}
+
+    def save_human_annotations(self, path: Path, annotations: Dict[str, Dict[str, Dict[str, Any]]]) -> int:
+        """
+        人手アノテーションを編集ログに追記する
+
+        Args:
+            path: 出力JSONのパス
+            annotations: {"発言番号": {"指標名": {"score": 5, "note": "..."}}}（範囲外の発言番号は無視）
+
+        Returns:
+            記録した編集数
+        """
+        path = Path(path)
+        edited_at = datetime.now().isoformat()
+
+        with file_lock(path):
+            num_utterances = self._scenario_length(path)
+            edits = []
+            for utterance_idx_str, metric_annotations in annotations.items():
+                utterance_idx = int(utterance_idx_str)
+                if utterance_idx < 0 or utterance_idx >= num_utterances:
+                    continue
+                for metric_name, metric_data in metric_annotations.items():
+                    edits.append({
+                        "utterance": utterance_idx,
+                        "metric": metric_name,
+                        "score": metric_data.get("score"),
+                        "note": metric_data.get("note", ""),
+                        "edited_at": edited_at
+                    })
+
+            if not edits:
+                return 0
+
+            pending = self._pending_count(path)
+            with open(edit_log_path(path), 'ab+') as f:
+                # 追記中に中断された行があれば、その後ろに続けて書かないよう改行する
+                if f.seek(0, os.SEEK_END) and (f.seek(-1, os.SEEK_END), f.read(1))[1] != b"\n":
+                    f.write(b"\n")
+                f.write("".join(json.dumps(edit, ensure_ascii=False) + "\n" for edit in edits).encode("utf-8"))
+                f.flush()
+                os.fsync(f.fileno())
+            self._pending[str(path)] = pending + len(edits)
+
+            if self._pending[str(path)] >= self.compact_every:
+                self._compact_locked(path)
+
+        return len(edits)
+
+    def load(self, path: Path) -> Dict[str, Any]:
+        """出力JSONに未反映の編集ログを重ねて読み込む"""
+        path = Path(path)
+        with file_lock(path):
+            data = read_json(path)
+            apply_edits(data, self._read_edits(path))
+        return data
+
+    def update(self, path: Path, func: Callable[[Dict[str, Any]], None]) -> Dict[str, Any]:
+        """
+        最新の内容（編集ログ反映済み）を func で書き換えて保存する（編集ログはこの時点でコンパクションされる）
+
+        再アノテーションのように時間のかかる処理は、ロックの外で結果を用意してから呼び出すこと。
+        func が False を返した場合は何も保存しない。
+        """
+        path = Path(path)
+        with file_lock(path):
+            data = read_json(path)
+            apply_edits(data, self._read_edits(path))
+            if func(data) is False:
+                return data
+            write_json_atomic(path, data)
+            self._clear_edits(path)
+        return data
+
+    def compact(self, path: Path) -> int:
+        """
+        編集ログを出力JSONに反映する
+
+        Returns:
+            反映した編集数
+        """
+        path = Path(path)
+        with file_lock(path):
+            return self._compact_locked(path)
+
+    def pending_edits(self, path: Path) -> int:
+        """出力JSONに未反映の編集数"""
+        path = Path(path)
+        with file_lock(path):
+            return len(self._read_edits(path))
+
+    def _compact_locked(self, path: Path) -> int:
+        edits = self._read_edits(path)
+        if not edits:
+            return 0
+        data = read_json(path)
+        apply_edits(data, edits)
+        # 出力JSONを書き換えてからログを消す（間で中断しても、次回同じ編集を再度反映するだけで済む）
+        write_json_atomic(path, data)
+        self._clear_edits(path)
+        return len(edits)
+
+    def _read_edits(self, path: Path) -> List[Dict[str, Any]]:
+        log_path = edit_log_path(path)
+        if not log_path.exists():
+            return []
+
+        edits = []
+        with open(log_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    edits.append(json.loads(line))
+                except json.JSONDecodeError:
+                    # 追記中に中断された行は無視する
+                    print(f"警告: 編集ログの壊れた行をスキップしました: {log_path}")
+        return edits
+
+    def _pending_count(self, path: Path) -> int:
+        """未反映の編集数（初回だけ編集ログを読み、以降は追記した件数を数える）"""
+        if str(path) not in self._pending:
+            self._pending[str(path)] = len(self._read_edits(path))
+        return self._pending[str(path)]
+
+    def _clear_edits(self, path: Path) -> None:
+        log_path = edit_log_path(path)
+        if log_path.exists():
+            log_path.unlink()
+        self._pending[str(path)] = 0
+
+    def _scenario_length(self, path: Path) -> int:
+        """発言数（ファイルが変わっていなければ前回読み込んだ値を使う）"""
+        stat = path.stat()
+        signature = (stat.st_mtime, stat.st_size)
+        cached = self._lengths.get(str(path))
+        if cached and cached[0] == signature:
+            return cached[1]
+        length = len(read_json(path).get("scenario", []))
+        self._lengths[str(path)] = (signature, length)
+        return length
@@ -2,18 +2,35 @@
 app.py
 Well-Scenario システムのメインFlaskアプリケーション
 """
-from flask import Flask, render_template, request, jsonify, send_file
+from flask import Flask, render_template, request, jsonify, send_file, Response, stream_with_context, g
 from flask_cors import CORS
 from dotenv import load_dotenv
 import os
 import json
-from pathlib import Path
 from datetime import datetime
-import csv
-import io
+from pathlib import Path
+import time
+from urllib.parse import quote
 
+import telemetry
+from agreement import AgreementEngine
+from analytics import CorpusAnalytics
 from scenario_generator import ScenarioGenerator
-from metric_annotator import MetricAnnotator
+from metric_annotator import METRIC_NAMES, MetricAnnotator
+from llm_cache import LLMCache
+from llm_client import LLMClient
+from local_annotator import load_local_annotator
+from annotation_csv import csv_name, iter_annotation_csv, iter_annotation_zip, parse_annotation_csv
+from annotation_import import import_annotation_sheets
+from annotation_store import AnnotationStore
+from config_cache import ConfigCache
+from best_of_n import CandidateSelector
+from corpus_export import CorpusExporter
+from generation_pipeline import generate_and_annotate, iter_generate_and_annotate
+from job_manager import Job, JobManager
+from output_index import OutputIndex
+from output_store import build_output_data, new_output_path, write_json_atomic
+from reannotate import MODES as REANNOTATE_MODES, reannotate_output
 
 # 環境変数の読み込み
 load_dotenv()
@@ -29,15 +46,142 @@ ANNOTATION_MODEL = os.getenv("ANNOTATION_MODEL_NAME") or os.getenv("OPENAI_MODEL
 EXTRA_JSON_PATH = os.getenv("EXTRA_JSON_PATH", "data/extra.json")
 PROFILES_DIR = os.getenv("PROFILES_DIR", "data/profiles")
 OUTPUTS_DIR = os.getenv("OUTPUTS_DIR", "data/outputs")
+OUTPUT_INDEX_PATH = os.getenv("OUTPUT_INDEX_PATH", "data/output_index.sqlite3")
+# 出力ディレクトリの変更（他のプロセスによる追加・変更・削除）をバックグラウンドで確認する間隔（秒）
+OUTPUT_INDEX_REFRESH_INTERVAL = float(os.getenv("OUTPUT_INDEX_REFRESH_INTERVAL", "10"))
+# 集計用の列指向データセット（corpus_export.py）の保存先
+CORPUS_DIR = os.getenv("CORPUS_DIR", "data/corpus")
 # サニタイズモード: "true", "1", "yes" で有効、それ以外で無効
 SANITIZE_MODE = os.getenv("SANITIZE_MODE", "true").lower() in ("true", "1", "yes")
+# アノテーションの同時実行数（1の場合は逐次実行）
+ANNOTATION_CONCURRENCY = int(os.getenv("ANNOTATION_CONCURRENCY", "8"))
+# 1回のLLM呼び出しでまとめて評価する発言数（1の場合は発言ごとに評価）
+ANNOTATION_BATCH_SIZE = int(os.getenv("ANNOTATION_BATCH_SIZE", "1"))
+# カスケード評価: 先に全発言を評価する安価なモデル（空の場合は無効）と、その評価回数
+ANNOTATION_CASCADE_MODEL = os.getenv("ANNOTATION_CASCADE_MODEL", "")
+ANNOTATION_CASCADE_SAMPLES = int(os.getenv("ANNOTATION_CASCADE_SAMPLES", "1"))
+# ローカル評価モデル（local_annotator.py train で作成）と、API障害で評価できなかった発言をそれで埋めるかどうか
+LOCAL_ANNOTATOR_PATH = os.getenv("LOCAL_ANNOTATOR_PATH", "data/local_annotator.npz")
+LOCAL_ANNOTATOR_FALLBACK = os.getenv("LOCAL_ANNOTATOR_FALLBACK", "false").lower() in ("true", "1", "yes")
+# 発言数がこれを超える会議は、この発言数程度の部分に分けて生成する（0の場合は常に1回で生成、デフォルト）
+GENERATION_SEGMENT_SIZE = int(os.getenv("GENERATION_SEGMENT_SIZE", "0"))
+# シナリオ生成の応答をストリーミングで受け取り、発言が1つ届くごとにアノテーションを始める（デフォルトは無効）
+GENERATION_STREAM = os.getenv("GENERATION_STREAM", "false").lower() in ("true", "1", "yes")
+# 重点指標を指定した生成で並行して生成する候補数（1の場合は候補を選ばずに1回だけ生成）
+BEST_OF_N_CANDIDATES = int(os.getenv("BEST_OF_N_CANDIDATES", "1"))
+# 高スコア発言の割合と目標割合の差（%ポイント）がこれ以内の候補が見つかったら、残りの候補の生成を打ち切る
+BEST_OF_N_TOLERANCE = float(os.getenv("BEST_OF_N_TOLERANCE", "10"))
+# 候補の代理評価に使う安価なモデルと、候補ごとに代理評価する発言数（0の場合は全発言）
+BEST_OF_N_PROXY_MODEL = os.getenv("BEST_OF_N_PROXY_MODEL", "gpt-4o-mini")
+BEST_OF_N_SAMPLE_SIZE = int(os.getenv("BEST_OF_N_SAMPLE_SIZE", "12"))
+# 重点指標を指定した生成では重点指標だけを評価する（残りの指標は reannotate.py の missing モードで後から評価）
+ANNOTATE_FOCUS_ONLY = os.getenv("ANNOTATE_FOCUS_ONLY", "false").lower() in ("true", "1", "yes")
+# 1リクエストで指定できる候補数の上限
+MAX_CANDIDATES = 8
+# LLM応答キャッシュ: 同一リクエスト（モデル・メッセージ・temperature・response_format）の応答を再利用
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "true").lower() in ("true", "1", "yes")
+LLM_CACHE_DIR = os.getenv("LLM_CACHE_DIR", "data/cache")
+LLM_CACHE_TTL_HOURS = float(os.getenv("LLM_CACHE_TTL_HOURS", "168"))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "20000"))
+# シナリオ生成の応答もキャッシュするか（既定では評価だけをキャッシュし、生成は毎回新しいシナリオを返す）
+LLM_CACHE_GENERATION = os.getenv("LLM_CACHE_GENERATION", "false").lower() in ("true", "1", "yes")
+# OpenAI APIのリクエスト数/分・トークン数/分の上限（生成・アノテーション合計、0で無制限）
+OPENAI_RPM_LIMIT = float(os.getenv("OPENAI_RPM_LIMIT", "0"))
+OPENAI_TPM_LIMIT = float(os.getenv("OPENAI_TPM_LIMIT", "0"))
+# 429・タイムアウト・5xxエラーの最大再試行回数
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "5"))
+# バックグラウンドで同時に実行するシナリオ生成ジョブ数
+MAX_CONCURRENT_JOBS = int(os.getenv("MAX_CONCURRENT_JOBS", "2"))
+# 人手アノテーションの編集ログを出力JSONに反映する件数
+ANNOTATION_LOG_COMPACT_EVERY = int(os.getenv("ANNOTATION_LOG_COMPACT_EVERY", "200"))
 
 # 出力ディレクトリの作成
 Path(OUTPUTS_DIR).mkdir(parents=True, exist_ok=True)
 
 # モジュール初期化
-generator = ScenarioGenerator(OPENAI_API_KEY, SCENARIO_MODEL, sanitize_mode=SANITIZE_MODE, extra_json_path=EXTRA_JSON_PATH)
-annotator = MetricAnnotator(OPENAI_API_KEY, ANNOTATION_MODEL, EXTRA_JSON_PATH)
+llm_cache = LLMCache(
+    LLM_CACHE_DIR,
+    ttl_seconds=LLM_CACHE_TTL_HOURS * 3600,
+    max_entries=LLM_CACHE_MAX_ENTRIES
+) if LLM_CACHE_ENABLED else None
+# 指標定義・プロフィールの解析結果は生成・アノテーション・APIで共有し、ファイルが更新されたら読み直す
+config_cache = ConfigCache()
+# 生成とアノテーションで1つのクライアント（キャッシュ・レート制限）を共有する
+llm_client = LLMClient(
+    OPENAI_API_KEY,
+    cache=llm_cache,
+    rpm_limit=OPENAI_RPM_LIMIT,
+    tpm_limit=OPENAI_TPM_LIMIT,
+    max_retries=OPENAI_MAX_RETRIES
+)
+# モデルファイルがない場合はNone（起動後に学習した場合は再起動で読み込む）
+local_annotator = load_local_annotator(LOCAL_ANNOTATOR_PATH)
+generator = ScenarioGenerator(
+    OPENAI_API_KEY,
+    SCENARIO_MODEL,
+    sanitize_mode=SANITIZE_MODE,
+    extra_json_path=EXTRA_JSON_PATH,
+    llm_client=llm_client,
+    config_cache=config_cache,
+    segment_size=GENERATION_SEGMENT_SIZE,
+    stream=GENERATION_STREAM,
+    cache_responses=LLM_CACHE_GENERATION
+)
+annotator = MetricAnnotator(
+    OPENAI_API_KEY,
+    ANNOTATION_MODEL,
+    EXTRA_JSON_PATH,
+    max_workers=ANNOTATION_CONCURRENCY,
+    batch_size=ANNOTATION_BATCH_SIZE,
+    llm_client=llm_client,
+    config_cache=config_cache,
+    cascade_model=ANNOTATION_CASCADE_MODEL or None,
+    cascade_samples=ANNOTATION_CASCADE_SAMPLES,
+    fallback=local_annotator if LOCAL_ANNOTATOR_FALLBACK else None
+)
+# 候補の代理評価用（アノテーションと同じ指標定義で、安価なモデルを使う）
+proxy_annotator = MetricAnnotator(
+    OPENAI_API_KEY,
+    BEST_OF_N_PROXY_MODEL,
+    EXTRA_JSON_PATH,
+    max_workers=ANNOTATION_CONCURRENCY,
+    batch_size=ANNOTATION_BATCH_SIZE,
+    llm_client=llm_client,
+    config_cache=config_cache
+)
+job_manager = JobManager(max_workers=MAX_CONCURRENT_JOBS)
+output_index = OutputIndex(OUTPUTS_DIR, OUTPUT_INDEX_PATH, refresh_interval=OUTPUT_INDEX_REFRESH_INTERVAL)
+# ディスク全体の走査は一覧の取得時ではなくバックグラウンドで行う
+output_index.start_background_refresh()
+annotation_store = AnnotationStore(compact_every=ANNOTATION_LOG_COMPACT_EVERY)
+corpus_exporter = CorpusExporter(OUTPUTS_DIR, CORPUS_DIR, store=annotation_store)
+corpus_analytics = CorpusAnalytics(corpus_exporter)
+agreement_engine = AgreementEngine(corpus_exporter)
+
+
+@app.before_request
+def _start_request_timer():
+    g.request_started = time.perf_counter()
+
+
+@app.after_request
+def _record_request_time(response):
+    """HTTPリクエストの処理時間を記録（ストリーミング応答は応答開始までの時間）"""
+    started = g.pop('request_started', None)
+    if started is not None:
+        telemetry.HTTP_SECONDS.observe(
+            time.perf_counter() - started,
+            method=request.method,
+            endpoint=request.endpoint or "unknown",
+            status=response.status_code
+        )
+    return response
+
+
+@app.route('/metrics', methods=['GET'])
+def get_prometheus_metrics():
+    """LLM呼び出し・ファイル入出力・HTTPリクエストの計測値（Prometheusのテキスト形式）"""
+    return Response(telemetry.REGISTRY.render(), mimetype='text/plain; version=0.0.4')
 
 
 @app.route('/')
@@ -46,6 +190,19 @@ def index():
     return render_template('index.html')
 
 
+def _conditional_json_response(entry, key: str):
+    """
+    設定ファイルの内容を {key: 内容} として返す
+
+    ETagを付け、If-None-Matchが一致する場合は本文なしの304を返す
+    （ブラウザは毎回再検証するが、変更がなければ本文を転送しない）
+    """
+    response = jsonify({key: entry.data})
+    response.set_etag(entry.etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
+
+
 @app.route('/api/profiles', methods=['GET'])
 def get_profiles():
     """利用可能なプロフィールファイル一覧を取得"""
@@ -74,9 +231,7 @@ def get_profile_content(filename):
         return jsonify({"error": "プロフィールファイルが見つかりません"}), 404
     
     try:
-        with open(profile_path, 'r', encoding='utf-8') as f:
-            profile_data = json.load(f)
-        return jsonify({"profile": profile_data})
+        return _conditional_json_response(config_cache.get(str(profile_path)), "profile")
     except Exception as e:
         return jsonify({"error": f"プロフィールの読み込みに失敗しました: {str(e)}"}), 500
 
@@ -85,99 +240,221 @@ def get_profile_content(filename):
 def get_metrics():
     """指標定義を取得"""
     try:
-        with open(EXTRA_JSON_PATH, 'r', encoding='utf-8') as f:
-            metrics_data = json.load(f)
-        return jsonify({"metrics": metrics_data})
+        return _conditional_json_response(config_cache.get(EXTRA_JSON_PATH), "metrics")
     except Exception as e:
         return jsonify({"error": f"指標定義の読み込みに失敗しました: {str(e)}"}), 500
 
 
-@app.route('/api/generate-scenario', methods=['POST'])
-def generate_scenario():
-    """シナリオを生成してアノテーション"""
+@app.route('/api/cache', methods=['GET'])
+def get_cache_stats():
+    """LLM応答キャッシュの統計情報を取得"""
+    if llm_cache is None:
+        return jsonify({"enabled": False})
+    return jsonify({"enabled": True, **llm_cache.stats()})
+
+
+@app.route('/api/analytics', methods=['GET'])
+def get_analytics():
+    """保存済みシナリオ全体の集計（スコア分布・目標割合の達成度・発言者/プロフィール/モデル別平均）を取得"""
     try:
-        data = request.json
-        
-        # パラメータ取得
-        meeting_purpose = data.get('meeting_purpose', '')
-        meeting_format = data.get('meeting_format', '')
-        profile_filename = data.get('profile_filename', '')
-        num_utterances = data.get('num_utterances', 20)
-        focus_metrics = data.get('focus_metrics', [])  # 重点指標
-        target_ratio = data.get('target_ratio', 50)  # 目標割合（デフォルト50%）
-        
-        if not meeting_purpose or not meeting_format:
-            return jsonify({"error": "会議の目的と形式を入力してください"}), 400
-        
-        # プロフィール読み込み
-        if profile_filename:
-            profile_path = Path(PROFILES_DIR) / profile_filename
-        else:
-            return jsonify({"error": "プロフィールファイルを選択してください"}), 400
-        
-        if not profile_path.exists():
-            return jsonify({"error": "プロフィールファイルが見つかりません"}), 404
+        return jsonify(corpus_analytics.get())
+    except Exception as e:
+        return jsonify({"error": f"集計に失敗しました: {str(e)}"}), 500
+
+
+@app.route('/api/agreement', methods=['GET'])
+def get_agreement():
+    """人手アノテーションと機械アノテーションの一致度（指標・アノテーションモデル・プロフィールごと）を取得"""
+    include_csv = request.args.get('csv', 'true').lower() in ('true', '1', 'yes')
+    try:
+        return jsonify(agreement_engine.get(include_csv=include_csv))
+    except Exception as e:
+        return jsonify({"error": f"一致度の計算に失敗しました: {str(e)}"}), 500
+
+
+@app.route('/api/usage', methods=['GET'])
+def get_usage_stats():
+    """OpenAI APIのトークン使用量（プロンプトキャッシュが効いた割合を含む）を取得"""
+    return jsonify(llm_client.usage_stats())
+
+
+def _parse_generation_request(data: dict):
+    """
+    シナリオ生成リクエストのパラメータを検証
+    
+    Returns:
+        (パラメータ辞書, None) または (None, エラーレスポンス)
+    """
+    data = data or {}
+    
+    # パラメータ取得
+    params = {
+        "meeting_purpose": data.get('meeting_purpose', ''),
+        "meeting_format": data.get('meeting_format', ''),
+        "profile_filename": data.get('profile_filename', ''),
+        "num_utterances": data.get('num_utterances', 20),
+        "focus_metrics": data.get('focus_metrics', []),  # 重点指標
+        "target_ratio": data.get('target_ratio', 50),  # 目標割合（デフォルト50%）
+        "candidates": data.get('candidates') or BEST_OF_N_CANDIDATES,  # 並行して生成する候補数
+        "focus_only": data.get('focus_only', ANNOTATE_FOCUS_ONLY)  # 重点指標だけを評価する
+    }
+    
+    if not params["meeting_purpose"] or not params["meeting_format"]:
+        return None, (jsonify({"error": "会議の目的と形式を入力してください"}), 400)
+    
+    if not params["profile_filename"]:
+        return None, (jsonify({"error": "プロフィールファイルを選択してください"}), 400)
+    
+    if not (Path(PROFILES_DIR) / params["profile_filename"]).exists():
+        return None, (jsonify({"error": "プロフィールファイルが見つかりません"}), 404)
+    
+    if not isinstance(params["candidates"], int) or not 1 <= params["candidates"] <= MAX_CANDIDATES:
+        return None, (jsonify({"error": f"候補数は1〜{MAX_CANDIDATES}の整数で指定してください"}), 400)
+    
+    if not isinstance(params["focus_only"], bool):
+        return None, (jsonify({"error": "focus_only は true または false で指定してください"}), 400)
+    
+    if params["focus_only"] and any(name not in METRIC_NAMES for name in params["focus_metrics"] or []):
+        return None, (jsonify({"error": f"重点指標は {', '.join(METRIC_NAMES)} から選んでください"}), 400)
+    
+    return params, None
+
+
+def _generation_args(params: dict) -> dict:
+    """検証済みパラメータから、生成とアノテーション（generation_pipeline）の引数を作成"""
+    meeting_purpose = params["meeting_purpose"]
+    meeting_format = params["meeting_format"]
+    focus_metrics = params["focus_metrics"]
+    target_ratio = params["target_ratio"]
+    
+    # プロフィール読み込み
+    profiles = generator.load_profiles(str(Path(PROFILES_DIR) / params["profile_filename"]))
+    
+    print(f"シナリオ生成中: 目的={meeting_purpose}, 形式={meeting_format}, 重点指標={focus_metrics or '全て'}, 目標割合={target_ratio}%")
+    if generator.is_segmented(params["num_utterances"]):
+        print(f"  {GENERATION_SEGMENT_SIZE}発言程度ずつ分割して生成し、生成できた部分から順にアノテーションします")
+    selector = None
+    if _annotation_metrics(params):
+        print(f"  重点指標（{', '.join(focus_metrics)}）だけを評価します（残りの指標は再アノテーションで後から評価できます）")
+    if focus_metrics and params["candidates"] > 1:
+        print(f"  {params['candidates']}個の候補を並行して生成し、目標割合に最も近い候補だけをアノテーションします")
+        selector = CandidateSelector(
+            generator, proxy_annotator, params["candidates"],
+            tolerance=BEST_OF_N_TOLERANCE, sample_size=BEST_OF_N_SAMPLE_SIZE
+        )
+    return {
+        "generator": generator,
+        "annotator": annotator,
+        "profiles": profiles,
+        "meeting_purpose": meeting_purpose,
+        "meeting_format": meeting_format,
+        "num_utterances": params["num_utterances"],
+        "focus_metrics": focus_metrics if focus_metrics else None,
+        "target_ratio": target_ratio,
+        "selector": selector,
+        "annotation_metrics": _annotation_metrics(params)
+    }
+
+
+def _annotation_metrics(params: dict):
+    """評価する指標（重点指標だけを評価する場合は重点指標、全指標を評価する場合はNone）"""
+    if params["focus_only"] and params["focus_metrics"]:
+        return list(params["focus_metrics"])
+    return None
+
+
+def _save_output(params: dict, annotated_scenario: list, trace_summary: dict = None, selection: dict = None) -> Path:
+    """アノテーション済みシナリオを出力ディレクトリに保存し、保存先パスを返す"""
+    output_path = new_output_path(OUTPUTS_DIR, params["profile_filename"])
+    output_data = build_output_data(
+        annotated_scenario,
+        meeting_purpose=params["meeting_purpose"],
+        meeting_format=params["meeting_format"],
+        profile_filename=params["profile_filename"],
+        focus_metrics=params["focus_metrics"],
+        target_ratio=params["target_ratio"],
+        scenario_model=SCENARIO_MODEL,
+        annotation_model=ANNOTATION_MODEL,
+        sanitize_mode=SANITIZE_MODE,
+        trace_summary=trace_summary,
+        selection=selection,
+        cascade_model=annotator.cascade_model,
+        annotation_metrics=_annotation_metrics(params)
+    )
+    
+    write_json_atomic(output_path, output_data)
+    output_index.upsert(output_path)
+    
+    print(f"シナリオ保存完了: {output_path}")
+    return output_path
+
+
+def _response_metadata(params: dict, num_utterances: int, output_path: Path = None) -> dict:
+    """APIレスポンス用のメタデータを作成"""
+    metadata = {
+        "meeting_purpose": params["meeting_purpose"],
+        "meeting_format": params["meeting_format"],
+        "num_utterances": num_utterances,
+        "profile_filename": params["profile_filename"]
+    }
+    if _annotation_metrics(params):
+        # 評価しない指標はグラフで未評価として表示する
+        metadata["annotation_metrics"] = _annotation_metrics(params)
+    if output_path is not None:
+        metadata["saved_to"] = str(output_path)
+    return metadata
+
+
+def _run_generation(params: dict, job: Job = None) -> dict:
+    """
+    シナリオ生成→アノテーション→保存を実行
+    
+    Args:
+        params: _parse_generation_request で検証済みのパラメータ
+        job: バックグラウンド実行時のJob（進捗の記録に使用）
         
-        profiles = generator.load_profiles(str(profile_path))
+    Returns:
+        APIレスポンス用の辞書
+    """
+    with telemetry.trace() as trace:
+        if job:
+            job.set_stage("generating")
         
-        # シナリオ生成
-        print(f"シナリオ生成中: 目的={meeting_purpose}, 形式={meeting_format}, 重点指標={focus_metrics or '全て'}, 目標割合={target_ratio}%")
-        scenario = generator.generate_scenario(
-            profiles=profiles,
-            meeting_purpose=meeting_purpose,
-            meeting_format=meeting_format,
-            num_utterances=num_utterances,
-            focus_metrics=focus_metrics if focus_metrics else None,
-            target_ratio=target_ratio
-        )
+        def on_progress(annotated: int, total: int) -> None:
+            # 分割生成では、最初の部分の生成後は残りの生成とアノテーションが並行して進む
+            job.set_stage("annotating")
+            job.update_progress(annotated, total)
         
-        if not scenario:
-            return jsonify({"error": "シナリオの生成に失敗しました"}), 500
+        selections = []
         
-        # アノテーション付与
-        print(f"アノテーション付与中: {len(scenario)}件の発言")
-        annotated_scenario = annotator.annotate_scenario(
-            scenario=scenario,
-            meeting_purpose=meeting_purpose,
-            meeting_format=meeting_format
+        # 生成とアノテーション付与
+        annotated_scenario = generate_and_annotate(
+            **_generation_args(params),
+            on_progress=on_progress if job else None,
+            on_selection=selections.append
         )
         
         # 結果をファイルに保存
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        profile_base = Path(profile_filename).stem  # 拡張子を除いたファイル名
-        output_filename = f"{timestamp}_{profile_base}.json"
-        output_path = Path(OUTPUTS_DIR) / output_filename
-        
-        output_data = {
-            "metadata": {
-                "generated_at": datetime.now().isoformat(),
-                "meeting_purpose": meeting_purpose,
-                "meeting_format": meeting_format,
-                "num_utterances": len(annotated_scenario),
-                "profile_filename": profile_filename,
-                "scenario_model": SCENARIO_MODEL,
-                "annotation_model": ANNOTATION_MODEL,
-                "sanitize_mode": SANITIZE_MODE
-            },
-            "scenario": annotated_scenario
-        }
-        
-        with open(output_path, 'w', encoding='utf-8') as f:
-            json.dump(output_data, f, ensure_ascii=False, indent=2)
-        
-        print(f"シナリオ保存完了: {output_path}")
+        if job:
+            job.set_stage("saving")
+        output_path = _save_output(params, annotated_scenario, trace.summary(), selections[0] if selections else None)
+    
+    return {
+        "success": True,
+        "scenario": annotated_scenario,
+        "metadata": _response_metadata(params, len(annotated_scenario), output_path)
+    }
+
+
+@app.route('/api/generate-scenario', methods=['POST'])
+def generate_scenario():
+    """シナリオを生成してアノテーション"""
+    try:
+        params, error_response = _parse_generation_request(request.json)
+        if error_response:
+            return error_response
         
-        return jsonify({
-            "success": True,
-            "scenario": annotated_scenario,
-            "metadata": {
-                "meeting_purpose": meeting_purpose,
-                "meeting_format": meeting_format,
-                "num_utterances": len(annotated_scenario),
-                "profile_filename": profile_filename,
-                "saved_to": str(output_path)
-            }
-        })
+        return jsonify(_run_generation(params))
         
     except Exception as e:
         import traceback
@@ -185,31 +462,167 @@ def generate_scenario():
         return jsonify({"error": f"エラーが発生しました: {str(e)}"}), 500
 
 
-@app.route('/api/outputs', methods=['GET'])
-def get_outputs():
-    """保存済みシナリオ一覧を取得"""
-    outputs_path = Path(OUTPUTS_DIR)
+def _sse_event(event: str, data: dict) -> str:
+    """Server-Sent Eventsの1イベント分の文字列を作成"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@app.route('/api/generate-scenario/stream', methods=['POST'])
+def generate_scenario_stream():
+    """
+    シナリオを生成してアノテーション（Server-Sent Eventsで逐次送信）
     
-    if not outputs_path.exists():
-        return jsonify({"outputs": []})
+    イベント:
+        scenario: 生成直後のシナリオ（metricsなし）。分割生成の場合は最初の部分、ストリーミング生成の場合は生成開始時の空のシナリオ
+        segment: 分割生成の2つ目以降の部分（開始位置と発言のリスト、metricsなし）
+        selection: 複数の候補から1つを選んだ（候補ごとの代理評価の結果、候補数が2以上の場合のみ）
+        utterance: ストリーミング生成で1発言の生成が完了した（発言番号と発言、metricsなし）
+        annotation: 1発言分のアノテーション（完了順、評価に失敗した発言はannotation_error、評価段階があればannotation_tierを含む）
+        done: 保存完了（保存先を含むメタデータ）
+        error: エラー発生
+    """
+    params, error_response = _parse_generation_request(request.json)
+    if error_response:
+        return error_response
     
-    outputs = []
-    for json_file in sorted(outputs_path.glob("*.json"), reverse=True):
+    def stream():
         try:
-            with open(json_file, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-            outputs.append({
-                "filename": json_file.name,
-                "generated_at": data.get("metadata", {}).get("generated_at", ""),
-                "meeting_purpose": data.get("metadata", {}).get("meeting_purpose", ""),
-                "meeting_format": data.get("metadata", {}).get("meeting_format", ""),
-                "num_utterances": data.get("metadata", {}).get("num_utterances", 0),
-                "profile_filename": data.get("metadata", {}).get("profile_filename", "")
+            with telemetry.trace() as trace:
+                annotated_scenario = []
+                selection = None
+                if generator.stream:
+                    yield _sse_event("scenario", {
+                        "scenario": [],
+                        "metadata": _response_metadata(params, params["num_utterances"])
+                    })
+                for kind, payload in iter_generate_and_annotate(**_generation_args(params)):
+                    if kind == "selection":
+                        selection = payload
+                        yield _sse_event("selection", payload)
+                        continue
+                    if kind == "utterance":
+                        annotated_scenario.append(None)
+                        if generator.stream:
+                            index, utterance = payload
+                            yield _sse_event("utterance", {"index": index, **utterance})
+                        continue
+                    if kind == "segment":
+                        if generator.stream:
+                            continue
+                        utterances = payload["utterances"]
+                        if payload["start"] == 0:
+                            yield _sse_event("scenario", {
+                                "scenario": utterances,
+                                # 分割生成の場合は残りの部分も含めた発言数の目安
+                                "metadata": _response_metadata(
+                                    params,
+                                    params["num_utterances"] if generator.is_segmented(params["num_utterances"]) else len(utterances)
+                                )
+                            })
+                        else:
+                            yield _sse_event("segment", payload)
+                        continue
+                    
+                    index, annotated_utt = payload
+                    annotated_scenario[index] = annotated_utt
+                    event = {"index": index, "metrics": annotated_utt["metrics"]}
+                    for field in ("annotation_tier", "annotation_error"):
+                        if field in annotated_utt:
+                            event[field] = annotated_utt[field]
+                    yield _sse_event("annotation", event)
+                
+                annotated_scenario = [utt for utt in annotated_scenario if utt is not None]
+                output_path = _save_output(params, annotated_scenario, trace.summary(), selection)
+            yield _sse_event("done", {
+                "success": True,
+                "metadata": _response_metadata(params, len(annotated_scenario), output_path)
             })
-        except Exception:
-            continue
+        except Exception as e:
+            import traceback
+            traceback.print_exc()
+            yield _sse_event("error", {"error": f"エラーが発生しました: {str(e)}"})
+    
+    return Response(
+        stream_with_context(stream()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+
+@app.route('/api/jobs', methods=['POST'])
+def create_generation_job():
+    """シナリオ生成ジョブを登録し、ジョブIDを即座に返す"""
+    params, error_response = _parse_generation_request(request.json)
+    if error_response:
+        return error_response
+    
+    job = job_manager.submit(lambda job: _run_generation(params, job), params=params)
+    
+    return jsonify({
+        "success": True,
+        "job_id": job.id,
+        "status": job.status,
+        "status_url": f"/api/jobs/{job.id}"
+    }), 202
+
+
+@app.route('/api/jobs', methods=['GET'])
+def list_jobs():
+    """ジョブ一覧を取得（結果本体は含めない）"""
+    return jsonify({"jobs": [job.to_dict(include_result=False) for job in job_manager.list_jobs()]})
+
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """ジョブの状態・進捗・結果を取得"""
+    job = job_manager.get(job_id)
+    
+    if job is None:
+        return jsonify({"error": "ジョブが見つかりません"}), 404
+    
+    return jsonify(job.to_dict())
+
+
+@app.route('/api/outputs', methods=['GET'])
+def get_outputs():
+    """
+    保存済みシナリオ一覧を取得（サブディレクトリを含む、新しい順）
     
-    return jsonify({"outputs": outputs})
+    クエリパラメータ:
+        page, per_page: ページ番号（1始まり）と1ページあたりの件数
+        focus_metric: 重点指標で絞り込み
+        profile: プロフィールファイル名（部分一致）で絞り込み
+        date_from, date_to: 生成日（YYYY-MM-DD）の範囲で絞り込み
+        directory: サブディレクトリで絞り込み
+    """
+    try:
+        page = int(request.args.get('page', 1))
+        per_page = min(int(request.args.get('per_page', 100)), 1000)
+    except ValueError:
+        return jsonify({"error": "page と per_page には整数を指定してください"}), 400
+    
+    outputs, total = output_index.query(
+        page=page,
+        per_page=per_page,
+        focus_metric=request.args.get('focus_metric'),
+        profile=request.args.get('profile'),
+        date_from=request.args.get('date_from'),
+        date_to=request.args.get('date_to'),
+        directory=request.args.get('directory')
+    )
+    
+    return jsonify({
+        "outputs": outputs,
+        "total": total,
+        "page": page,
+        "per_page": per_page
+    })
+
+
+@app.route('/api/outputs/refresh', methods=['POST'])
+def refresh_outputs():
+    """出力ディレクトリを走査し、索引をすぐに更新（バックグラウンドの確認を待たない）"""
+    return jsonify({"updated": output_index.refresh(force=True)})
 
 
 @app.route('/api/output/<path:filename>', methods=['GET'])
@@ -221,9 +634,7 @@ def get_output(filename):
         return jsonify({"error": "ファイルが見つかりません"}), 404
     
     try:
-        with open(output_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-        return jsonify(data)
+        return jsonify(annotation_store.load(output_path))
     except Exception as e:
         return jsonify({"error": f"ファイルの読み込みに失敗しました: {str(e)}"}), 500
 
@@ -236,6 +647,10 @@ def download_output(filename):
     if not output_path.exists():
         return jsonify({"error": "ファイルが見つかりません"}), 404
     
+    # 未反映の人手アノテーションを含めてダウンロードさせる
+    if annotation_store.compact(output_path):
+        output_index.upsert(output_path)
+    
     return send_file(
         output_path,
         mimetype='application/json',
@@ -244,54 +659,81 @@ def download_output(filename):
     )
 
 
+def _attachment_headers(download_name: str) -> dict:
+    """日本語のファイル名でダウンロードさせるためのContent-Dispositionヘッダー"""
+    ascii_name = download_name.encode('ascii', 'ignore').decode() or 'download'
+    return {
+        'Content-Disposition': f"attachment; filename=\"{ascii_name}\"; filename*=UTF-8''{quote(download_name)}"
+    }
+
+
 @app.route('/api/output/<path:filename>/csv', methods=['GET'])
 def download_output_csv(filename):
-    """保存済みシナリオをCSVとしてダウンロード（人手アノテーション用）"""
+    """
+    保存済みシナリオをCSVとしてダウンロード（人手アノテーション用）
+
+    クエリパラメータ:
+        machine: trueの場合は機械アノテーションのスコア・理由を参考列として加える
+    """
     output_path = Path(OUTPUTS_DIR) / filename
     
     if not output_path.exists():
         return jsonify({"error": "ファイルが見つかりません"}), 404
     
     try:
-        with open(output_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-        
-        scenario = data.get('scenario', [])
-        
-        # CSV生成
-        si = io.StringIO()
-        writer = csv.writer(si)
-        
-        # ヘッダー: 発話者, 発話内容, 各評価指標（空欄）
-        # 指標は固定: 威圧度, 逸脱度, 発言無効度, 偏り度
-        header = ['Speaker', 'Content', '威圧度', '逸脱度', '発言無効度', '偏り度']
-        writer.writerow(header)
-        
-        for turn in scenario:
-            speaker = turn.get('speaker', '')
-            text = turn.get('text', '')
-            # 指標のカラムは空欄にする
-            row = [speaker, text, '', '', '', '']
-            writer.writerow(row)
-            
-        output = io.BytesIO()
-        output.write(si.getvalue().encode('utf-8-sig')) # Excelで文字化けしないようにBOM付きUTF-8
-        output.seek(0)
-        
-        csv_filename = Path(filename).stem + '_annotation.csv'
-        
-        return send_file(
-            output,
-            mimetype='text/csv',
-            as_attachment=True,
-            download_name=csv_filename
-        )
-        
+        data = annotation_store.load(output_path)
     except Exception as e:
         import traceback
         traceback.print_exc()
         return jsonify({"error": f"CSV生成に失敗しました: {str(e)}"}), 500
 
+    # ヘッダー: 発話者, 発話内容, 各評価指標（空欄）
+    include_machine = request.args.get('machine', 'false').lower() in ('true', '1', 'yes')
+    chunks = iter_annotation_csv(data.get('scenario', []), METRIC_NAMES, include_machine=include_machine)
+    return Response(chunks, mimetype='text/csv', headers=_attachment_headers(Path(csv_name(filename)).name))
+
+
+@app.route('/api/outputs/csv.zip', methods=['GET'])
+def download_outputs_csv_zip():
+    """
+    条件に合う保存済みシナリオの人手アノテーション用CSVをまとめたZIPをダウンロード（評価依頼用）
+
+    クエリパラメータ:
+        focus_metric, profile, date_from, date_to, directory: GET /api/outputs と同じ絞り込み
+        machine: trueの場合は機械アノテーションのスコア・理由を参考列として加える
+
+    ZIPは1シナリオずつCSVを作りながら圧縮して送るため、件数が多くても使用メモリは増えない。
+    """
+    filenames = output_index.filenames(
+        focus_metric=request.args.get('focus_metric'),
+        profile=request.args.get('profile'),
+        date_from=request.args.get('date_from'),
+        date_to=request.args.get('date_to'),
+        directory=request.args.get('directory')
+    )
+    if not filenames:
+        return jsonify({"error": "条件に合うシナリオがありません"}), 404
+    include_machine = request.args.get('machine', 'false').lower() in ('true', '1', 'yes')
+
+    def csv_chunks(name):
+        # ZIPに書き込む順番が来てから出力JSONを読み込む
+        def chunks():
+            try:
+                data = annotation_store.load(Path(OUTPUTS_DIR) / name)
+            except (OSError, ValueError) as e:
+                print(f"警告: {name} を読み込めませんでした: {e}")
+                return iter(())
+            return iter_annotation_csv(data.get('scenario', []), METRIC_NAMES, include_machine=include_machine)
+        return chunks
+
+    entries = ((csv_name(name), csv_chunks(name)) for name in filenames)
+    download_name = f"annotation_{datetime.now().strftime('%Y%m%d_%H%M%S')}.zip"
+    return Response(
+        stream_with_context(iter_annotation_zip(entries)),
+        mimetype='application/zip',
+        headers=_attachment_headers(download_name)
+    )
+
 
 @app.route('/api/output/<path:filename>/annotations', methods=['POST'])
 def save_human_annotations(filename):
@@ -302,50 +744,20 @@ def save_human_annotations(filename):
         return jsonify({"error": "ファイルが見つかりません"}), 404
     
     try:
-        # リクエストデータを取得
+        # リクエストデータを取得（前回の保存以降に変更されたアノテーションだけ）
         data = request.json
         annotations = data.get('annotations', {})
         
-        # 既存のファイルを読み込み
-        with open(output_path, 'r', encoding='utf-8') as f:
-            file_data = json.load(f)
-        
-        # メタデータを更新
-        file_data['metadata']['last_human_annotation'] = datetime.now().isoformat()
-        
-        # 各発言の人手アノテーションを更新
-        for utterance_idx_str, metric_annotations in annotations.items():
-            utterance_idx = int(utterance_idx_str)
-            
-            if utterance_idx < 0 or utterance_idx >= len(file_data['scenario']):
-                continue
-            
-            utterance = file_data['scenario'][utterance_idx]
-            
-            # 初回の場合、metricsをmachine_annotationsにリネーム
-            if 'metrics' in utterance and 'machine_annotations' not in utterance:
-                utterance['machine_annotations'] = utterance.pop('metrics')
-            
-            # human_annotationsセクションを初期化
-            if 'human_annotations' not in utterance:
-                utterance['human_annotations'] = {}
-            
-            # 各メトリクスのアノテーションを更新
-            for metric_name, metric_data in metric_annotations.items():
-                utterance['human_annotations'][metric_name] = {
-                    'score': metric_data.get('score'),
-                    'edited_at': datetime.now().isoformat(),
-                    'note': metric_data.get('note', '')
-                }
-        
-        # ファイルに書き戻し
-        with open(output_path, 'w', encoding='utf-8') as f:
-            json.dump(file_data, f, ensure_ascii=False, indent=2)
+        # 出力JSON全体は書き換えず、編集ログに追記する
+        edits = annotation_store.save_human_annotations(output_path, annotations)
+        if edits:
+            output_index.mark_human_annotated(output_path)
         
         return jsonify({
             "success": True,
             "message": "人手アノテーションを保存しました",
-            "saved_to": str(output_path)
+            "saved_to": str(output_path),
+            "edits": edits
         })
         
     except Exception as e:
@@ -354,6 +766,87 @@ def save_human_annotations(filename):
         return jsonify({"error": f"保存に失敗しました: {str(e)}"}), 500
 
 
+@app.route('/api/annotations/import', methods=['POST'])
+def import_annotation_csvs():
+    """記入済みの人手アノテーション用CSV（複数可）を対応する出力JSONに取り込む"""
+    uploads = request.files.getlist('files')
+    if not uploads:
+        return jsonify({"error": "CSVファイルを files で指定してください"}), 400
+    dry_run = request.form.get('dry_run', 'false').lower() in ('true', '1', 'yes')
+
+    sheets, unreadable = [], []
+    for upload in uploads:
+        try:
+            # パスは使わず、ファイル名だけで出力JSONに対応付ける
+            sheets.append(parse_annotation_csv(upload.read(), Path(Path(upload.filename or "").name)))
+        except (ValueError, UnicodeDecodeError) as e:
+            unreadable.append({"csv": upload.filename, "error": str(e)})
+
+    try:
+        result = import_annotation_sheets(sheets, OUTPUTS_DIR, store=annotation_store, dry_run=dry_run)
+        for name in result["updated_files"]:
+            output_index.mark_human_annotated(Path(OUTPUTS_DIR) / name)
+        return jsonify({**result, "unreadable": unreadable})
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        return jsonify({"error": f"取り込みに失敗しました: {str(e)}"}), 500
+
+
+@app.route('/api/annotate/local', methods=['POST'])
+def annotate_with_local_model():
+    """ローカル評価モデルでシナリオを評価する（APIを呼ばないプレビュー用、保存はしない）"""
+    if local_annotator is None:
+        return jsonify({"error": f"ローカル評価モデルがありません（python local_annotator.py train で {LOCAL_ANNOTATOR_PATH} を作成してください）"}), 503
+    data = request.json or {}
+    scenario = data.get('scenario')
+    if not isinstance(scenario, list) or not all(isinstance(utt, dict) for utt in scenario):
+        return jsonify({"error": "scenario に発言のリストを指定してください"}), 400
+
+    start = time.perf_counter()
+    annotated = local_annotator.annotate_scenario(
+        scenario, data.get('meeting_purpose', ''), data.get('meeting_format', '')
+    )
+    return jsonify({
+        "scenario": annotated,
+        "model": local_annotator.info,
+        "seconds": round(time.perf_counter() - start, 4)
+    })
+
+
+@app.route('/api/output/<path:filename>/reannotate', methods=['POST'])
+def reannotate_saved_output(filename):
+    """
+    保存済みシナリオの評価が欠けている・変更された発言だけを再アノテーションするジョブを登録
+    
+    リクエストボディ:
+        mode: "missing"（デフォルト、評価がない・失敗した発言） / "changed"（加えて変更された発言） / "all"（全発言）
+    """
+    output_path = Path(OUTPUTS_DIR) / filename
+    
+    if not output_path.exists():
+        return jsonify({"error": "ファイルが見つかりません"}), 404
+    
+    mode = (request.json or {}).get('mode', 'missing')
+    if mode not in REANNOTATE_MODES:
+        return jsonify({"error": f"modeは {', '.join(REANNOTATE_MODES)} のいずれかを指定してください"}), 400
+    
+    def run(job: Job) -> dict:
+        job.set_stage("annotating")
+        summary = reannotate_output(annotator, output_path, mode, on_progress=job.update_progress, store=annotation_store)
+        output_index.upsert(output_path)
+        return {"success": True, **summary}
+    
+    job = job_manager.submit(run, params={"filename": filename, "mode": mode})
+    
+    return jsonify({
+        "success": True,
+        "job_id": job.id,
+        "status": job.status,
+        "status_url": f"/api/jobs/{job.id}"
+    }), 202
+
+
 if __name__ == '__main__':
     port = int(os.getenv('FLASK_PORT', 5000))
     host = os.getenv('FLASK_HOST', 'localhost')
@@ -362,6 +855,11 @@ if __name__ == '__main__':
     print(f"URL: http://{host}:{port}")
     print(f"シナリオ生成モデル: {SCENARIO_MODEL}")
     print(f"アノテーションモデル: {ANNOTATION_MODEL}")
+    print(f"ローカル評価モデル: {LOCAL_ANNOTATOR_PATH if local_annotator else 'なし'}")
+    if ANNOTATION_CASCADE_MODEL:
+        print(f"カスケード評価: {ANNOTATION_CASCADE_MODEL}（{ANNOTATION_CASCADE_SAMPLES}回）で評価し、不確かな発言だけを {ANNOTATION_MODEL} で評価し直す")
+    if ANNOTATE_FOCUS_ONLY:
+        print("重点指標を指定した生成では重点指標だけを評価します（残りの指標は reannotate.py で後から評価）")
     print(f"サニタイズモード: {'有効' if SANITIZE_MODE else '無効'}")
     
     app.run(host=host, port=port, debug=True)
@@ -0,0 +1,351 @@
+"""
+batch_generate.py
+マニフェストに従ってシナリオ生成＋アノテーションを一括実行するCLI
+
+使用例:
+    python batch_generate.py manifest.jsonl --workers 4 --rpm 300
+
+マニフェスト（JSON配列またはJSON Lines）の各項目:
+    {
+      "id": "deviation-01",                     # 省略時は項目の番号
+      "profile": "逸脱度_脱線王と雑談会議.json",   # PROFILES_DIRからの相対パス
+      "meeting_purpose": "自動会議設定機能の評価結果報告",
+      "meeting_format": "定例・進捗",
+      "num_utterances": 40,
+      "focus_metrics": ["逸脱度"],
+      "target_ratio": 50,
+      "candidates": 3,                          # 省略時は --candidates（重点指標がある場合のみ有効）
+      "focus_only": true,                       # 重点指標だけを評価する（省略時は --focus-only）
+      "repetitions": 3
+    }
+
+完了した項目はチェックポイントファイル（JSON Lines）に記録され、
+中断後に同じコマンドを再実行すると未完了の項目だけが実行される。
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set
+
+from dotenv import load_dotenv
+
+import telemetry
+from best_of_n import CandidateSelector
+from config_cache import ConfigCache
+from generation_pipeline import generate_and_annotate
+from scenario_generator import ScenarioGenerator
+from metric_annotator import MetricAnnotator
+from llm_cache import LLMCache
+from llm_client import LLMClient
+from local_annotator import load_local_annotator
+from output_store import build_output_data, new_output_path, write_json_atomic
+
+
+def load_manifest(path: str) -> List[Dict[str, Any]]:
+    """マニフェスト（JSON配列またはJSON Lines）を読み込む"""
+    with open(path, 'r', encoding='utf-8') as f:
+        content = f.read()
+
+    if content.lstrip().startswith('['):
+        items = json.loads(content)
+    else:
+        items = [json.loads(line) for line in content.splitlines() if line.strip()]
+
+    for i, item in enumerate(items):
+        for key in ("profile", "meeting_purpose", "meeting_format"):
+            if not item.get(key):
+                raise ValueError(f"マニフェストの{i}番目の項目に {key} がありません")
+        item.setdefault("id", str(i))
+    return items
+
+
+def expand_tasks(items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """各項目を繰り返し回数分のタスクに展開（キーは "{id}#{繰り返し番号}"）"""
+    tasks = []
+    for item in items:
+        for rep in range(int(item.get("repetitions", 1))):
+            tasks.append({"key": f"{item['id']}#{rep}", "item": item, "repetition": rep})
+    return tasks
+
+
+def load_checkpoint(path: Path) -> Set[str]:
+    """チェックポイントから完了済みタスクのキーを読み込む"""
+    if not path.exists():
+        return set()
+
+    completed = set()
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                completed.add(json.loads(line)["key"])
+            except (json.JSONDecodeError, KeyError):
+                continue  # 書き込み途中で中断された行は無視
+    return completed
+
+
+class BatchRunner:
+    """タスクをワーカープールで実行し、完了ごとにチェックポイントへ記録するクラス"""
+
+    def __init__(
+        self,
+        generator: ScenarioGenerator,
+        annotator: MetricAnnotator,
+        profiles_dir: str,
+        outputs_dir: str,
+        checkpoint_path: Path,
+        sanitize_mode: bool,
+        proxy_annotator: Optional[MetricAnnotator] = None,
+        candidates: int = 1,
+        tolerance: float = 10.0,
+        sample_size: int = 12,
+        focus_only: bool = False
+    ):
+        """
+        Args:
+            proxy_annotator: 候補の代理評価に使う MetricAnnotator（Noneの場合は候補を選ばない）
+            candidates: 項目に candidates がない場合の候補数
+            tolerance, sample_size: best_of_n.CandidateSelector と同じ
+            focus_only: 項目に focus_only がない場合に、重点指標だけを評価するかどうか
+        """
+        self.generator = generator
+        self.annotator = annotator
+        self.profiles_dir = profiles_dir
+        self.outputs_dir = outputs_dir
+        self.checkpoint_path = checkpoint_path
+        self.sanitize_mode = sanitize_mode
+        self.proxy_annotator = proxy_annotator
+        self.candidates = candidates
+        self.tolerance = tolerance
+        self.sample_size = sample_size
+        self.focus_only = focus_only
+        self._checkpoint_lock = threading.Lock()
+
+    def run_task(self, task: Dict[str, Any]) -> Path:
+        """1タスク分のシナリオを生成・アノテーション・保存する"""
+        item = task["item"]
+        focus_metrics = item.get("focus_metrics") or None
+        target_ratio = item.get("target_ratio", 50)
+        candidates = int(item.get("candidates", self.candidates))
+        # 重点指標だけを評価する場合、残りの指標は reannotate.py の missing モードで後から評価する
+        annotation_metrics = focus_metrics if item.get("focus_only", self.focus_only) else None
+        selector = None
+        if focus_metrics and candidates > 1 and self.proxy_annotator is not None:
+            selector = CandidateSelector(
+                self.generator, self.proxy_annotator, candidates,
+                tolerance=self.tolerance, sample_size=self.sample_size
+            )
+        selections = []
+
+        with telemetry.trace() as trace:
+            profiles = self.generator.load_profiles(str(Path(self.profiles_dir) / item["profile"]))
+            # 生成中の応答から届いた発言（分割生成の場合は生成済みの部分）を順にアノテーションする
+            annotated_scenario = generate_and_annotate(
+                self.generator,
+                self.annotator,
+                profiles=profiles,
+                meeting_purpose=item["meeting_purpose"],
+                meeting_format=item["meeting_format"],
+                num_utterances=int(item.get("num_utterances", 40)),
+                focus_metrics=focus_metrics,
+                target_ratio=target_ratio,
+                selector=selector,
+                on_selection=selections.append,
+                annotation_metrics=annotation_metrics,
+                # 繰り返しごとに別の生成プロンプトにする（同じプロンプトでは応答キャッシュから同じシナリオが返る）
+                variant=task.get("repetition", 0)
+            )
+
+        output_path = new_output_path(self.outputs_dir, item["profile"])
+        output_data = build_output_data(
+            annotated_scenario,
+            meeting_purpose=item["meeting_purpose"],
+            meeting_format=item["meeting_format"],
+            profile_filename=item["profile"],
+            focus_metrics=focus_metrics,
+            target_ratio=target_ratio,
+            scenario_model=self.generator.model_name,
+            annotation_model=self.annotator.model_name,
+            sanitize_mode=self.sanitize_mode,
+            trace_summary=trace.summary(),
+            selection=selections[0] if selections else None,
+            cascade_model=self.annotator.cascade_model,
+            annotation_metrics=annotation_metrics
+        )
+        write_json_atomic(output_path, output_data)
+        if output_data["metadata"]["annotation_errors"]:
+            print(f"警告: {task['key']}: {output_data['metadata']['annotation_errors']}件の発言を評価できませんでした")
+        if output_data["metadata"].get("local_estimates"):
+            print(f"警告: {task['key']}: {output_data['metadata']['local_estimates']}件の発言をローカル評価モデルの推定で補いました")
+
+        self._record(task["key"], output_path)
+        return output_path
+
+    def run(self, tasks: List[Dict[str, Any]], workers: int) -> int:
+        """
+        未完了のタスクを実行する
+
+        Returns:
+            失敗したタスク数
+        """
+        completed = load_checkpoint(self.checkpoint_path)
+        pending = [task for task in tasks if task["key"] not in completed]
+        print(f"全{len(tasks)}件中 {len(tasks) - len(pending)}件は完了済み。{len(pending)}件を実行します")
+
+        failures = 0
+        executor = ThreadPoolExecutor(max_workers=max(1, workers))
+        try:
+            futures = {executor.submit(self.run_task, task): task for task in pending}
+            for done, future in enumerate(as_completed(futures), start=1):
+                task = futures[future]
+                try:
+                    output_path = future.result()
+                    print(f"[{done}/{len(pending)}] 完了: {task['key']} → {output_path}")
+                except Exception as e:
+                    failures += 1
+                    traceback.print_exc()
+                    print(f"[{done}/{len(pending)}] 失敗: {task['key']}: {e}")
+        except KeyboardInterrupt:
+            print("中断しました。再実行すると未完了のタスクから再開します")
+            raise
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+        return failures
+
+    def _record(self, key: str, output_path: Path) -> None:
+        """完了したタスクをチェックポイントに追記"""
+        line = json.dumps(
+            {"key": key, "output": str(output_path), "completed_at": datetime.now().isoformat()},
+            ensure_ascii=False
+        )
+        with self._checkpoint_lock:
+            with open(self.checkpoint_path, 'a', encoding='utf-8') as f:
+                f.write(line + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+
+
+def main(argv: List[str] = None) -> int:
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description="マニフェストに従ってシナリオを一括生成・アノテーションする")
+    parser.add_argument("manifest", help="マニフェストファイル（JSON配列またはJSON Lines）")
+    parser.add_argument("--workers", type=int, default=4, help="同時に生成するシナリオ数")
+    parser.add_argument("--rpm", type=float, default=float(os.getenv("OPENAI_RPM_LIMIT", "0")),
+                        help="全ワーカー合計のAPIリクエスト数/分の上限（0で無制限）")
+    parser.add_argument("--tpm", type=float, default=float(os.getenv("OPENAI_TPM_LIMIT", "0")),
+                        help="全ワーカー合計のAPIトークン数/分の上限（0で無制限）")
+    parser.add_argument("--max-retries", type=int, default=int(os.getenv("OPENAI_MAX_RETRIES", "5")),
+                        help="429・タイムアウト・5xxエラーの最大再試行回数")
+    parser.add_argument("--annotation-concurrency", type=int,
+                        default=int(os.getenv("ANNOTATION_CONCURRENCY", "8")),
+                        help="1シナリオ内の発言アノテーションの同時実行数")
+    parser.add_argument("--batch-size", type=int, default=int(os.getenv("ANNOTATION_BATCH_SIZE", "1")),
+                        help="1回のLLM呼び出しで評価する発言数")
+    parser.add_argument("--cascade-model", default=os.getenv("ANNOTATION_CASCADE_MODEL", ""),
+                        help="先に全発言を評価する安価なモデル（不確かな発言だけをアノテーションモデルで評価し直す）")
+    parser.add_argument("--cascade-samples", type=int, default=int(os.getenv("ANNOTATION_CASCADE_SAMPLES", "1")),
+                        help="安価なモデルに評価させる回数（2以上でサンプル間の不一致も評価し直す）")
+    parser.add_argument("--segment-size", type=int, default=int(os.getenv("GENERATION_SEGMENT_SIZE", "0")),
+                        help="発言数がこれを超える会議を分割して生成する（0で分割しない、デフォルト）")
+    parser.add_argument("--stream", action="store_true",
+                        default=os.getenv("GENERATION_STREAM", "false").lower() in ("true", "1", "yes"),
+                        help="シナリオ生成の応答をストリーミングで受け取り、発言が届くごとにアノテーションを始める")
+    parser.add_argument("--candidates", type=int, default=int(os.getenv("BEST_OF_N_CANDIDATES", "1")),
+                        help="重点指標のある項目で並行して生成する候補数（1で候補を選ばない）")
+    parser.add_argument("--focus-only", action="store_true",
+                        default=os.getenv("ANNOTATE_FOCUS_ONLY", "false").lower() in ("true", "1", "yes"),
+                        help="重点指標のある項目では重点指標だけを評価する（残りの指標は reannotate.py で後から評価）")
+    parser.add_argument("--checkpoint", help="チェックポイントファイル（デフォルト: {マニフェスト}.checkpoint.jsonl）")
+    parser.add_argument("--outputs-dir", default=os.getenv("OUTPUTS_DIR", "data/outputs"))
+    parser.add_argument("--profiles-dir", default=os.getenv("PROFILES_DIR", "data/profiles"))
+    parser.add_argument("--no-cache", action="store_true", help="LLM応答キャッシュを使用しない")
+    args = parser.parse_args(argv)
+
+    api_key = os.getenv("OPENAI_API_KEY")
+    scenario_model = os.getenv("SCENARIO_MODEL_NAME") or os.getenv("OPENAI_MODEL_NAME", "gpt-4o-mini")
+    annotation_model = os.getenv("ANNOTATION_MODEL_NAME") or os.getenv("OPENAI_MODEL_NAME", "gpt-4o")
+    extra_json_path = os.getenv("EXTRA_JSON_PATH", "data/extra.json")
+    sanitize_mode = os.getenv("SANITIZE_MODE", "true").lower() in ("true", "1", "yes")
+    cache_enabled = os.getenv("LLM_CACHE_ENABLED", "true").lower() in ("true", "1", "yes") and not args.no_cache
+
+    cache = LLMCache(
+        os.getenv("LLM_CACHE_DIR", "data/cache"),
+        ttl_seconds=float(os.getenv("LLM_CACHE_TTL_HOURS", "168")) * 3600,
+        max_entries=int(os.getenv("LLM_CACHE_MAX_ENTRIES", "20000"))
+    ) if cache_enabled else None
+    # 生成とアノテーションで1つのクライアント（キャッシュ・レート制限）を共有する
+    llm_client = LLMClient(
+        api_key,
+        cache=cache,
+        rpm_limit=args.rpm,
+        tpm_limit=args.tpm,
+        max_retries=args.max_retries
+    )
+    # 指標定義・プロフィールは一度だけ解析して全タスクで共有する
+    config_cache = ConfigCache()
+
+    generator = ScenarioGenerator(
+        api_key,
+        scenario_model,
+        sanitize_mode=sanitize_mode,
+        extra_json_path=extra_json_path,
+        llm_client=llm_client,
+        config_cache=config_cache,
+        segment_size=args.segment_size,
+        stream=args.stream,
+        # 生成の応答キャッシュは明示した場合だけ使う（使う場合も繰り返しごとにプロンプトが変わる）
+        cache_responses=os.getenv("LLM_CACHE_GENERATION", "false").lower() in ("true", "1", "yes")
+    )
+    annotator = MetricAnnotator(
+        api_key,
+        annotation_model,
+        extra_json_path,
+        max_workers=args.annotation_concurrency,
+        batch_size=args.batch_size,
+        llm_client=llm_client,
+        config_cache=config_cache,
+        cascade_model=args.cascade_model or None,
+        cascade_samples=args.cascade_samples,
+        # LOCAL_ANNOTATOR_FALLBACK=true の場合は、API障害で評価できなかった発言をローカル評価モデル（あれば）の推定で埋める
+        fallback=load_local_annotator(os.getenv("LOCAL_ANNOTATOR_PATH", "data/local_annotator.npz"))
+        if os.getenv("LOCAL_ANNOTATOR_FALLBACK", "false").lower() in ("true", "1", "yes") else None
+    )
+
+    # 候補の代理評価用（安価なモデル）
+    proxy_annotator = MetricAnnotator(
+        api_key,
+        os.getenv("BEST_OF_N_PROXY_MODEL", "gpt-4o-mini"),
+        extra_json_path,
+        max_workers=args.annotation_concurrency,
+        batch_size=args.batch_size,
+        llm_client=llm_client,
+        config_cache=config_cache
+    )
+
+    tasks = expand_tasks(load_manifest(args.manifest))
+    checkpoint_path = Path(args.checkpoint or f"{args.manifest}.checkpoint.jsonl")
+    runner = BatchRunner(
+        generator, annotator, args.profiles_dir, args.outputs_dir, checkpoint_path, sanitize_mode,
+        proxy_annotator=proxy_annotator,
+        candidates=args.candidates,
+        tolerance=float(os.getenv("BEST_OF_N_TOLERANCE", "10")),
+        sample_size=int(os.getenv("BEST_OF_N_SAMPLE_SIZE", "12")),
+        focus_only=args.focus_only
+    )
+
+    failures = runner.run(tasks, args.workers)
+    if failures:
+        print(f"{failures}件のタスクが失敗しました。再実行すると失敗したタスクだけを再試行します")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
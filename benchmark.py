@@ -0,0 +1,321 @@
+"""
+benchmark.py
+ローカルのモックサーバー（mock_openai_server.py）に対して、シナリオ生成・アノテーション・Flask APIの性能を測定するCLI
+
+使用例:
+    python benchmark.py --quick
+    python benchmark.py --sizes 20,40,100 --concurrency 1,4,8 --latency 0.2 --save-baseline benchmarks/baseline.json
+    python benchmark.py --sizes 20,40,100 --concurrency 1,4,8 --latency 0.2 --compare benchmarks/baseline.json
+
+各ケースについて、スループット（件/秒）、レイテンシのp50/p95（秒）、1回あたりのピークメモリ（MB）を出力する。
+--compare を指定すると、ベースラインと比較して閾値を超えて悪化したケースがあれば終了コード1を返す。
+"""
+import argparse
+import contextlib
+import importlib
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, List
+
+from generation_pipeline import generate_and_annotate
+from mock_openai_server import MockBehavior, start_mock_server
+from llm_client import LLMClient
+from metric_annotator import MetricAnnotator
+from output_store import build_output_data, write_json_atomic
+from scenario_generator import ScenarioGenerator
+
+
+CASES = ["generate", "annotate", "generate_annotate", "pipeline", "api_generate", "api_outputs", "api_csv"]
+
+PROFILES = [
+    {"id": "前田課長", "profile": {"role": "課長", "stance": "結論を急ぐ", "motivation": 0.8, "talkativeness": 0.7}},
+    {"id": "田中", "profile": {"role": "担当者", "stance": "慎重", "motivation": 0.5, "talkativeness": 0.4}},
+    {"id": "佐藤", "profile": {"role": "担当者", "stance": "雑談好き", "motivation": 0.6, "talkativeness": 0.9}},
+]
+
+# ベースライン比較で「悪化」とみなす方向（higher: 大きいほど良い / lower: 小さいほど良い）
+COMPARED_METRICS = {"throughput": "higher", "p95": "lower", "peak_memory_mb": "lower"}
+
+# これより小さいレイテンシの変化（秒）は測定誤差とみなして悪化と判定しない
+MIN_LATENCY_DELTA = 0.005
+
+
+def percentile(values: List[float], p: float) -> float:
+    """最近傍順位法によるパーセンタイル"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, int(round(p / 100 * len(ordered) + 0.5)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def measure(operation: Callable[[], Any], iterations: int, concurrency: int) -> Dict[str, float]:
+    """
+    operation を iterations 回（concurrency 並列）実行して性能を測定する
+
+    レイテンシ・スループットの測定中はtracemallocを無効にし、ピークメモリは別に1回だけ実行して測定する。
+    """
+    operation()  # ウォームアップ（初回のみの初期化を測定から除く）
+
+    def timed() -> float:
+        start = time.perf_counter()
+        operation()
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+        latencies = list(executor.map(lambda _: timed(), range(iterations)))
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    try:
+        operation()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "iterations": iterations,
+        "throughput": round(iterations / elapsed, 3) if elapsed > 0 else 0.0,
+        "p50": round(percentile(latencies, 50), 4),
+        "p95": round(percentile(latencies, 95), 4),
+        "peak_memory_mb": round(peak / 1024 / 1024, 3),
+    }
+
+
+class Benchmark:
+    """モックサーバーに接続した生成器・アノテーター・Flaskアプリで各ケースを実行するクラス"""
+
+    def __init__(self, base_url: str, workdir: Path, annotation_workers: int, batch_size: int):
+        self.base_url = base_url
+        self.workdir = workdir
+        self.annotation_workers = annotation_workers
+        self.batch_size = batch_size
+        # 応答キャッシュを使うとAPI呼び出しが測定されないため、キャッシュなしのクライアントを使う
+        llm_client = LLMClient("dummy", base_url=base_url, base_delay=0.05)
+        self.generator = ScenarioGenerator("dummy", "mock-model", llm_client=llm_client)
+        self.stream_generator = ScenarioGenerator("dummy", "mock-model", llm_client=llm_client, stream=True)
+        self.annotator = MetricAnnotator(
+            "dummy",
+            "mock-model",
+            "data/extra.json",
+            max_workers=annotation_workers,
+            batch_size=batch_size,
+            llm_client=llm_client
+        )
+        self._app = None
+
+    @property
+    def app(self):
+        """ベンチマーク用の作業ディレクトリ・モックサーバーを使うように環境変数を設定してからapp.pyを読み込む"""
+        if self._app is None:
+            os.environ.update({
+                "OPENAI_API_KEY": "dummy",
+                "OPENAI_BASE_URL": self.base_url,
+                "OUTPUTS_DIR": str(self.workdir / "outputs"),
+                "OUTPUT_INDEX_PATH": str(self.workdir / "output_index.sqlite3"),
+                "PROFILES_DIR": str(self.workdir / "profiles"),
+                "LLM_CACHE_ENABLED": "false",
+                "ANNOTATION_CONCURRENCY": str(self.annotation_workers),
+                "ANNOTATION_BATCH_SIZE": str(self.batch_size),
+            })
+            (self.workdir / "profiles").mkdir(parents=True, exist_ok=True)
+            write_json_atomic(self.workdir / "profiles" / "benchmark.json", PROFILES)
+            self._app = importlib.import_module("app").app
+        return self._app
+
+    def sample_scenario(self, size: int) -> List[Dict[str, str]]:
+        return [
+            {"speaker": PROFILES[i % len(PROFILES)]["id"], "text": f"ベンチマーク用の発言{i + 1}です。議題について意見を述べます。"}
+            for i in range(size)
+        ]
+
+    def write_outputs(self, directory: str, count: int, size: int) -> List[str]:
+        """一覧・CSVのベンチマーク用に出力JSONを作成（作成済みの場合はそのまま使う）"""
+        output_dir = self.workdir / "outputs" / directory
+        output_dir.mkdir(parents=True, exist_ok=True)
+        annotated = [
+            {**utt, "metrics": {name: {"score": i % 10, "reason": "ベンチマーク"} for name in ["威圧度", "逸脱度", "発言無効度", "偏り度"]}}
+            for i, utt in enumerate(self.sample_scenario(size))
+        ]
+        filenames = []
+        for i in range(count):
+            path = output_dir / f"20240101_{i:06d}_benchmark.json"
+            if not path.exists():
+                data = build_output_data(annotated, "ベンチマーク", "定例", "benchmark.json", [], 50, "mock-model", "mock-model", True)
+                write_json_atomic(path, data)
+            filenames.append(f"{directory}/{path.name}")
+        return filenames
+
+    def operation(self, case: str, size: int) -> Callable[[], Any]:
+        """ケースとサイズに対応する、1回分の処理を返す"""
+        if case == "generate":
+            return lambda: self.generator.generate_scenario(PROFILES, "ベンチマーク", "定例", num_utterances=size)
+
+        if case == "annotate":
+            scenario = self.sample_scenario(size)
+            return lambda: self.annotator.annotate_scenario(scenario, "ベンチマーク", "定例")
+
+        if case == "generate_annotate":
+            # 生成が完了してからアノテーションを始める（比較用）
+            return lambda: self.annotator.annotate_scenario(
+                self.generator.generate_scenario(PROFILES, "ベンチマーク", "定例", num_utterances=size),
+                "ベンチマーク", "定例"
+            )
+
+        if case == "pipeline":
+            # ストリーミング生成の応答から発言が届くたびにアノテーションを始める
+            return lambda: generate_and_annotate(
+                self.stream_generator, self.annotator, PROFILES, "ベンチマーク", "定例", num_utterances=size
+            )
+
+        if case == "api_generate":
+            app = self.app
+            body = {
+                "meeting_purpose": "ベンチマーク",
+                "meeting_format": "定例",
+                "profile_filename": "benchmark.json",
+                "num_utterances": size
+            }
+            return lambda: self._check(app.test_client().post('/api/generate-scenario', json=body))
+
+        if case == "api_outputs":
+            app = self.app
+            self.write_outputs(f"list_{size}", size, 20)
+            # 索引の走査はバックグラウンドで行われるため、計測前に明示的に更新する
+            self._check(app.test_client().post('/api/outputs/refresh'))
+            return lambda: self._check(app.test_client().get(f'/api/outputs?directory=list_{size}&per_page=100'))
+
+        if case == "api_csv":
+            app = self.app
+            filename = self.write_outputs(f"csv_{size}", 1, size)[0]
+            return lambda: self._check(app.test_client().get(f'/api/output/{filename}/csv'))
+
+        raise ValueError(f"不明なケースです: {case}")
+
+    @staticmethod
+    def _check(response) -> None:
+        if response.status_code != 200:
+            raise RuntimeError(f"HTTP {response.status_code}: {response.get_data(as_text=True)[:200]}")
+
+
+def compare(results: Dict[str, Dict[str, float]], baseline: Dict[str, Dict[str, float]], threshold: float) -> List[str]:
+    """
+    ベースラインと比較して結果を表示し、閾値を超えて悪化した項目を返す
+
+    Args:
+        threshold: 悪化とみなす変化率（0.2 = 20%）
+    """
+    regressions = []
+    print(f"\n{'ケース':<40} {'指標':<16} {'ベースライン':>12} {'今回':>12} {'変化':>8}")
+    for key, result in results.items():
+        if key not in baseline:
+            continue
+        for metric, better in COMPARED_METRICS.items():
+            before, after = baseline[key].get(metric), result.get(metric)
+            if not before or after is None:
+                continue
+            change = (after - before) / before
+            worse = -change if better == "higher" else change
+            if metric == "p95" and abs(after - before) < MIN_LATENCY_DELTA:
+                worse = 0.0
+            mark = " ← 悪化" if worse > threshold else ""
+            print(f"{key:<40} {metric:<16} {before:>12} {after:>12} {change:>+8.1%}{mark}")
+            if mark:
+                regressions.append(f"{key} {metric}: {before} → {after} ({change:+.1%})")
+    return regressions
+
+
+def parse_int_list(value: str) -> List[int]:
+    return [int(v) for v in value.split(",") if v.strip()]
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="モックサーバーに対してシナリオ生成・アノテーション・APIの性能を測定する")
+    parser.add_argument("--cases", default=",".join(CASES), help=f"実行するケース（{', '.join(CASES)}）")
+    parser.add_argument("--sizes", type=parse_int_list, default=[20, 40, 100],
+                        help="シナリオの発言数（api_outputsでは出力ファイル数）")
+    parser.add_argument("--concurrency", type=parse_int_list, default=[1, 4], help="同時実行数")
+    parser.add_argument("--iterations", type=int, default=8, help="1ケースあたりの実行回数")
+    parser.add_argument("--annotation-workers", type=int, default=8, help="発言アノテーションの同時実行数")
+    parser.add_argument("--batch-size", type=int, default=1, help="1回のLLM呼び出しで評価する発言数")
+    parser.add_argument("--latency", type=float, default=0.05, help="モックサーバーの平均応答遅延（秒）")
+    parser.add_argument("--jitter", type=float, default=0.02, help="モックサーバーの応答遅延のばらつき（秒）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="モックサーバーのエラー応答の確率")
+    parser.add_argument("--chunk-delay", type=float, default=0.0,
+                        help="モックサーバーの応答の断片（16文字）ごとの遅延（秒、生成の速さの代わり）")
+    parser.add_argument("--quick", action="store_true", help="小さいサイズ・少ない回数で動作確認する")
+    parser.add_argument("--verbose", action="store_true", help="測定中の処理のログを表示する")
+    parser.add_argument("--save-baseline", help="結果をベースラインとして保存するJSONファイル")
+    parser.add_argument("--compare", help="比較するベースラインのJSONファイル")
+    parser.add_argument("--threshold", type=float, default=0.2, help="悪化とみなす変化率（デフォルト: 0.2 = 20%%）")
+    args = parser.parse_args(argv)
+
+    if args.quick:
+        args.sizes, args.concurrency, args.iterations = [10], [1, 2], 3
+
+    behavior = MockBehavior(args.latency, args.jitter, args.error_rate, retry_after=0.05, seed=0, chunk_delay=args.chunk_delay)
+    server = start_mock_server(behavior)
+    workdir = Path(tempfile.mkdtemp(prefix="well-scenario-bench-"))
+    bench = Benchmark(server.base_url, workdir, args.annotation_workers, args.batch_size)
+
+    results: Dict[str, Dict[str, float]] = {}
+    print(f"{'ケース':<40} {'件/秒':>10} {'p50(秒)':>10} {'p95(秒)':>10} {'メモリ(MB)':>12}")
+    try:
+        for case in [c.strip() for c in args.cases.split(",") if c.strip()]:
+            for size in args.sizes:
+                operation = bench.operation(case, size)
+                for concurrency in args.concurrency:
+                    key = f"{case}[size={size},concurrency={concurrency}]"
+                    # 生成・保存ごとのログで結果の表が読みにくくならないよう、測定中の標準出力は捨てる
+                    with contextlib.redirect_stdout(sys.stdout if args.verbose else io.StringIO()):
+                        results[key] = measure(operation, args.iterations, concurrency)
+                    r = results[key]
+                    print(f"{key:<40} {r['throughput']:>10} {r['p50']:>10} {r['p95']:>10} {r['peak_memory_mb']:>12}")
+    finally:
+        server.shutdown()
+
+    settings = {
+        "latency": args.latency,
+        "jitter": args.jitter,
+        "error_rate": args.error_rate,
+        "chunk_delay": args.chunk_delay,
+        "iterations": args.iterations,
+        "annotation_workers": args.annotation_workers,
+        "batch_size": args.batch_size,
+    }
+    print(f"\nモックサーバーへのリクエスト数: {behavior.requests}（エラー応答: {behavior.errors}）")
+
+    if args.save_baseline:
+        Path(args.save_baseline).parent.mkdir(parents=True, exist_ok=True)
+        write_json_atomic(Path(args.save_baseline), {
+            "created_at": datetime.now().isoformat(),
+            "settings": settings,
+            "results": results
+        })
+        print(f"ベースラインを保存しました: {args.save_baseline}")
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        if baseline.get("settings") != settings:
+            print(f"警告: ベースラインと測定条件が異なります: {baseline.get('settings')}")
+        regressions = compare(results, baseline.get("results", {}), args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)}件の項目が{args.threshold:.0%}以上悪化しました")
+            return 1
+        print("\nベースラインからの悪化はありません")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
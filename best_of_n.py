@@ -0,0 +1,238 @@
+"""
+best_of_n.py
+重点指標の目標割合に近いシナリオを、複数の候補から選んで生成するモジュール（Best-of-N）
+
+1回の生成では重点指標の高スコア（7-9）発言の割合が目標から外れることが多いため、
+- 同じ設定で候補番号だけを変えたN個の候補を並行して生成し、
+- 各候補の一部の発言（等間隔に選んだ sample_size 発言）を安価なモデル（代理の MetricAnnotator）で評価して、
+- 高スコア発言の割合と目標割合の差が最も小さい候補を選ぶ。
+差が許容幅（tolerance）以内の候補が見つかった時点で、残りの候補の生成を打ち切る。
+選んだ候補だけを本来のアノテーションモデルで全発言評価する（generation_pipeline の selector）。
+"""
+import contextvars
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import telemetry
+from analytics import HIGH_SCORE_THRESHOLD
+from metric_annotator import MetricAnnotator
+from scenario_generator import ScenarioGenerator
+
+
+class CandidateCancelled(Exception):
+    """他の候補が許容幅に入ったため、候補の生成を打ち切った"""
+
+
+def sample_indices(num_utterances: int, sample_size: int) -> List[int]:
+    """代理評価する発言のインデックス（等間隔、sample_size が0以下または発言数以上の場合は全発言）"""
+    if sample_size <= 0 or sample_size >= num_utterances:
+        return list(range(num_utterances))
+    step = num_utterances / sample_size
+    return [int(i * step + step / 2) for i in range(sample_size)]
+
+
+def high_ratios(annotated: List[Dict[str, Any]], focus_metrics: List[str]) -> Dict[str, Optional[float]]:
+    """重点指標ごとの高スコア（7-9）発言の割合（%、評価できた発言がない指標はNone）"""
+    ratios: Dict[str, Optional[float]] = {}
+    for metric in focus_metrics:
+        scores = []
+        for utt in annotated:
+            value = (utt.get("metrics") or {}).get(metric)
+            score = value.get("score") if isinstance(value, dict) else None
+            if isinstance(score, (int, float)) and not isinstance(score, bool):
+                scores.append(score)
+        ratios[metric] = (
+            round(100 * sum(1 for s in scores if s >= HIGH_SCORE_THRESHOLD) / len(scores), 1) if scores else None
+        )
+    return ratios
+
+
+def target_gap(annotated: List[Dict[str, Any]], focus_metrics: List[str], target_ratio: int) -> Optional[float]:
+    """高スコア発言の割合と目標割合の差（重点指標の平均、%ポイント。評価できた発言がない場合はNone）"""
+    ratios = [r for r in high_ratios(annotated, focus_metrics).values() if r is not None]
+    if not ratios:
+        return None
+    return round(sum(abs(r - target_ratio) for r in ratios) / len(ratios), 1)
+
+
+class CandidateSelector:
+    """N個の候補を並行して生成し、代理評価で目標割合に最も近い候補を選ぶ"""
+
+    def __init__(
+        self,
+        generator: ScenarioGenerator,
+        proxy_annotator: MetricAnnotator,
+        candidates: int = 3,
+        tolerance: float = 10.0,
+        sample_size: int = 12
+    ):
+        """
+        Args:
+            generator: 候補の生成に使う ScenarioGenerator（stream の場合は発言ごとに打ち切りを確認する）
+            proxy_annotator: 代理評価に使う MetricAnnotator（安価なモデル）
+            candidates: 候補数（同時に生成する数）
+            tolerance: 早期終了する目標割合との差（%ポイント）
+            sample_size: 代理評価する発言数（0以下の場合は全発言）
+        """
+        self.generator = generator
+        self.proxy_annotator = proxy_annotator
+        self.candidates = max(1, candidates)
+        self.tolerance = tolerance
+        self.sample_size = sample_size
+
+    def _generate_candidate(
+        self,
+        variant: int,
+        base_variant: int,
+        stop: threading.Event,
+        profiles: List[Dict[str, Any]],
+        meeting_purpose: str,
+        meeting_format: str,
+        num_utterances: int,
+        focus_metrics: List[str],
+        target_ratio: int
+    ) -> Tuple[List[Dict[str, str]], Dict[str, Any]]:
+        """候補を1つ生成して代理評価する（打ち切られた場合は CandidateCancelled）"""
+        scenario: List[Dict[str, str]] = []
+        generation = self.generator.iter_generation(
+            profiles, meeting_purpose, meeting_format, num_utterances, focus_metrics, target_ratio,
+            base_variant + variant
+        )
+        try:
+            for kind, data in generation:
+                if stop.is_set():
+                    raise CandidateCancelled()
+                if kind == "utterance":
+                    scenario.append(data)
+        finally:
+            # ストリーミング中に閉じた場合は応答の受信もやめる
+            generation.close()
+        if not scenario:
+            raise ValueError("シナリオの生成に失敗しました")
+        if stop.is_set():
+            raise CandidateCancelled()
+
+        with telemetry.stage("proxy_annotation"):
+            sampled = [
+                annotated for _, annotated in self.proxy_annotator.iter_annotations(
+                    scenario, meeting_purpose, meeting_format,
+                    indices=sample_indices(len(scenario), self.sample_size), metrics=focus_metrics
+                )
+            ]
+        return scenario, {
+            "variant": variant,
+            "gap": target_gap(sampled, focus_metrics, target_ratio),
+            "high_ratio": high_ratios(sampled, focus_metrics),
+        }
+
+    def select(
+        self,
+        profiles: List[Dict[str, Any]],
+        meeting_purpose: str,
+        meeting_format: str,
+        num_utterances: int,
+        focus_metrics: List[str],
+        target_ratio: int,
+        variant: int = 0
+    ) -> Tuple[List[Dict[str, str]], Dict[str, Any]]:
+        """
+        候補を並行して生成し、目標割合に最も近い候補を選ぶ
+
+        variant（同じ設定で繰り返し生成する場合の番号）ごとに別の候補番号の範囲
+        （variant * candidates から candidates 個）で生成するため、繰り返しても同じ候補（応答キャッシュ）にならない。
+
+        Returns:
+            (選んだ候補のシナリオ（metricsなし）, 選択の記録)
+            選択の記録: {"candidates", "tolerance", "proxy_model", "sample_size", "selected"（候補番号）,
+                        "early_stop", "scored": [{"variant", "gap", "high_ratio"}, ...], "cancelled", "errors"}
+
+        Raises:
+            ValueError: どの候補も生成できなかった場合
+        """
+        stop = threading.Event()
+        scored: List[Dict[str, Any]] = []
+        scenarios: Dict[int, List[Dict[str, str]]] = {}
+        errors: List[Dict[str, Any]] = []
+        cancelled = 0
+        early_stop = False
+
+        variant_base = max(0, variant) * self.candidates
+        executor = ThreadPoolExecutor(max_workers=self.candidates)
+        try:
+            # トレース（contextvars）を候補ごとのスレッドへ引き継ぐ
+            pending = {
+                executor.submit(
+                    contextvars.copy_context().run, self._generate_candidate, variant, variant_base, stop,
+                    profiles, meeting_purpose, meeting_format, num_utterances, focus_metrics, target_ratio
+                ): variant
+                for variant in range(self.candidates)
+            }
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    variant = pending.pop(future)
+                    try:
+                        scenario, score = future.result()
+                    except CandidateCancelled:
+                        cancelled += 1
+                        continue
+                    except Exception as e:
+                        print(f"警告: 候補{variant + 1}の生成に失敗しました: {e}")
+                        errors.append({"variant": variant, "error": str(e)})
+                        continue
+                    scenarios[variant] = scenario
+                    scored.append(score)
+                    if score["gap"] is not None and score["gap"] <= self.tolerance and not stop.is_set():
+                        early_stop = True
+                        stop.set()
+        finally:
+            stop.set()
+            executor.shutdown(wait=True, cancel_futures=True)
+
+        if not scored:
+            raise ValueError("シナリオの生成に失敗しました（全ての候補が失敗しました）")
+        # 代理評価できなかった候補（gapがNone）は最後に回す。差が同じなら先に生成できた候補
+        best = min(scored, key=lambda s: (s["gap"] is None, s["gap"] or 0.0))
+        report = {
+            "candidates": self.candidates,
+            "tolerance": self.tolerance,
+            "proxy_model": self.proxy_annotator.model_name,
+            "sample_size": self.sample_size,
+            "selected": best["variant"],
+            "early_stop": early_stop,
+            "scored": scored,
+            "cancelled": cancelled,
+            "errors": errors,
+        }
+        print(
+            f"候補{best['variant'] + 1}を選択しました（目標との差 {best['gap']}%ポイント、"
+            f"評価{len(scored)}件・打ち切り{cancelled}件・失敗{len(errors)}件）"
+        )
+        return scenarios[best["variant"]], report
+
+    def iter_generation(
+        self,
+        profiles: List[Dict[str, Any]],
+        meeting_purpose: str,
+        meeting_format: str,
+        num_utterances: int = 40,
+        focus_metrics: List[str] = None,
+        target_ratio: int = 50,
+        variant: int = 0
+    ) -> Iterator[Tuple[str, Any]]:
+        """
+        ScenarioGenerator.iter_generation の代わりに使うジェネレータ（generation_pipeline の selector）
+
+        Yields:
+            ("selection", 選択の記録) … 候補の選択完了時
+            ("utterance", 発言) … 選んだ候補の発言（発言順）
+            ("segment", 選んだ候補の発言のリスト) … 最後に1回
+        """
+        scenario, report = self.select(
+            profiles, meeting_purpose, meeting_format, num_utterances, focus_metrics, target_ratio, variant
+        )
+        yield "selection", report
+        for utt in scenario:
+            yield "utterance", utt
+        yield "segment", scenario
@@ -0,0 +1,84 @@
+"""
+config_cache.py
+指標定義（extra.json）・プロフィールJSONを読み込んでメモリに保持し、ファイルが更新された場合だけ読み直すモジュール
+
+ScenarioGenerator・MetricAnnotator・APIエンドポイントで1つのキャッシュを共有し、
+ファイルの変更（mtime・サイズ）を検出すると解析済みの内容とETagをまとめて差し替える。
+"""
+import hashlib
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Any, Dict, NamedTuple, Tuple
+
+
+class ConfigEntry(NamedTuple):
+    """解析済みの設定ファイル（内容を書き換えずに参照すること）"""
+    data: Any
+    etag: str  # 内容のハッシュ（条件付きGETのETagに使う）
+    signature: Tuple[int, int, int]
+
+
+class ConfigCache:
+    """設定ファイル（JSON）の解析結果をファイルの更新を検出しながらキャッシュするクラス"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries: Dict[str, ConfigEntry] = {}
+        self._invalid: Dict[str, Tuple[int, int, int]] = {}  # 解析に失敗したファイルの状態
+        self.hits = 0
+        self.loads = 0
+
+    def get(self, path: str) -> ConfigEntry:
+        """
+        解析済みの設定ファイルを取得（前回から更新されていれば読み直す）
+
+        Raises:
+            FileNotFoundError: ファイルが存在しない場合
+            ValueError: JSONとして解析できず、前回読み込んだ内容もない場合
+        """
+        key = str(Path(path).resolve())
+        signature = self._signature(path)
+
+        with self._lock:
+            previous = self._entries.get(key)
+            if previous is not None and signature in (previous.signature, self._invalid.get(key)):
+                self.hits += 1
+                return previous
+
+        with open(path, 'rb') as f:
+            raw = f.read()
+        try:
+            data = json.loads(raw.decode('utf-8'))
+        except (UnicodeDecodeError, json.JSONDecodeError) as e:
+            if previous is None:
+                raise ValueError(f"設定ファイルをJSONとして解析できませんでした: {path}: {e}")
+            # 編集途中のファイルなどは、再び更新されるまで前回の内容を使い続ける
+            print(f"警告: {path} をJSONとして解析できませんでした。前回読み込んだ内容を使用します: {e}")
+            with self._lock:
+                self._invalid[key] = signature
+            return previous
+
+        entry = ConfigEntry(data, hashlib.sha256(raw).hexdigest()[:32], signature)
+        with self._lock:
+            # 解析を終えてから差し替えるため、読み込み途中の内容が他のスレッドに見えることはない
+            self._entries[key] = entry
+            self._invalid.pop(key, None)
+            self.loads += 1
+        return entry
+
+    def load(self, path: str) -> Any:
+        """解析済みの内容だけを取得"""
+        return self.get(path).data
+
+    def stats(self) -> Dict[str, Any]:
+        """キャッシュの統計情報"""
+        with self._lock:
+            return {"files": len(self._entries), "hits": self.hits, "loads": self.loads}
+
+    @staticmethod
+    def _signature(path: str) -> Tuple[int, int, int]:
+        stat = os.stat(path)
+        return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
@@ -0,0 +1,128 @@
+"""
+conftest.py
+テスト共通のフィクスチャ（出力JSON・人手アノテーション用CSVの作成、APIを呼ばないアノテーター）
+"""
+import json
+import random
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from llm_client import LLMClient
+from metric_annotator import METRIC_NAMES, MetricAnnotator
+from output_store import build_output_data
+
+def _fake_annotation(target):
+    """評価対象の発言（"発言者: 発言内容"）から決まるスコア（長さ % 10）"""
+    score = len(target) % 10
+    return {m: {"score": score, "reason": target} for m in METRIC_NAMES}
+
+
+class FakeCompletions:
+    """chat.completions.create の代わりに、評価対象の発言から決定的なスコアを返す"""
+
+    def __init__(self, delay=0.0, fail_on=None):
+        self.delay = delay
+        self.fail_on = fail_on  # この文字列で終わるプロンプトは常に失敗させる
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def create(self, **kwargs):
+        with self.lock:
+            self.calls.append(kwargs)
+        if self.delay:
+            time.sleep(random.uniform(0, self.delay))
+        prompt = kwargs['messages'][-1]['content']
+        if self.fail_on and prompt.endswith(self.fail_on):
+            raise ConnectionError("simulated failure")
+        if '【評価対象の発言（発言順）】' in prompt:
+            block = prompt.split('【評価対象の発言（発言順）】\n', 1)[1].split('\n\n', 1)[0]
+            result = {}
+            for line in block.split('\n'):
+                index, target = line[1:].split('] ', 1)
+                # 最後の発言はバッチ応答から欠落させる
+                if int(index) < len(block.split('\n')) - 1:
+                    result[index] = _fake_annotation(target)
+        else:
+            target = prompt.split('【評価対象の発言】\n', 1)[1].split('\n', 1)[0]
+            result = _fake_annotation(target)
+        message = SimpleNamespace(content=json.dumps(result, ensure_ascii=False), refusal=None)
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+
+@pytest.fixture
+def fake_annotation():
+    return _fake_annotation
+
+
+@pytest.fixture
+def make_annotator():
+    """FakeCompletions で評価する MetricAnnotator を作る make_annotator(cache, fail_on, **kwargs) -> (annotator, completions)"""
+
+    def make(cache=None, fail_on=None, **kwargs):
+        llm_client = LLMClient("dummy", cache=cache)
+        completions = FakeCompletions(delay=0.01, fail_on=fail_on)
+        llm_client.client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+        annotator = MetricAnnotator("dummy", "fake-model", "data/extra.json", llm_client=llm_client, **kwargs)
+        return annotator, completions
+
+    return make
+
+
+@pytest.fixture
+def sample_scenario():
+    """話者0〜2が順に発言する、長さの異なる発言のシナリオ sample_scenario(n)"""
+
+    def sample(n=12):
+        return [{"speaker": f"話者{i % 3}", "text": "発言" * (i + 1)} for i in range(n)]
+
+    return sample
+
+
+@pytest.fixture
+def scored_scenario():
+    """
+    発言iの指標のスコアが scores[i] のシナリオ scored_scenario(scores, metric, speakers, text)
+
+    speakers が1の場合の発言者は "話者"、2以上の場合は "話者{i % speakers}"。text は "{}" に発言番号が入る。
+    """
+
+    def scored(scores, metric="威圧度", speakers=1, text="発言{}"):
+        return [
+            {
+                "speaker": "話者" if speakers == 1 else f"話者{i % speakers}",
+                "text": text.format(i),
+                "metrics": {metric: {"score": score, "reason": ""}},
+            }
+            for i, score in enumerate(scores)
+        ]
+
+    return scored
+
+
+@pytest.fixture
+def write_output():
+    """アノテーション済みのシナリオを出力JSON（build_output_data の形式）として書き込む"""
+
+    def write(path, scenario, focus_metrics=("威圧度",), target_ratio=30, annotation_model="ann-model",
+              scenario_model="gen-model", profile_filename="テスト.json", **kwargs):
+        data = build_output_data(scenario, "目的", "形式", profile_filename, list(focus_metrics), target_ratio,
+                                 scenario_model, annotation_model, True, **kwargs)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+        return data
+
+    return write
+
+
+@pytest.fixture
+def write_sheet():
+    """人手アノテーション用CSV（BOM付きUTF-8）を書き込む。rows は "発言内容,威圧度,逸脱度,発言無効度,偏り度" の行"""
+
+    def write(path, rows):
+        lines = ["Speaker,Content," + ",".join(METRIC_NAMES)] + [f"話者,{row}" for row in rows]
+        path.write_bytes(("\n".join(lines) + "\n").encode("utf-8-sig"))
+
+    return write
@@ -0,0 +1,415 @@
+"""
+corpus_export.py
+保存済みシナリオ（data/outputs/**/*.json）を、1発言1行の列指向データセットに書き出すモジュール（CLIとしても実行可能）
+
+使用例:
+    python corpus_export.py                       # data/outputs → data/corpus（追加・変更されたファイルだけ読み込む）
+    python corpus_export.py --full --parquet      # 全件を読み直し、corpus.parquet も書き出す（pyarrowが必要）
+
+出力（data/corpus/）:
+    manifest.json        列の一覧・行数・読み込み済みファイルの状態（増分更新に使う）
+    v{バージョン}/*.npy   1列1ファイルのNumPy配列（np.load(mmap_mode="r") でメモリマップして読める）
+
+読み込み:
+    from corpus_export import load_corpus
+    corpus = load_corpus("data/corpus")
+    corpus["machine.威圧度"]        # float32の配列（評価なしはNaN）
+    corpus.to_pandas()             # pandas.DataFrame
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from dotenv import load_dotenv
+
+from annotation_store import AnnotationStore, edit_log_path
+from output_store import write_json_atomic
+
+
+MANIFEST_FILENAME = "manifest.json"
+FORMAT_VERSION = 2
+
+# 列の種類
+#   category: 値の種類が少ない文字列（int32のコード + manifestの語彙）
+#   string:   任意の文字列（UTF-8のバイト列 + int64のオフセット）
+#   int32 / float32 / int8: 数値（欠損はfloat32ならNaN、int8なら-1）
+BASE_COLUMNS = [
+    ("scenario_id", "category"),
+    ("turn", "int32"),
+    ("speaker", "category"),
+    ("text", "string"),
+    ("annotation_error", "int8"),
+    ("generated_at", "category"),
+    ("meeting_purpose", "category"),
+    ("meeting_format", "category"),
+    ("profile_filename", "category"),
+    ("focus_metrics", "category"),
+    ("target_ratio", "float32"),
+    ("scenario_model", "category"),
+    ("annotation_model", "category"),
+    ("sanitize_mode", "int8"),
+]
+
+
+def _score(value: Any) -> float:
+    """{"score": 5, ...} または数値からスコアを取り出す（ない場合はNaN）"""
+    if isinstance(value, dict):
+        value = value.get("score")
+    try:
+        return float(value) if value is not None else float("nan")
+    except (TypeError, ValueError):
+        return float("nan")
+
+
+def _machine_score(value: Any, local: bool) -> float:
+    """機械アノテーションのスコア（ローカル評価モデルの推定はLLMの評価ではないためNaN）"""
+    if local or (isinstance(value, dict) and value.get("source") == "local"):
+        return float("nan")
+    return _score(value)
+
+
+def flatten_output(scenario_id: str, data: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """出力JSON1件を1発言1行の辞書のリストにする"""
+    metadata = data.get("metadata", {})
+    focus_metrics = metadata.get("focus_metrics") or []
+    if isinstance(focus_metrics, str):
+        focus_metrics = [focus_metrics]
+    target_ratio = metadata.get("target_ratio")
+    sanitize_mode = metadata.get("sanitize_mode")
+
+    shared = {
+        "scenario_id": scenario_id,
+        "generated_at": metadata.get("generated_at", ""),
+        "meeting_purpose": metadata.get("meeting_purpose", ""),
+        "meeting_format": metadata.get("meeting_format", ""),
+        "profile_filename": metadata.get("profile_filename", ""),
+        "focus_metrics": ",".join(focus_metrics),
+        "target_ratio": float(target_ratio) if target_ratio is not None else float("nan"),
+        "scenario_model": metadata.get("scenario_model") or metadata.get("model", ""),
+        "annotation_model": metadata.get("annotation_model") or metadata.get("model", ""),
+        "sanitize_mode": -1 if sanitize_mode is None else int(bool(sanitize_mode)),
+    }
+
+    rows = []
+    for turn, utt in enumerate(data.get("scenario", [])):
+        if not isinstance(utt, dict):
+            continue
+        machine = utt.get("machine_annotations", utt.get("metrics")) or {}
+        human = utt.get("human_annotations") or {}
+        local = utt.get("annotation_tier") == "local"
+        rows.append({
+            **shared,
+            "turn": turn,
+            "speaker": utt.get("speaker", ""),
+            "text": utt.get("text", ""),
+            # ローカル評価で補った発言（annotation_tier が "local"）もLLMで評価できなかった発言として扱う
+            "annotation_error": int("annotation_error" in utt or local),
+            # ローカル評価モデルの推定は集計・一致度・学習で機械アノテーションとして数えない
+            "machine": {name: _machine_score(value, local) for name, value in machine.items()},
+            "human": {name: _score(value) for name, value in human.items()},
+        })
+    return rows
+
+
+class Corpus:
+    """書き出した列指向データセット（列名で配列を取得する）"""
+
+    def __init__(self, corpus_dir: Path, manifest: Dict[str, Any], mmap: bool = True):
+        self.corpus_dir = Path(corpus_dir)
+        self.manifest = manifest
+        self._version_dir = self.corpus_dir / manifest["version"]
+        self._mmap_mode = "r" if mmap else None
+        self._cache: Dict[str, Any] = {}
+
+    def __len__(self) -> int:
+        return self.manifest["num_rows"]
+
+    @property
+    def columns(self) -> List[str]:
+        return [column["name"] for column in self.manifest["columns"]]
+
+    @property
+    def metrics(self) -> List[str]:
+        return self.manifest["metrics"]
+
+    def __getitem__(self, name: str) -> Any:
+        """
+        列を取得
+
+        数値列はNumPy配列（メモリマップ）、category列は文字列のNumPy配列（object）、
+        string列は文字列のリストを返す。category列のコードは codes(name) で取得できる。
+        """
+        if name not in self._cache:
+            column = self._column(name)
+            if column["type"] == "category":
+                vocabulary = np.array(column["vocabulary"], dtype=object)
+                self._cache[name] = vocabulary[self.codes(name)] if len(self) else vocabulary[:0]
+            elif column["type"] == "string":
+                data = self._load(column["file"])
+                offsets = self._load(column["offsets_file"])
+                raw = bytes(data)
+                self._cache[name] = [raw[offsets[i]:offsets[i + 1]].decode("utf-8") for i in range(len(self))]
+            else:
+                self._cache[name] = self._load(column["file"])
+        return self._cache[name]
+
+    def codes(self, name: str) -> np.ndarray:
+        """category列のコード（vocabulary(name) のインデックス）"""
+        return self._load(self._column(name)["file"])
+
+    def vocabulary(self, name: str) -> List[str]:
+        """category列の語彙"""
+        return self._column(name)["vocabulary"]
+
+    def to_pandas(self):
+        """pandas.DataFrameに変換（category列はpandasのCategorical）"""
+        import pandas as pd
+
+        frame = {}
+        for column in self.manifest["columns"]:
+            if column["type"] == "category":
+                frame[column["name"]] = pd.Categorical.from_codes(self.codes(column["name"]), column["vocabulary"])
+            else:
+                frame[column["name"]] = self[column["name"]]
+        return pd.DataFrame(frame)
+
+    def _column(self, name: str) -> Dict[str, Any]:
+        for column in self.manifest["columns"]:
+            if column["name"] == name:
+                return column
+        raise KeyError(name)
+
+    def _load(self, filename: str) -> np.ndarray:
+        return np.load(self._version_dir / filename, mmap_mode=self._mmap_mode)
+
+
+def load_corpus(corpus_dir: str = "data/corpus", mmap: bool = True) -> Corpus:
+    """書き出したデータセットを読み込む（mmap=Trueの場合、配列はアクセスした部分だけディスクから読まれる）"""
+    corpus_dir = Path(corpus_dir)
+    with open(corpus_dir / MANIFEST_FILENAME, 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+    if manifest.get("format_version") != FORMAT_VERSION:
+        raise ValueError(f"対応していない形式のデータセットです: {corpus_dir}")
+    return Corpus(corpus_dir, manifest, mmap=mmap)
+
+
+class CorpusExporter:
+    """出力ディレクトリの変更を検出し、追加・変更されたファイルだけを読み込んでデータセットを書き直すクラス"""
+
+    def __init__(self, outputs_dir: str, corpus_dir: str, store: Optional[AnnotationStore] = None):
+        """
+        Args:
+            outputs_dir: 出力JSONのディレクトリ（サブディレクトリを含む）
+            corpus_dir: データセットの書き出し先
+            store: 出力JSONの読み込みに使うAnnotationStore（未反映の人手アノテーションを含めて読む）
+        """
+        self.outputs_dir = Path(outputs_dir)
+        self.corpus_dir = Path(corpus_dir)
+        self.store = store or AnnotationStore()
+        # 同じインスタンスを複数の集計（/api/analytics・/api/agreement）で共有しても同時に書き出さない
+        self._lock = threading.Lock()
+
+    def export(self, full: bool = False) -> Dict[str, Any]:
+        """
+        データセットを更新する
+
+        Args:
+            full: Trueの場合は前回の結果を使わず全ファイルを読み直す
+
+        Returns:
+            {"rows", "files", "added", "changed", "removed", "seconds"}
+        """
+        with self._lock:
+            return self._export(full)
+
+    def _export(self, full: bool) -> Dict[str, Any]:
+        start = time.perf_counter()
+        previous = None if full else self._load_previous()
+        previous_files = previous.manifest["files"] if previous else {}
+
+        current = self._scan()
+        unchanged = {sid for sid, signature in current.items()
+                     if sid in previous_files and previous_files[sid]["signature"] == signature}
+        to_read = [sid for sid in current if sid not in unchanged]
+        removed = [sid for sid in previous_files if sid not in current]
+        if previous and not to_read and not removed:
+            return {"rows": len(previous), "files": len(previous_files), "added": 0, "changed": 0, "removed": 0,
+                    "seconds": round(time.perf_counter() - start, 3)}
+
+        # 変更のないファイルは前回のデータセットから行を取り出し、それ以外のファイルだけJSONを解析する
+        rows_by_file: Dict[str, List[Dict[str, Any]]] = {}
+        if previous and unchanged:
+            rows_by_file.update(self._rows_from_previous(previous, unchanged))
+        skipped = []
+        for sid in to_read:
+            try:
+                data = self.store.load(self.outputs_dir / f"{sid}.json")
+            except (OSError, ValueError) as e:
+                print(f"警告: {sid}.json を読み込めませんでした: {e}")
+                skipped.append(sid)
+                continue
+            if not isinstance(data, dict) or not isinstance(data.get("scenario"), list):
+                skipped.append(sid)
+                continue
+            rows_by_file[sid] = flatten_output(sid, data)
+
+        files = {
+            sid: {"signature": current[sid], "rows": len(rows_by_file[sid])}
+            for sid in sorted(rows_by_file)
+        }
+        self._write([row for sid in files for row in rows_by_file[sid]], files)
+
+        return {
+            "rows": sum(info["rows"] for info in files.values()),
+            "files": len(files),
+            "added": sum(1 for sid in to_read if sid not in previous_files and sid not in skipped),
+            "changed": sum(1 for sid in to_read if sid in previous_files and sid not in skipped),
+            "removed": len(removed),
+            "seconds": round(time.perf_counter() - start, 3),
+        }
+
+    def _scan(self) -> Dict[str, List[Any]]:
+        """出力JSONごとの状態（JSONと未反映の編集ログのmtime・サイズ）"""
+        signatures = {}
+        for path in sorted(self.outputs_dir.rglob("*.json")):
+            if path.name.startswith("."):
+                continue
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            signature = [stat.st_mtime_ns, stat.st_size]
+            log_path = edit_log_path(path)
+            if log_path.exists():
+                log_stat = log_path.stat()
+                signature += [log_stat.st_mtime_ns, log_stat.st_size]
+            signatures[path.relative_to(self.outputs_dir).with_suffix("").as_posix()] = signature
+        return signatures
+
+    def _load_previous(self) -> Optional[Corpus]:
+        try:
+            return load_corpus(str(self.corpus_dir), mmap=True)
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def _rows_from_previous(self, previous: Corpus, scenario_ids: List[str]) -> Dict[str, List[Dict[str, Any]]]:
+        """前回のデータセットから指定したシナリオの行を復元する"""
+        wanted = set(scenario_ids)
+        columns = {name: previous[name] for name, _ in BASE_COLUMNS}
+        machine = {m: previous[f"machine.{m}"] for m in previous.metrics}
+        human = {m: previous[f"human.{m}"] for m in previous.metrics}
+
+        rows_by_file: Dict[str, List[Dict[str, Any]]] = {}
+        start = 0
+        for sid, info in previous.manifest["files"].items():
+            end = start + info["rows"]
+            if sid in wanted:
+                rows = rows_by_file.setdefault(sid, [])
+                for i in range(start, end):
+                    row = {name: columns[name][i] for name, _ in BASE_COLUMNS}
+                    row["machine"] = {m: float(values[i]) for m, values in machine.items() if not np.isnan(values[i])}
+                    row["human"] = {m: float(values[i]) for m, values in human.items() if not np.isnan(values[i])}
+                    rows.append(row)
+            start = end
+        return rows_by_file
+
+    def _write(self, rows: List[Dict[str, Any]], files: Dict[str, Any]) -> None:
+        """新しいバージョンのディレクトリに列を書き出し、manifestを差し替えてから古いバージョンを消す"""
+        # 読み込み（load_corpus）だけの利用でOpenAIクライアントまで読み込まないよう、書き出し時に読み込む
+        from metric_annotator import METRIC_NAMES
+
+        metrics = list(METRIC_NAMES)
+        for row in rows:
+            for name in list(row["machine"]) + list(row["human"]):
+                if name not in metrics:
+                    metrics.append(name)
+
+        version = f"v{time.time_ns()}"
+        version_dir = self.corpus_dir / version
+        version_dir.mkdir(parents=True)
+
+        columns = []
+        for index, (name, kind) in enumerate(BASE_COLUMNS):
+            columns.append(self._write_column(version_dir, f"c{index:02d}", name, kind, [row[name] for row in rows]))
+        for source in ("machine", "human"):
+            for metric in metrics:
+                name = f"{source}.{metric}"
+                values = [row[source].get(metric, float("nan")) for row in rows]
+                columns.append(self._write_column(version_dir, f"c{len(columns):02d}", name, "float32", values))
+
+        manifest = {
+            "format_version": FORMAT_VERSION,
+            "version": version,
+            "num_rows": len(rows),
+            "metrics": metrics,
+            "columns": columns,
+            "files": files,
+        }
+        # manifestの差し替えで新しいバージョンに切り替わる（読み込み中の利用者は古いファイルを開いたまま読める）
+        write_json_atomic(self.corpus_dir / MANIFEST_FILENAME, manifest)
+
+        for old_dir in self.corpus_dir.glob("v*"):
+            if old_dir.is_dir() and old_dir.name != version:
+                shutil.rmtree(old_dir, ignore_errors=True)
+
+    @staticmethod
+    def _write_column(version_dir: Path, file_stem: str, name: str, kind: str, values: List[Any]) -> Dict[str, Any]:
+        column = {"name": name, "type": kind, "file": f"{file_stem}.npy"}
+        if kind == "category":
+            vocabulary: Dict[str, int] = {}
+            codes = np.array([vocabulary.setdefault(str(v), len(vocabulary)) for v in values], dtype=np.int32)
+            np.save(version_dir / column["file"], codes)
+            column["vocabulary"] = list(vocabulary)
+        elif kind == "string":
+            encoded = [str(v).encode("utf-8") for v in values]
+            offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+            np.cumsum([len(b) for b in encoded], out=offsets[1:])
+            np.save(version_dir / column["file"], np.frombuffer(b"".join(encoded), dtype=np.uint8))
+            column["offsets_file"] = f"{file_stem}.offsets.npy"
+            np.save(version_dir / column["offsets_file"], offsets)
+        else:
+            np.save(version_dir / column["file"], np.array(values, dtype=kind))
+        return column
+
+
+def write_parquet(corpus_dir: str, path: Optional[str] = None) -> Path:
+    """データセットをParquetファイルにも書き出す（pyarrowが必要）"""
+    path = Path(path) if path else Path(corpus_dir) / "corpus.parquet"
+    load_corpus(corpus_dir).to_pandas().to_parquet(path, index=False)
+    return path
+
+
+def main(argv: List[str] = None) -> int:
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description="保存済みシナリオを1発言1行の列指向データセットに書き出す")
+    parser.add_argument("--outputs-dir", default=os.getenv("OUTPUTS_DIR", "data/outputs"), help="出力JSONのディレクトリ")
+    parser.add_argument("--corpus-dir", default=os.getenv("CORPUS_DIR", "data/corpus"), help="データセットの書き出し先")
+    parser.add_argument("--full", action="store_true", help="前回の結果を使わず全ファイルを読み直す")
+    parser.add_argument("--parquet", action="store_true", help="corpus.parquet も書き出す（pyarrowが必要）")
+    args = parser.parse_args(argv)
+
+    summary = CorpusExporter(args.outputs_dir, args.corpus_dir).export(full=args.full)
+    print(
+        f"{summary['files']}ファイル・{summary['rows']}発言を書き出しました"
+        f"（追加{summary['added']}・変更{summary['changed']}・削除{summary['removed']}、{summary['seconds']}秒）"
+    )
+
+    if args.parquet:
+        try:
+            print(f"Parquet: {write_parquet(args.corpus_dir)}")
+        except ImportError as e:
+            print(f"エラー: Parquetの書き出しには pyarrow が必要です（pip install pyarrow）: {e}", file=sys.stderr)
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,224 @@
+"""
+generation_pipeline.py
+シナリオ生成とアノテーションを重ねて実行するモジュール
+
+生成は別スレッドで進め、発言が届くたびにアノテーションを始める。
+- ストリーミング生成（ScenarioGenerator の stream）: 応答の中で発言が1つ閉じるたびにアノテーションを始めるため、
+  1シナリオの所要時間は「生成＋アノテーション」ではなく、ほぼ「生成とアノテーションの長い方」になる
+- 分割生成（ScenarioGenerator の segment_size）: 次の部分を生成している間に生成済みの部分をアノテーションする
+- どちらでもない場合は生成→アノテーションの順に実行するのと同じ
+
+selector（best_of_n.CandidateSelector）を渡した場合は、複数の候補から選んだシナリオだけをアノテーションする
+（候補の選択が終わるまでアノテーションは始まらない）。
+annotation_metrics を渡した場合は、その指標だけを評価する（重点指標だけを評価して呼び出しのトークン数を減らす場合など）。
+"""
+import contextvars
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+import telemetry
+from best_of_n import CandidateSelector
+from metric_annotator import MetricAnnotator, select_metrics
+from scenario_generator import ScenarioGenerator
+
+
+def _produce(
+    generation: Iterator[Tuple[str, Any]],
+    stream: bool,
+    output: queue.Queue,
+    stop: threading.Event
+) -> None:
+    """
+    生成した発言・部分の区切りをキューへ入れる（最後に ("generated", None)、失敗した場合は ("error", 例外)）
+
+    ストリーミングでない場合は、部分の発言と区切りをまとめて1回で入れる
+    （区切りより先にその部分のアノテーション結果が届かないようにするため）。
+    """
+    try:
+        with telemetry.stage("generation"):
+            events = []
+            for event in generation:
+                events.append(event)
+                if stream or event[0] == "segment":
+                    output.put(("generated", events))
+                    events = []
+                if stop.is_set():
+                    return
+        output.put(("generated", None))
+    except Exception as e:
+        output.put(("error", e))
+    finally:
+        generation.close()
+
+
+def iter_generate_and_annotate(
+    generator: ScenarioGenerator,
+    annotator: MetricAnnotator,
+    profiles: List[Dict[str, Any]],
+    meeting_purpose: str,
+    meeting_format: str,
+    num_utterances: int = 40,
+    focus_metrics: Optional[List[str]] = None,
+    target_ratio: int = 50,
+    selector: Optional[CandidateSelector] = None,
+    annotation_metrics: Optional[List[str]] = None,
+    variant: int = 0
+) -> Iterator[Tuple[str, Any]]:
+    """
+    シナリオを生成しながら、生成できた発言から順にアノテーションするジェネレータ
+
+    アノテーションは annotator の batch_size 件ずつ（部分の終わりではそれ未満でも）、
+    max_workers 件まで並行して実行する。各発言のコンテキストは直前の発言（前の部分を含む）。
+    途中でジェネレータを閉じた場合は、生成中の発言の完了後に生成をやめ、実行中のアノテーションの完了を待つ。
+
+    Args:
+        selector: 複数の候補から目標割合に近いシナリオを選ぶ場合の CandidateSelector（focus_metrics がある場合のみ使う）
+        annotation_metrics: 評価する指標（Noneの場合は全指標、MetricAnnotator.annotate_scenario の metrics）
+        variant: 同じ設定で繰り返し生成する場合の番号（ScenarioGenerator.generate_scenario の variant。
+                 番号ごとにプロンプトが変わるため、応答キャッシュから同じシナリオが返らない）
+
+    Yields:
+        ("selection", 選択の記録) … selector で候補を選んだ時（最初の発言より先）
+        ("utterance", (発言のインデックス, 発言)) … 1発言の生成完了時（そのアノテーション結果より必ず先）
+        ("segment", {"start": 開始位置, "utterances": その部分の発言のリスト}) … 部分の生成完了時（分割しない場合は全体で1回）
+        ("annotation", (発言のインデックス, アノテーション付き発言)) … 評価完了時（完了順）
+
+    Raises:
+        ValueError: シナリオを生成できなかった場合、annotation_metrics に未知の指標がある場合
+    """
+    # 未知の指標は生成を始める前に弾く
+    select_metrics(annotation_metrics)
+    events: queue.Queue = queue.Queue()
+    stop = threading.Event()
+    if selector is not None and focus_metrics:
+        generation = selector.iter_generation(
+            profiles, meeting_purpose, meeting_format, num_utterances, focus_metrics, target_ratio, variant
+        )
+    else:
+        generation = generator.iter_generation(
+            profiles, meeting_purpose, meeting_format, num_utterances, focus_metrics, target_ratio, variant
+        )
+    # トレース（contextvars）を生成スレッドへ引き継ぐ
+    producer = threading.Thread(
+        target=contextvars.copy_context().run,
+        args=(_produce, generation, generator.stream, events, stop),
+        daemon=True
+    )
+    executor = ThreadPoolExecutor(max_workers=annotator.max_workers)
+
+    scenario: List[Dict[str, str]] = []
+    waiting: List[int] = []  # バッチがそろうのを待っている発言
+    running = 0
+    annotation_started: Optional[float] = None
+
+    def annotate(indices: List[int]) -> None:
+        nonlocal running, annotation_started
+        if annotation_started is None:
+            annotation_started = time.perf_counter()
+        # 生成が進んでもコンテキスト（直前の発言）は変わらないため、その時点の発言リストを渡せばよい
+        snapshot = list(scenario)
+        future = executor.submit(
+            contextvars.copy_context().run,
+            lambda: list(annotator.iter_annotations(
+                snapshot, meeting_purpose, meeting_format, max_workers=1, indices=indices,
+                focus_metrics=focus_metrics, metrics=annotation_metrics
+            ))
+        )
+        running += 1
+        future.add_done_callback(lambda done: events.put(("annotated", done)))
+
+    producer.start()
+    generating = True
+    try:
+        while generating or running:
+            kind, payload = events.get()
+            if kind == "error":
+                raise payload
+            if kind == "annotated":
+                running -= 1
+                for index, annotated_utt in payload.result():
+                    yield "annotation", (index, annotated_utt)
+                continue
+            if payload is None:
+                generating = False
+                if waiting:
+                    annotate(waiting)
+                    waiting = []
+                continue
+
+            for event, data in payload:
+                if event == "selection":
+                    yield "selection", data
+                elif event == "utterance":
+                    scenario.append(data)
+                    waiting.append(len(scenario) - 1)
+                    yield "utterance", (len(scenario) - 1, data)
+                    if len(waiting) >= annotator.batch_size:
+                        annotate(waiting)
+                        waiting = []
+                else:
+                    # 部分の終わりでは、次の部分を待たずに残りの発言をアノテーションする
+                    if waiting:
+                        annotate(waiting)
+                        waiting = []
+                    yield "segment", {"start": len(scenario) - len(data), "utterances": data}
+    finally:
+        stop.set()
+        executor.shutdown(wait=True, cancel_futures=True)
+        if annotation_started is not None:
+            telemetry.record_stage("annotation", time.perf_counter() - annotation_started)
+
+    if not scenario:
+        raise ValueError("シナリオの生成に失敗しました")
+
+
+def generate_and_annotate(
+    generator: ScenarioGenerator,
+    annotator: MetricAnnotator,
+    profiles: List[Dict[str, Any]],
+    meeting_purpose: str,
+    meeting_format: str,
+    num_utterances: int = 40,
+    focus_metrics: Optional[List[str]] = None,
+    target_ratio: int = 50,
+    on_progress: Optional[Callable[[int, int], None]] = None,
+    selector: Optional[CandidateSelector] = None,
+    on_selection: Optional[Callable[[Dict[str, Any]], None]] = None,
+    annotation_metrics: Optional[List[str]] = None,
+    variant: int = 0
+) -> List[Dict[str, Any]]:
+    """
+    iter_generate_and_annotate を最後まで実行し、アノテーション付きのシナリオ（発言順）を返す
+
+    Args:
+        on_progress: 進捗通知コールバック on_progress(アノテーション済み件数, 全件数)
+                     全件数は生成済みの発言数（生成中は指定した発言数を下回らない）
+        selector, annotation_metrics, variant: iter_generate_and_annotate と同じ
+        on_selection: 候補の選択完了時のコールバック on_selection(選択の記録)
+    """
+    annotated: List[Optional[Dict[str, Any]]] = []
+    done = 0
+    for kind, payload in iter_generate_and_annotate(
+        generator, annotator, profiles, meeting_purpose, meeting_format, num_utterances, focus_metrics, target_ratio,
+        selector, annotation_metrics, variant
+    ):
+        if kind == "segment":
+            continue
+        if kind == "selection":
+            if on_selection:
+                on_selection(payload)
+            continue
+        if kind == "utterance":
+            annotated.append(None)
+        else:
+            index, annotated_utt = payload
+            annotated[index] = annotated_utt
+            done += 1
+        if on_progress:
+            on_progress(done, max(num_utterances, len(annotated)))
+    if on_progress:
+        on_progress(done, len(annotated))
+    return [utt for utt in annotated if utt is not None]
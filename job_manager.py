@@ -0,0 +1,125 @@
+"""
+job_manager.py
+シナリオ生成などの時間のかかる処理をバックグラウンドで実行するジョブ管理モジュール
+"""
+import threading
+import traceback
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+
+class Job:
+    """1件のバックグラウンドジョブの状態を保持するクラス"""
+
+    def __init__(self, job_id: str, params: Dict[str, Any]):
+        self.id = job_id
+        self.params = params
+        self.status = "queued"  # queued → running → completed / failed
+        self.stage = None  # 処理段階（例: "generating", "annotating"）
+        self.progress = {"annotated": 0, "total": 0}
+        self.result = None
+        self.error = None
+        self.created_at = datetime.now().isoformat()
+        self.started_at = None
+        self.finished_at = None
+        self._lock = threading.Lock()
+
+    def set_stage(self, stage: str) -> None:
+        """処理段階を更新"""
+        with self._lock:
+            self.stage = stage
+
+    def update_progress(self, annotated: int, total: int) -> None:
+        """アノテーション済み発言数を更新"""
+        with self._lock:
+            self.progress = {"annotated": annotated, "total": total}
+
+    def to_dict(self, include_result: bool = True) -> Dict[str, Any]:
+        """JSONレスポンス用の辞書に変換"""
+        with self._lock:
+            data = {
+                "job_id": self.id,
+                "status": self.status,
+                "stage": self.stage,
+                "progress": dict(self.progress),
+                "params": self.params,
+                "created_at": self.created_at,
+                "started_at": self.started_at,
+                "finished_at": self.finished_at,
+            }
+            if self.error is not None:
+                data["error"] = self.error
+            if include_result and self.result is not None:
+                data["result"] = self.result
+            return data
+
+
+class JobManager:
+    """ワーカープールでジョブを実行し、状態を問い合わせ可能にするクラス"""
+
+    def __init__(self, max_workers: int = 2, max_finished_jobs: int = 100):
+        """
+        Args:
+            max_workers: 同時に実行するジョブ数
+            max_finished_jobs: 保持する完了済みジョブの最大数（超過時は古いものから破棄）
+        """
+        self.max_workers = max(1, max_workers)
+        self.max_finished_jobs = max_finished_jobs
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="job")
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, func: Callable[[Job], Any], params: Optional[Dict[str, Any]] = None) -> Job:
+        """
+        ジョブを登録してバックグラウンドで実行する
+
+        Args:
+            func: Jobを引数に取り、結果（JSONシリアライズ可能な値）を返す関数
+            params: ジョブのパラメータ（状態表示用）
+
+        Returns:
+            登録されたJob
+        """
+        job = Job(uuid.uuid4().hex, params or {})
+        with self._lock:
+            self._jobs[job.id] = job
+            self._prune()
+        self._executor.submit(self._run, job, func)
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        """ジョブIDからJobを取得"""
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list_jobs(self) -> List[Job]:
+        """全ジョブを新しい順に取得"""
+        with self._lock:
+            return list(reversed(self._jobs.values()))
+
+    def _run(self, job: Job, func: Callable[[Job], Any]) -> None:
+        with job._lock:
+            job.status = "running"
+            job.started_at = datetime.now().isoformat()
+        try:
+            result = func(job)
+        except Exception as e:
+            traceback.print_exc()
+            with job._lock:
+                job.status = "failed"
+                job.error = str(e)
+                job.finished_at = datetime.now().isoformat()
+            return
+        with job._lock:
+            job.status = "completed"
+            job.result = result
+            job.finished_at = datetime.now().isoformat()
+
+    def _prune(self) -> None:
+        """完了済みジョブが上限を超えた場合に古いものから破棄"""
+        finished = [job_id for job_id, job in self._jobs.items() if job.status in ("completed", "failed")]
+        for job_id in finished[:max(0, len(finished) - self.max_finished_jobs)]:
+            del self._jobs[job_id]
@@ -0,0 +1,149 @@
+"""
+llm_cache.py
+LLM応答をディスクに永続化するコンテンツアドレス型キャッシュ
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+
+class LLMCache:
+    """リクエスト内容（モデル・メッセージ・temperature・response_format）のハッシュをキーに応答を保存するクラス"""
+
+    def __init__(self, cache_dir: str, ttl_seconds: float = 7 * 24 * 3600, max_entries: int = 20000):
+        """
+        Args:
+            cache_dir: キャッシュの保存先ディレクトリ
+            ttl_seconds: エントリの有効期間（秒）。0以下の場合は無期限
+            max_entries: 保持する最大エントリ数。超過時は古いエントリから削除
+        """
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._num_entries = sum(1 for _ in self.cache_dir.glob("*/*.json"))
+
+    def make_key(
+        self,
+        model: str,
+        messages: list,
+        temperature: float,
+        response_format: Optional[Dict[str, Any]] = None,
+        seed: Optional[int] = None
+    ) -> str:
+        """リクエスト内容からキャッシュキー（SHA-256）を生成（seedは指定した場合だけキーに含める）"""
+        request = {
+            "model": model,
+            "messages": messages,
+            "temperature": temperature,
+            "response_format": response_format,
+        }
+        if seed is not None:
+            request["seed"] = seed
+        payload = json.dumps(request, ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """
+        キャッシュされた応答を取得
+
+        Returns:
+            応答のテキスト。存在しないか期限切れの場合はNone
+        """
+        path = self._path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            with self._lock:
+                self.misses += 1
+            return None
+
+        if self._is_expired(entry.get("created_at", 0)):
+            self._remove(path)
+            with self._lock:
+                self.misses += 1
+            return None
+
+        with self._lock:
+            self.hits += 1
+        return entry.get("content")
+
+    def set(self, key: str, content: str) -> None:
+        """応答をキャッシュに保存（一時ファイルからのリネームでアトミックに書き込む）"""
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        existed = path.exists()
+
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"created_at": time.time(), "content": content}, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            if not existed:
+                self._num_entries += 1
+            needs_eviction = self.max_entries > 0 and self._num_entries > self.max_entries
+
+        if needs_eviction:
+            self._evict()
+
+    def stats(self) -> Dict[str, Any]:
+        """ヒット数・ミス数などの統計情報を取得"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "entries": self._num_entries,
+                "cache_dir": str(self.cache_dir),
+            }
+
+    def clear(self) -> None:
+        """全エントリを削除"""
+        for path in self.cache_dir.glob("*/*.json"):
+            self._remove(path)
+        with self._lock:
+            self._num_entries = 0
+
+    def _path(self, key: str) -> Path:
+        """キーに対応するファイルパス（先頭2文字でディレクトリを分割）"""
+        return self.cache_dir / key[:2] / f"{key}.json"
+
+    def _is_expired(self, created_at: float) -> bool:
+        return self.ttl_seconds > 0 and time.time() - created_at > self.ttl_seconds
+
+    def _remove(self, path: Path) -> None:
+        try:
+            path.unlink()
+        except FileNotFoundError:
+            return
+        with self._lock:
+            self._num_entries = max(0, self._num_entries - 1)
+
+    def _evict(self) -> None:
+        """期限切れエントリと、上限を超えた分の古いエントリを削除（上限の90%まで減らす）"""
+        entries = []
+        for path in self.cache_dir.glob("*/*.json"):
+            try:
+                entries.append((path.stat().st_mtime, path))
+            except FileNotFoundError:
+                continue
+        entries.sort()
+
+        target = int(self.max_entries * 0.9)
+        num_to_remove = max(0, len(entries) - target)
+        for i, (mtime, path) in enumerate(entries):
+            if i < num_to_remove or self._is_expired(mtime):
+                self._remove(path)
+
+        with self._lock:
+            self._num_entries = sum(1 for _ in self.cache_dir.glob("*/*.json"))
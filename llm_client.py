@@ -0,0 +1,355 @@
+"""
+llm_client.py
+ScenarioGeneratorとMetricAnnotatorで共有するOpenAI API呼び出し層
+（応答キャッシュ・レート制限・リトライを一箇所で扱う）
+"""
+import json
+import random
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, Iterator, Optional
+
+import openai
+from openai import OpenAI
+
+import telemetry
+from llm_cache import LLMCache
+from rate_limiter import RateLimiter
+
+
+# 応答トークン数の事前見積もり（実際の使用量は応答後に精算する）
+DEFAULT_COMPLETION_TOKENS = 1000
+
+# 使用量の内訳として保持する直近の呼び出し数
+RECENT_USAGE_SIZE = 100
+
+
+class LLMClient:
+    """
+    JSON応答のチャット補完を呼び出すクライアント
+
+    - 同一リクエストの応答はキャッシュから返す
+    - リクエスト数/分・トークン数/分の2つのトークンバケットで呼び出しを平滑化する
+    - 429・タイムアウト・5xxは、Retry-Afterを優先しつつジッター付き指数バックオフで再試行する
+      （429を受けた場合は、同じクライアントを使う全スレッドがRetry-Afterの間待機する）
+    """
+
+    def __init__(
+        self,
+        api_key: str,
+        cache: Optional[LLMCache] = None,
+        rpm_limit: float = 0,
+        tpm_limit: float = 0,
+        max_retries: int = 5,
+        base_delay: float = 1.0,
+        max_delay: float = 60.0,
+        base_url: Optional[str] = None
+    ):
+        """
+        Args:
+            api_key: OpenAI APIキー
+            cache: LLM応答キャッシュ（Noneの場合はキャッシュしない）
+            rpm_limit: リクエスト数/分の上限（0以下で無制限）
+            tpm_limit: トークン数/分の上限（0以下で無制限）
+            max_retries: 一時的なエラーの最大再試行回数
+            base_delay: バックオフの初期待機秒数
+            max_delay: バックオフの最大待機秒数
+            base_url: APIのベースURL（Noneの場合は環境変数 OPENAI_BASE_URL またはOpenAIの既定値）
+        """
+        # 再試行はこのクラスで行うため、SDK側の自動再試行は無効にする
+        self.client = OpenAI(api_key=api_key, base_url=base_url, max_retries=0)
+        self.cache = cache
+        self.request_limiter = RateLimiter(rpm_limit) if rpm_limit > 0 else None
+        self.token_limiter = RateLimiter(tpm_limit) if tpm_limit > 0 else None
+        self.max_retries = max(0, max_retries)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._cooldown_until = 0.0
+        self._lock = threading.Lock()
+        self._usage: Dict[str, Dict[str, int]] = {}
+        self._recent_usage = deque(maxlen=RECENT_USAGE_SIZE)
+
+    def request_json(self, request: Dict[str, Any], use_cache: bool = True) -> Any:
+        """
+        チャット補完を呼び出し、JSON応答をパースして返す
+
+        Args:
+            request: chat.completions.create に渡す引数（model, messages, temperature, response_format）
+            use_cache: Falseの場合は応答キャッシュを読み書きしない（毎回異なる応答が欲しいシナリオ生成など）
+
+        Returns:
+            パースしたJSON
+        """
+        cache_key = self.cache.make_key(**request) if self.cache and use_cache else None
+        content = self.cache.get(cache_key) if cache_key else None
+        call = {"cache_hit": content is not None, "retries": 0}
+        start = time.perf_counter()
+
+        try:
+            if content is None:
+                content = self._create_with_retry(request, call)
+            else:
+                cache_key = None  # キャッシュヒット時は再保存しない
+
+            try:
+                result = json.loads(content)
+            except json.JSONDecodeError as e:
+                raise ValueError(f"LLMの応答をJSONとしてパースできませんでした: {e}\n応答内容: {content[:200]}")
+        except Exception as e:
+            call["error"] = str(e)
+            raise
+        finally:
+            telemetry.record_llm_call(request["model"], time.perf_counter() - start, **call)
+
+        if cache_key:
+            self.cache.set(cache_key, content)
+
+        return result
+
+    def stream_text(self, request: Dict[str, Any], use_cache: bool = True) -> Iterator[str]:
+        """
+        チャット補完をストリーミングで呼び出し、応答テキストを届いた断片ごとに返すジェネレータ
+
+        キャッシュ・レート制限・使用量の記録は request_json と同じ（キャッシュヒット時は応答全体を1つの断片として返す）。
+        再試行するのは最初の断片が届く前のエラーだけで、途中で切れた場合は例外を送出する。
+        最後まで受け取った応答だけをキャッシュに保存する。
+
+        Args:
+            request: chat.completions.create に渡す引数（stream は指定しない）
+            use_cache: request_json と同じ
+        """
+        cache_key = self.cache.make_key(**request) if self.cache and use_cache else None
+        content = self.cache.get(cache_key) if cache_key else None
+        call = {"cache_hit": content is not None, "retries": 0}
+        start = time.perf_counter()
+
+        try:
+            if content is not None:
+                yield content
+                return
+
+            pieces = []
+            for piece in self._stream_with_retry(request, call):
+                pieces.append(piece)
+                yield piece
+            content = "".join(pieces)
+            if not content:
+                raise ValueError("LLMからの応答が空でした。APIキーやモデル名を確認してください。")
+        except GeneratorExit:
+            # 呼び出し元が途中で読むのをやめた場合は、不完全な応答をキャッシュしない
+            call["error"] = "cancelled"
+            raise
+        except Exception as e:
+            call["error"] = str(e)
+            raise
+        finally:
+            telemetry.record_llm_call(request["model"], time.perf_counter() - start, **call)
+
+        if cache_key:
+            self.cache.set(cache_key, content)
+
+    def _stream_with_retry(self, request: Dict[str, Any], call: Dict[str, Any]) -> Iterator[str]:
+        """レート制限を守ってストリーミングのAPI呼び出しを開始し、応答の断片を返す（開始時のエラーは再試行する）"""
+        estimated_tokens = self._estimate_tokens(request)
+
+        for attempt in range(self.max_retries + 1):
+            self._wait_for_cooldown()
+            if self.request_limiter:
+                self.request_limiter.acquire()
+            if self.token_limiter:
+                self.token_limiter.acquire(estimated_tokens)
+
+            try:
+                stream = self.client.chat.completions.create(
+                    **request, stream=True, stream_options={"include_usage": True}
+                )
+            except Exception as e:
+                if attempt >= self.max_retries or not self._is_retryable(e):
+                    raise
+                delay = self._retry_delay(e, attempt)
+                print(f"警告: OpenAI APIの呼び出しに失敗しました。{delay:.1f}秒後に再試行します（{attempt + 1}/{self.max_retries}）: {e}")
+                if isinstance(e, openai.RateLimitError):
+                    self._start_cooldown(delay)
+                else:
+                    time.sleep(delay)
+                call["retries"] += 1
+                continue
+
+            usage = None
+            with stream:
+                for chunk in stream:
+                    # 使用量は最後の断片（choicesが空）に含まれる
+                    if getattr(chunk, "usage", None) is not None:
+                        usage = chunk.usage
+                    if not chunk.choices:
+                        continue
+                    delta = chunk.choices[0].delta
+                    if getattr(delta, "refusal", None):
+                        raise ValueError(f"LLMがリクエストを拒否しました: {delta.refusal}")
+                    if delta.content:
+                        yield delta.content
+
+            # 見積もりと実際の使用トークン数の差を精算
+            if self.token_limiter and getattr(usage, "total_tokens", None):
+                self.token_limiter.adjust(usage.total_tokens - estimated_tokens)
+            if usage is not None:
+                call.update(self._record_usage(request["model"], usage))
+            return
+
+    def _create_with_retry(self, request: Dict[str, Any], call: Dict[str, Any]) -> str:
+        """
+        レート制限を守ってAPIを呼び出し、一時的なエラーは再試行する
+
+        call には計測用に再試行回数とトークン使用量を書き込む
+        """
+        estimated_tokens = self._estimate_tokens(request)
+
+        for attempt in range(self.max_retries + 1):
+            self._wait_for_cooldown()
+            if self.request_limiter:
+                self.request_limiter.acquire()
+            if self.token_limiter:
+                self.token_limiter.acquire(estimated_tokens)
+
+            try:
+                response = self.client.chat.completions.create(**request)
+            except Exception as e:
+                if attempt >= self.max_retries or not self._is_retryable(e):
+                    raise
+                delay = self._retry_delay(e, attempt)
+                print(f"警告: OpenAI APIの呼び出しに失敗しました。{delay:.1f}秒後に再試行します（{attempt + 1}/{self.max_retries}）: {e}")
+                if isinstance(e, openai.RateLimitError):
+                    self._start_cooldown(delay)
+                else:
+                    time.sleep(delay)
+                call["retries"] += 1
+                continue
+
+            # 見積もりと実際の使用トークン数の差を精算
+            usage = getattr(response, "usage", None)
+            if self.token_limiter and getattr(usage, "total_tokens", None):
+                self.token_limiter.adjust(usage.total_tokens - estimated_tokens)
+            if usage is not None:
+                call.update(self._record_usage(request["model"], usage))
+
+            # レスポンスをパース
+            message = response.choices[0].message
+            content = message.content
+
+            # contentがNoneの場合のエラーハンドリング
+            if content is None:
+                if getattr(message, 'refusal', None):
+                    raise ValueError(f"LLMがリクエストを拒否しました: {message.refusal}")
+                raise ValueError("LLMからの応答が空でした。APIキーやモデル名を確認してください。")
+
+            return content
+
+    def usage_stats(self) -> Dict[str, Any]:
+        """
+        API呼び出しのトークン使用量（キャッシュから返した応答は含まない）
+
+        Returns:
+            {"models": {モデル名: 累計}, "recent": [直近の呼び出しごとの内訳]}
+            cached_prompt_tokens はプロンプトのうちOpenAIのプロンプトキャッシュが効いたトークン数
+        """
+        with self._lock:
+            models = {
+                model: {**totals, "cached_ratio": self._ratio(totals["cached_prompt_tokens"], totals["prompt_tokens"])}
+                for model, totals in self._usage.items()
+            }
+            return {"models": models, "recent": list(self._recent_usage)}
+
+    def _record_usage(self, model: str, usage: Any) -> Dict[str, int]:
+        """1回の呼び出しのトークン使用量を記録し、その内訳を返す"""
+        prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+        completion_tokens = getattr(usage, "completion_tokens", 0) or 0
+        details = getattr(usage, "prompt_tokens_details", None)
+        cached_tokens = getattr(details, "cached_tokens", 0) or 0
+
+        with self._lock:
+            totals = self._usage.setdefault(model, {
+                "requests": 0,
+                "prompt_tokens": 0,
+                "cached_prompt_tokens": 0,
+                "completion_tokens": 0
+            })
+            totals["requests"] += 1
+            totals["prompt_tokens"] += prompt_tokens
+            totals["cached_prompt_tokens"] += cached_tokens
+            totals["completion_tokens"] += completion_tokens
+            self._recent_usage.append({
+                "model": model,
+                "prompt_tokens": prompt_tokens,
+                "cached_prompt_tokens": cached_tokens,
+                "fresh_prompt_tokens": prompt_tokens - cached_tokens,
+                "completion_tokens": completion_tokens,
+                "cached_ratio": self._ratio(cached_tokens, prompt_tokens)
+            })
+
+        return {
+            "prompt_tokens": prompt_tokens,
+            "cached_prompt_tokens": cached_tokens,
+            "completion_tokens": completion_tokens
+        }
+
+    @staticmethod
+    def _ratio(part: int, total: int) -> float:
+        return round(part / total, 4) if total else 0.0
+
+    def _is_retryable(self, error: Exception) -> bool:
+        """再試行で回復しうるエラーかどうか"""
+        if isinstance(error, openai.RateLimitError):
+            # 利用上限（クォータ切れ）は待っても回復しない
+            return getattr(error, "code", None) != "insufficient_quota"
+        if isinstance(error, (openai.APITimeoutError, openai.APIConnectionError)):
+            return True
+        if isinstance(error, openai.APIStatusError):
+            return error.status_code == 409 or error.status_code >= 500
+        return False
+
+    def _retry_delay(self, error: Exception, attempt: int) -> float:
+        """Retry-Afterヘッダーがあればそれに従い、なければジッター付き指数バックオフ"""
+        retry_after = self._retry_after(error)
+        if retry_after is not None:
+            return min(self.max_delay, retry_after) + random.uniform(0, self.base_delay)
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    def _retry_after(self, error: Exception) -> Optional[float]:
+        """エラーレスポンスのRetry-After（秒）を取得"""
+        response = getattr(error, "response", None)
+        headers = getattr(response, "headers", None)
+        if not headers:
+            return None
+
+        try:
+            if headers.get("retry-after-ms"):
+                return float(headers["retry-after-ms"]) / 1000
+            if headers.get("retry-after"):
+                return float(headers["retry-after"])
+        except ValueError:
+            pass  # HTTP日付形式などは無視してバックオフに任せる
+        return None
+
+    def _start_cooldown(self, delay: float) -> None:
+        """全スレッドの呼び出しを指定秒数止める"""
+        with self._lock:
+            self._cooldown_until = max(self._cooldown_until, time.monotonic() + delay)
+        self._wait_for_cooldown()
+
+    def _wait_for_cooldown(self) -> None:
+        while True:
+            with self._lock:
+                remaining = self._cooldown_until - time.monotonic()
+            if remaining <= 0:
+                return
+            time.sleep(remaining)
+
+    def _estimate_tokens(self, request: Dict[str, Any]) -> int:
+        """
+        リクエストの使用トークン数を見積もる
+
+        日本語は概ね1文字1トークン以下になるため、文字数を入力トークン数の上限の目安とする。
+        """
+        prompt_chars = sum(len(message.get("content") or "") for message in request.get("messages", []))
+        return prompt_chars + request.get("max_tokens", DEFAULT_COMPLETION_TOKENS)
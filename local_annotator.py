@@ -0,0 +1,506 @@
+"""
+local_annotator.py
+保存済みコーパスの評価から学習する、ネットワーク不要のローカル評価モデル（CLIとしても実行可能）
+
+発言とその直前5件の発言の文字n-gram（ハッシュで固定長に畳み込む）を特徴量とし、
+指標ごとのリッジ回帰（共役勾配法、NumPyのみ）で0-9のスコアを推定する。
+教師データは corpus_export.py で書き出したデータセットの human_annotations（あれば優先）と machine_annotations。
+評価に失敗した発言（annotation_error）とローカル評価で補った発言は学習に使わない。
+
+MetricAnnotator.annotate_scenario / iter_annotations と同じ形式で結果を返すため、
+大量のシナリオの事前スクリーニング、画面でのプレビュー、API障害時の代替評価（MetricAnnotator の fallback）に使える。
+
+使用例:
+    python corpus_export.py && python local_annotator.py train      # data/corpus から学習して保存
+    python local_annotator.py score data/outputs/*.json              # 保存済みシナリオを評価し、機械アノテーションとの差を表示
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import zlib
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+from dotenv import load_dotenv
+
+from corpus_export import Corpus, load_corpus
+from metric_annotator import METRIC_NAMES, annotation_hash, prepare_items
+
+
+MODEL_FORMAT_VERSION = 1
+# 文字n-gramの長さと、発言・コンテキストそれぞれのハッシュ空間の大きさ
+NGRAM_RANGE = (1, 3)
+HASH_DIM = 2 ** 15
+CONTEXT_TURNS = 5
+# 文字n-gram以外の特徴量: 定数項・発言の長さ（log）・会議の冒頭かどうか・直前と同じ発言者かどうか
+NUM_EXTRA_FEATURES = 4
+SCORE_MIN, SCORE_MAX = 0, 9
+# ローカル評価モデルで推定したスコアの "source"
+LOCAL_SOURCE = "local"
+
+
+class _SparseRows:
+    """CSR形式の疎行列（行列ベクトル積だけを持つ、NumPyのみの最小実装）"""
+
+    def __init__(self, indptr: np.ndarray, indices: np.ndarray, values: np.ndarray, num_features: int):
+        self.indptr = indptr
+        self.indices = indices
+        self.values = values
+        self.num_features = num_features
+        self._row_of_value = np.repeat(np.arange(len(indptr) - 1), np.diff(indptr))
+
+    def __len__(self) -> int:
+        return len(self.indptr) - 1
+
+    def dot(self, weights: np.ndarray) -> np.ndarray:
+        """X @ weights（weightsは (特徴量数,) または (特徴量数, k)）"""
+        products = self.values.reshape(-1, *([1] * (weights.ndim - 1))) * weights[self.indices]
+        return np.add.reduceat(products, self.indptr[:-1], axis=0)
+
+    def transpose_dot(self, vector: np.ndarray) -> np.ndarray:
+        """X.T @ vector（vectorは (行数,)）"""
+        return np.bincount(self.indices, weights=self.values * vector[self._row_of_value], minlength=self.num_features)
+
+
+class Featurizer:
+    """発言と直前の発言から、文字n-gramのハッシュ特徴量を作る"""
+
+    def __init__(self, hash_dim: int = HASH_DIM, ngram_range: Tuple[int, int] = NGRAM_RANGE):
+        self.hash_dim = hash_dim
+        self.ngram_range = tuple(ngram_range)
+        self.num_features = 2 * hash_dim + NUM_EXTRA_FEATURES
+        self._cache: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+
+    def _ngrams(self, text: str) -> Tuple[np.ndarray, np.ndarray]:
+        """文字列の文字n-gramのハッシュ（hash_dim で割った余り）と出現回数"""
+        cached = self._cache.get(text)
+        if cached is not None:
+            return cached
+        low, high = self.ngram_range
+        hashes = [
+            zlib.crc32(text[i:i + n].encode("utf-8")) % self.hash_dim
+            for n in range(low, high + 1) for i in range(len(text) - n + 1)
+        ]
+        result = np.unique(np.array(hashes, dtype=np.int64), return_counts=True)
+        # 同じ発言はコンテキストとして最大5回現れるため、1回の特徴量作成の間は結果を使い回す
+        self._cache[text] = result
+        return result
+
+    @staticmethod
+    def _block(indices: np.ndarray, counts: np.ndarray, offset: int) -> Tuple[np.ndarray, np.ndarray]:
+        """出現回数を log(1 + 回数) にし、ブロックごとに長さ1に正規化する"""
+        values = np.log1p(counts.astype(np.float64))
+        norm = np.sqrt((values ** 2).sum())
+        return indices + offset, (values / norm if norm else values)
+
+    def transform(self, items: List[Tuple[Dict[str, str], List[str]]]) -> _SparseRows:
+        """
+        prepare_items の形式（発言, 直前の発言 "発言者: 発言内容" のリスト）の並びを特徴量の行列にする
+        """
+        indptr = [0]
+        all_indices: List[np.ndarray] = []
+        all_values: List[np.ndarray] = []
+        extra_offset = 2 * self.hash_dim
+        try:
+            for utterance, context in items:
+                text_indices, text_values = self._block(*self._ngrams(utterance["text"]), 0)
+
+                context = context[-CONTEXT_TURNS:]
+                if context:
+                    parts = [self._ngrams(line) for line in context]
+                    merged, inverse = np.unique(np.concatenate([p[0] for p in parts]), return_inverse=True)
+                    counts = np.bincount(inverse, weights=np.concatenate([p[1] for p in parts]))
+                    context_indices, context_values = self._block(merged, counts, self.hash_dim)
+                else:
+                    context_indices, context_values = np.zeros(0, dtype=np.int64), np.zeros(0)
+
+                previous_speaker = context[-1].split(": ", 1)[0] if context else None
+                extra_indices = extra_offset + np.arange(NUM_EXTRA_FEATURES)
+                extra_values = np.array([
+                    1.0,
+                    np.log1p(len(utterance["text"])) / 5,
+                    float(not context),
+                    float(previous_speaker == utterance["speaker"]),
+                ])
+
+                all_indices += [text_indices, context_indices, extra_indices]
+                all_values += [text_values, context_values, extra_values]
+                indptr.append(indptr[-1] + len(text_indices) + len(context_indices) + NUM_EXTRA_FEATURES)
+        finally:
+            self._cache.clear()
+
+        return _SparseRows(
+            np.array(indptr, dtype=np.int64),
+            np.concatenate(all_indices) if all_indices else np.zeros(0, dtype=np.int64),
+            np.concatenate(all_values) if all_values else np.zeros(0),
+            self.num_features
+        )
+
+
+def _ridge(features: _SparseRows, targets: np.ndarray, alpha: float, max_iter: int = 300, tol: float = 1e-6) -> np.ndarray:
+    """(X.T X + alpha I) w = X.T y を共役勾配法で解く（X.T X は作らない）"""
+    def apply(w: np.ndarray) -> np.ndarray:
+        return features.transpose_dot(features.dot(w)) + alpha * w
+
+    weights = np.zeros(features.num_features)
+    residual = features.transpose_dot(targets)
+    direction = residual.copy()
+    rs_old = residual @ residual
+    threshold = tol * tol * max(rs_old, 1e-12)
+    for _ in range(max_iter):
+        if rs_old <= threshold:
+            break
+        applied = apply(direction)
+        step = rs_old / (direction @ applied)
+        weights += step * direction
+        residual -= step * applied
+        rs_new = residual @ residual
+        direction = residual + (rs_new / rs_old) * direction
+        rs_old = rs_new
+    return weights
+
+
+def training_items(corpus: Corpus) -> Tuple[List[Tuple[Dict[str, str], List[str]]], np.ndarray, np.ndarray]:
+    """
+    コーパスから (発言, 直前の発言) の並び・シナリオのコード・学習に使えない行のマスクを作る
+
+    コンテキストは MetricAnnotator と同じく同じシナリオの直前5発言（"発言者: 発言内容"）。
+    """
+    scenario_codes = np.asarray(corpus.codes("scenario_id"))
+    turns = np.asarray(corpus["turn"])
+    speakers = corpus["speaker"]
+    texts = corpus["text"]
+    order = np.lexsort((turns, scenario_codes))
+
+    items: List[Tuple[Dict[str, str], List[str]]] = [None] * len(corpus)
+    unusable = np.asarray(corpus["annotation_error"]) > 0
+    context: List[str] = []
+    previous = None
+    for row in order:
+        if scenario_codes[row] != previous:
+            context, previous = [], scenario_codes[row]
+        speaker, text = str(speakers[row]), texts[row]
+        if not speaker or not text:
+            unusable[row] = True
+        items[row] = ({"speaker": speaker, "text": text}, context[-CONTEXT_TURNS:])
+        if speaker and text:
+            context.append(f"{speaker}: {text}")
+    return items, scenario_codes, unusable
+
+
+def training_targets(corpus: Corpus, metrics: List[str]) -> np.ndarray:
+    """指標ごとの教師スコア（人手アノテーションがあれば優先、どちらもない場合はNaN）、(行数, 指標数)"""
+    targets = np.full((len(corpus), len(metrics)), np.nan)
+    for j, metric in enumerate(metrics):
+        for source in ("machine", "human"):
+            name = f"{source}.{metric}"
+            if name in corpus.columns:
+                scores = np.asarray(corpus[name], dtype=np.float64)
+                targets[:, j] = np.where(np.isnan(scores), targets[:, j], scores)
+    return targets
+
+
+class LocalAnnotator:
+    """学習済みのローカル評価モデルで、MetricAnnotator と同じ形式のアノテーションを返すクラス"""
+
+    model_name = "local"
+
+    def __init__(
+        self,
+        featurizer: Featurizer,
+        weights: np.ndarray,
+        intercepts: np.ndarray,
+        metrics: List[str],
+        info: Optional[Dict[str, Any]] = None
+    ):
+        """
+        Args:
+            featurizer: 学習時と同じ設定の Featurizer
+            weights: (特徴量数, 指標数) の重み
+            intercepts: (指標数,) の切片
+            metrics: 指標名
+            info: 学習時の情報（学習日時・行数・検証誤差など）
+        """
+        self.featurizer = featurizer
+        self.weights = weights
+        self.intercepts = intercepts
+        self.metrics = list(metrics)
+        self.info = info or {}
+
+    @classmethod
+    def train(
+        cls,
+        corpus: Corpus,
+        alpha: float = 1.0,
+        hash_dim: int = HASH_DIM,
+        holdout: float = 0.1,
+        metrics: Optional[List[str]] = None
+    ) -> "LocalAnnotator":
+        """
+        コーパスから学習する
+
+        シナリオ単位で holdout の割合を検証用に分けて誤差（MAE・±1以内の割合）を記録してから、全件で学習し直す。
+
+        Args:
+            alpha: リッジ回帰の正則化の強さ
+            hash_dim: 発言・コンテキストそれぞれのハッシュ空間の大きさ
+            holdout: 検証に使うシナリオの割合（0の場合は検証しない）
+            metrics: 学習する指標（Noneの場合は METRIC_NAMES）
+
+        Raises:
+            ValueError: 学習に使える発言がない場合
+        """
+        start = time.perf_counter()
+        metrics = list(metrics or METRIC_NAMES)
+        featurizer = Featurizer(hash_dim)
+        items, scenario_codes, unusable = training_items(corpus)
+        targets = training_targets(corpus, metrics)
+        targets[unusable] = np.nan
+        labeled = ~np.isnan(targets).all(axis=1)
+        if not labeled.any():
+            raise ValueError("学習に使える評価済みの発言がありません")
+
+        rows = np.flatnonzero(labeled)
+        features = featurizer.transform([items[i] for i in rows])
+        targets = targets[rows]
+        scenario_codes = scenario_codes[rows]
+
+        evaluation = None
+        scenarios = np.unique(scenario_codes)
+        if holdout > 0 and len(scenarios) >= 2:
+            # シナリオ名のハッシュで決定的に分ける（同じコーパスなら毎回同じ分割）
+            vocabulary = corpus.vocabulary("scenario_id")
+            held = np.array([zlib.crc32(vocabulary[code].encode("utf-8")) % 1000 < holdout * 1000 for code in scenarios])
+            if not held.any():
+                held[0] = True
+            if held.all():
+                held[-1] = False
+            test_mask = np.isin(scenario_codes, scenarios[held])
+            model = cls._fit(featurizer, features, targets, ~test_mask, metrics, alpha)
+            predicted = model._predict_features(features)
+            evaluation = {}
+            for j, metric in enumerate(metrics):
+                valid = test_mask & ~np.isnan(targets[:, j])
+                if not valid.any():
+                    continue
+                error = np.abs(np.clip(np.rint(predicted[valid, j]), SCORE_MIN, SCORE_MAX) - targets[valid, j])
+                evaluation[metric] = {
+                    "rows": int(valid.sum()),
+                    "mae": round(float(error.mean()), 3),
+                    "within_1": round(float((error <= 1).mean()), 3),
+                }
+
+        model = cls._fit(featurizer, features, targets, np.ones(len(rows), dtype=bool), metrics, alpha)
+        model.info = {
+            "trained_at": datetime.now().isoformat(),
+            "rows": int(len(rows)),
+            "scenarios": int(len(scenarios)),
+            "alpha": alpha,
+            "holdout": evaluation,
+            "seconds": round(time.perf_counter() - start, 3),
+        }
+        return model
+
+    @classmethod
+    def _fit(
+        cls,
+        featurizer: Featurizer,
+        features: _SparseRows,
+        targets: np.ndarray,
+        mask: np.ndarray,
+        metrics: List[str],
+        alpha: float
+    ) -> "LocalAnnotator":
+        """mask の行で指標ごとにリッジ回帰を解く"""
+        weights = np.zeros((features.num_features, len(metrics)))
+        intercepts = np.full(len(metrics), (SCORE_MIN + SCORE_MAX) / 2)
+        for j in range(len(metrics)):
+            valid = mask & ~np.isnan(targets[:, j])
+            if not valid.any():
+                continue
+            intercepts[j] = targets[valid, j].mean()
+            # 評価のない行は切片どおりとして扱わずに除くため、その指標の評価がある行だけの行列を作る
+            keep = valid[features._row_of_value]
+            subset = _SparseRows(
+                np.concatenate([[0], np.cumsum(np.diff(features.indptr)[valid])]),
+                features.indices[keep],
+                features.values[keep],
+                features.num_features
+            )
+            weights[:, j] = _ridge(subset, targets[valid, j] - intercepts[j], alpha)
+        return cls(featurizer, weights.astype(np.float32), intercepts, metrics)
+
+    def _predict_features(self, features: _SparseRows) -> np.ndarray:
+        if not len(features):
+            return np.zeros((0, len(self.metrics)))
+        return features.dot(self.weights.astype(np.float64)) + self.intercepts
+
+    def predict_items(self, items: List[Tuple[Dict[str, str], List[str]]]) -> List[Dict[str, Dict[str, Any]]]:
+        """
+        prepare_items の形式の発言を評価し、発言ごとの {"指標": {"score", "reason", "source"}} を返す
+
+        LLMの評価と区別できるよう、各指標の "source" は "local" になる。
+        """
+        predicted = self._predict_features(self.featurizer.transform(items))
+        return [
+            {
+                metric: {
+                    "score": int(np.clip(np.rint(value), SCORE_MIN, SCORE_MAX)),
+                    "reason": f"ローカルモデルによる推定（{value:.1f}）",
+                    "source": LOCAL_SOURCE
+                }
+                for metric, value in zip(self.metrics, row)
+            }
+            for row in predicted
+        ]
+
+    def iter_annotations(
+        self,
+        scenario: List[Dict[str, str]],
+        meeting_purpose: str,
+        meeting_format: str,
+        max_workers: Optional[int] = None,
+        batch_size: Optional[int] = None,
+        indices: Optional[Iterable[int]] = None,
+        focus_metrics: Optional[List[str]] = None
+    ) -> Iterator[Tuple[int, Dict[str, Any]]]:
+        """
+        MetricAnnotator.iter_annotations と同じ形式で返す（発言順、会議の目的・形式と並行度の指定は使わない）
+        """
+        items = prepare_items(scenario)
+        selected = range(len(items)) if indices is None else sorted(i for i in set(indices) if 0 <= i < len(items))
+        for index, metrics in zip(selected, self.predict_items([items[i] for i in selected])):
+            utterance, context = items[index]
+            yield index, {
+                "speaker": utterance["speaker"],
+                "text": utterance["text"],
+                "annotation_hash": annotation_hash(utterance, context),
+                "metrics": metrics,
+                "annotation_tier": "local",
+            }
+
+    def annotate_scenario(
+        self,
+        scenario: List[Dict[str, str]],
+        meeting_purpose: str,
+        meeting_format: str,
+        max_workers: Optional[int] = None,
+        batch_size: Optional[int] = None,
+        on_progress: Optional[Callable[[int, int], None]] = None,
+        focus_metrics: Optional[List[str]] = None
+    ) -> List[Dict[str, Any]]:
+        """MetricAnnotator.annotate_scenario と同じ形式で返す（引数も同じ）"""
+        annotated = [utt for _, utt in self.iter_annotations(scenario, meeting_purpose, meeting_format)]
+        if on_progress:
+            on_progress(len(annotated), len(annotated))
+        return annotated
+
+    def save(self, path: str) -> Path:
+        """モデルを1つの .npz ファイルに保存する（一時ファイルに書いてから差し替える）"""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f".{path.name}.tmp")
+        config = {
+            "format_version": MODEL_FORMAT_VERSION,
+            "hash_dim": self.featurizer.hash_dim,
+            "ngram_range": list(self.featurizer.ngram_range),
+            "metrics": self.metrics,
+            "info": self.info,
+        }
+        with open(tmp_path, "wb") as f:
+            np.savez_compressed(
+                f, weights=self.weights, intercepts=self.intercepts,
+                config=np.array(json.dumps(config, ensure_ascii=False))
+            )
+        os.replace(tmp_path, path)
+        return path
+
+    @classmethod
+    def load(cls, path: str) -> "LocalAnnotator":
+        """
+        保存したモデルを読み込む
+
+        Raises:
+            ValueError: 対応していない形式のファイルの場合
+        """
+        with np.load(path) as data:
+            config = json.loads(str(data["config"]))
+            if config.get("format_version") != MODEL_FORMAT_VERSION:
+                raise ValueError(f"対応していない形式のモデルです: {path}")
+            return cls(
+                Featurizer(config["hash_dim"], tuple(config["ngram_range"])),
+                data["weights"],
+                data["intercepts"],
+                config["metrics"],
+                config.get("info")
+            )
+
+
+def load_local_annotator(path: str) -> Optional[LocalAnnotator]:
+    """モデルファイルがあれば読み込む（ない・読めない場合はNone）"""
+    if not path or not Path(path).exists():
+        return None
+    try:
+        return LocalAnnotator.load(path)
+    except (OSError, ValueError, KeyError) as e:
+        print(f"警告: ローカル評価モデルを読み込めませんでした: {path}: {e}")
+        return None
+
+
+def main(argv: List[str] = None) -> int:
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description="コーパスからローカル評価モデルを学習する・保存済みシナリオを評価する")
+    parser.add_argument("--model", default=os.getenv("LOCAL_ANNOTATOR_PATH", "data/local_annotator.npz"),
+                        help="モデルファイル")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    train_parser = subparsers.add_parser("train", help="コーパスから学習して保存する")
+    train_parser.add_argument("--corpus-dir", default=os.getenv("CORPUS_DIR", "data/corpus"),
+                              help="corpus_export.py で書き出したデータセット")
+    train_parser.add_argument("--alpha", type=float, default=1.0, help="リッジ回帰の正則化の強さ")
+    train_parser.add_argument("--holdout", type=float, default=0.1, help="検証に使うシナリオの割合")
+    score_parser = subparsers.add_parser("score", help="保存済みシナリオを評価し、機械アノテーションとの差を表示する")
+    score_parser.add_argument("files", nargs="+", help="出力JSONファイル")
+    args = parser.parse_args(argv)
+
+    if args.command == "train":
+        model = LocalAnnotator.train(load_corpus(args.corpus_dir), alpha=args.alpha, holdout=args.holdout)
+        model.save(args.model)
+        print(f"{model.info['rows']}発言（{model.info['scenarios']}シナリオ）から学習し、{args.model} に保存しました"
+              f"（{model.info['seconds']}秒）")
+        for metric, result in (model.info["holdout"] or {}).items():
+            print(f"  {metric}: 検証{result['rows']}発言 MAE {result['mae']}・±1以内 {result['within_1']:.1%}")
+        return 0
+
+    model = load_local_annotator(args.model)
+    if model is None:
+        print(f"モデルファイルがありません: {args.model}（先に train を実行してください）")
+        return 1
+    for filename in args.files:
+        with open(filename, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        scenario = data.get("scenario", [])
+        start = time.perf_counter()
+        annotated = model.annotate_scenario(scenario, "", "")
+        elapsed = time.perf_counter() - start
+        errors = {metric: [] for metric in model.metrics}
+        saved = [u for u in scenario if isinstance(u, dict) and u.get("speaker") and u.get("text")]
+        for utt, local in zip(saved, annotated):
+            machine = utt.get("machine_annotations") or utt.get("metrics") or {}
+            for metric in model.metrics:
+                value = machine.get(metric)
+                if isinstance(value, dict) and isinstance(value.get("score"), (int, float)):
+                    errors[metric].append(abs(local["metrics"][metric]["score"] - value["score"]))
+        summary = "・".join(
+            f"{metric} MAE {np.mean(diffs):.2f}" for metric, diffs in errors.items() if diffs
+        ) or "機械アノテーションなし"
+        print(f"{filename}: {len(annotated)}発言を{elapsed * 1000:.1f}ミリ秒で評価（{summary}）")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,96 +2,480 @@
 metric_annotator.py
 発言に対して各指標のスコアをアノテーションするモジュール
 """
+import contextvars
+import copy
+import hashlib
 import json
-from typing import List, Dict, Any
-from openai import OpenAI
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import List, Dict, Any, Optional, Tuple, Callable, Iterator, Iterable
 import os
 
+from config_cache import ConfigCache
+from llm_client import LLMClient
+from prompt_templates import CompiledPrompt
+
+
+# 評価する指標（出力JSONのキー）
+METRIC_NAMES = ["威圧度", "逸脱度", "発言無効度", "偏り度"]
+
+SYSTEM_PROMPT = "あなたは会議の質を評価する専門家です。与えられた指標定義に基づいて、発言を客観的に評価します。必ずJSON形式で出力してください。"
+
+
+def metric_format(metrics: List[str]) -> str:
+    """1発言の評価結果の形式（単一評価・バッチ評価で共通）"""
+    return ",\n".join(
+        f'  "{name}": {{\n    "score": 数値,\n    "reason": "評価理由"\n  }}' for name in metrics
+    )
+
+
+def utterance_output_format(metrics: List[str]) -> str:
+    """単一発言の評価の出力形式（発言によらず固定）"""
+    return f"""【出力形式】
+以下のJSON形式で出力してください：
+{{
+{metric_format(metrics)}
+}}
+
+JSONのみを出力し、説明文は不要です。"""
+
+
+# カスケード評価で上位モデルに回すスコア（低/中・中/高の境界付近）
+BORDERLINE_SCORES = {3, 4, 6, 7}
+# カスケード評価で上位モデルに回す重点指標のスコア（高スコア）
+ESCALATE_FOCUS_SCORE = 7
+# 安価なモデルの複数サンプルのスコアの差がこれを超えたら上位モデルに回す
+MAX_SAMPLE_SPREAD = 1
+# 重点指標がない場合に、境界付近の指標がこの割合を超えたら上位モデルに回す（過半数）
+BORDERLINE_MAJORITY = 0.5
+
+
+def _get_speaker(utt: Dict[str, Any]) -> str:
+    """発言者名を取得（様々なキー名に対応）"""
+    for key in ["speaker", "name", "発言者", "話者", "参加者"]:
+        if key in utt:
+            return str(utt[key])
+    return ""
+
+
+def _get_text(utt: Dict[str, Any]) -> str:
+    """発言内容を取得（様々なキー名に対応）"""
+    for key in ["text", "content", "message", "発言", "発言内容", "内容", "セリフ"]:
+        if key in utt:
+            return str(utt[key])
+    return ""
+
+
+def prepare_items(scenario: List[Dict[str, str]]) -> List[Tuple[Dict[str, str], List[str]]]:
+    """
+    各発言を正規化し、評価時のコンテキスト（それまでの発言履歴）と組にする
+    
+    Returns:
+        [(正規化された発言, それまでの発言履歴（直近5件、"発言者: 発言内容"）), ...]
+    """
+    items = []
+    context = []  # これまでの発言履歴
+    
+    for utt in scenario:
+        # キー名の正規化（speakerとtextを取得）
+        speaker = _get_speaker(utt)
+        text = _get_text(utt)
+        
+        if not speaker or not text:
+            print(f"警告: 発言のフォーマットが不正です。スキップします: {utt}")
+            continue
+        
+        # 正規化された発言オブジェクト
+        items.append(({"speaker": speaker, "text": text}, context[-5:]))
+        
+        # コンテキストに追加
+        context.append(f"{speaker}: {text}")
+    
+    return items
+
+
+def select_metrics(metrics: Optional[Iterable[str]]) -> List[str]:
+    """
+    評価する指標を METRIC_NAMES の順に並べて返す（Noneまたは空の場合は全指標）
+
+    Raises:
+        ValueError: 未知の指標名を含む場合
+    """
+    if not metrics:
+        return list(METRIC_NAMES)
+    unknown = [name for name in metrics if name not in METRIC_NAMES]
+    if unknown:
+        raise ValueError(f"未知の指標です: {', '.join(map(str, unknown))}（{', '.join(METRIC_NAMES)} のいずれか）")
+    return [name for name in METRIC_NAMES if name in metrics]
+
+
+def annotation_hash(utterance: Dict[str, str], context: List[str]) -> str:
+    """評価入力（発言とコンテキスト）のハッシュ"""
+    source = json.dumps([utterance["speaker"], utterance["text"], context[-5:]], ensure_ascii=False)
+    return hashlib.sha256(source.encode("utf-8")).hexdigest()[:16]
+
 
 class MetricAnnotator:
     """発言に対して4つの指標でアノテーションを行うクラス"""
     
-    def __init__(self, api_key: str, model_name: str, extra_json_path: str):
+    def __init__(
+        self,
+        api_key: str,
+        model_name: str,
+        extra_json_path: str,
+        max_workers: int = 1,
+        batch_size: int = 1,
+        llm_client: Optional[LLMClient] = None,
+        config_cache: Optional[ConfigCache] = None,
+        cascade_model: Optional[str] = None,
+        cascade_samples: int = 1,
+        fallback: Optional[Any] = None
+    ):
         """
         Args:
             api_key: OpenAI APIキー
             model_name: 使用するモデル名
             extra_json_path: 指標定義JSONのパス
+            max_workers: 発言アノテーションの同時実行数（1の場合は逐次実行）
+            batch_size: 1回のLLM呼び出しで評価する連続発言数（1の場合は発言ごとに評価）
+            llm_client: API呼び出し層（キャッシュ・レート制限・リトライ、複数インスタンスで共有可能）
+                        Noneの場合はapi_keyから制限なしのクライアントを作成
+            config_cache: 指標定義を読み込む設定キャッシュ（ScenarioGenerator・APIと共有可能）
+            cascade_model: カスケード評価で先に全発言を評価する安価なモデル（Noneの場合は model_name だけで評価）
+            cascade_samples: カスケード評価で安価なモデルに評価させる回数（2以上の場合はサンプル間の不一致も上位モデルに回す）
+            fallback: 再試行しても評価できなかった発言を代わりに評価するローカル評価モデル（local_annotator.LocalAnnotator）
         """
-        self.client = OpenAI(api_key=api_key)
+        self.llm = llm_client or LLMClient(api_key)
+        self.config_cache = config_cache or ConfigCache()
         self.model_name = model_name
-        self.metrics_def = self._load_metrics(extra_json_path)
+        # 指標定義を含むシステムプロンプトは一度だけ組み立て、extra.jsonが更新された場合だけ組み立て直す
+        self.system_prompt = CompiledPrompt(extra_json_path, self._load_metrics, self._build_system_prompt)
+        self.max_workers = max(1, max_workers)
+        self.batch_size = max(1, batch_size)
+        self.seed: Optional[int] = None
+        self.fallback = fallback
+        # 評価する指標（_for_metrics で一部の指標だけを評価する評価器を作る）
+        self.metrics = list(METRIC_NAMES)
+        # 一部の指標だけの定義を含むシステムプロンプト（指標の組み合わせごと、評価器の複製間で共有する）
+        self._subset_prompts: Dict[Tuple[str, ...], CompiledPrompt] = {}
+        self._subset_lock = threading.Lock()
+        self._extra_json_path = extra_json_path
+        self.cascade_model = cascade_model or None
+        # 安価なモデルのサンプルごとの評価器（1つ目はseedなしで、同じモデルの通常の評価と応答キャッシュを共有する）
+        self._cascade_tiers = [
+            self._tier(cascade_model, seed) for seed in [None, *range(1, max(1, cascade_samples))]
+        ] if self.cascade_model else []
+    
+    def _tier(self, model_name: str, seed: Optional[int]) -> "MetricAnnotator":
+        """同じ指標定義・クライアントで、モデルとseedだけが異なる評価器"""
+        tier = copy.copy(self)
+        tier.model_name = model_name
+        tier.seed = seed
+        tier.cascade_model = None
+        tier._cascade_tiers = []
+        tier.fallback = None
+        return tier
+    
+    def _for_metrics(self, metrics: Optional[Iterable[str]]) -> "MetricAnnotator":
+        """
+        指定した指標だけを評価する評価器（プロンプトの指標定義・出力形式もその指標だけにする）
+        
+        Raises:
+            ValueError: 未知の指標名を含む場合
+        """
+        names = select_metrics(metrics)
+        if names == self.metrics:
+            return self
+        key = tuple(names)
+        with self._subset_lock:
+            if key not in self._subset_prompts:
+                self._subset_prompts[key] = CompiledPrompt(
+                    self._extra_json_path, self._load_metrics,
+                    lambda metrics_def: self._build_system_prompt(
+                        {name: value for name, value in metrics_def.items() if name in key}
+                    )
+                )
+            system_prompt = self._subset_prompts[key]
+        subset = copy.copy(self)
+        subset.metrics = names
+        subset.system_prompt = system_prompt
+        subset._cascade_tiers = [tier._for_metrics(names) for tier in self._cascade_tiers]
+        return subset
     
     def _load_metrics(self, path: str) -> Dict[str, Any]:
-        """指標定義を読み込む"""
-        with open(path, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    
-    def _get_speaker(self, utt: Dict[str, Any]) -> str:
-        """発言者名を取得（様々なキー名に対応）"""
-        for key in ["speaker", "name", "発言者", "話者", "参加者"]:
-            if key in utt:
-                return str(utt[key])
-        return ""
-    
-    def _get_text(self, utt: Dict[str, Any]) -> str:
-        """発言内容を取得（様々なキー名に対応）"""
-        for key in ["text", "content", "message", "発言", "発言内容", "内容", "セリフ"]:
-            if key in utt:
-                return str(utt[key])
-        return ""
+        """指標定義を読み込む（更新されていなければキャッシュ済みの定義）"""
+        return self.config_cache.load(path)
     
     def annotate_scenario(
         self,
         scenario: List[Dict[str, str]],
         meeting_purpose: str,
-        meeting_format: str
+        meeting_format: str,
+        max_workers: Optional[int] = None,
+        batch_size: Optional[int] = None,
+        on_progress: Optional[Callable[[int, int], None]] = None,
+        focus_metrics: Optional[List[str]] = None,
+        metrics: Optional[List[str]] = None
     ) -> List[Dict[str, Any]]:
         """
         シナリオ全体にアノテーションを付与
         
+        各発言の評価に必要なのは直近5件の発言テキストのみ（過去のスコアは不要）なので、
+        全発言のコンテキストを先に組み立ててから並行してLLMを呼び出せる。
+        結果の順序と内容は逐次実行の場合と同じになる。
+        
+        batch_sizeが2以上の場合は、連続するbatch_size件の発言を1回のLLM呼び出しでまとめて評価する。
+        バッチの応答に含まれなかった（または不正な）発言は、個別に再評価する。
+        
+        再試行しても評価できなかった発言は、metricsを空にして "annotation_error" にエラー内容を記録する
+        （他の発言の評価結果は失われない）。fallback を指定した場合は、そうした発言の metrics を
+        ローカル評価モデルの推定（各指標の "source" が "local"）で埋め、"annotation_tier" を "local"、
+        LLMで評価できなかった理由を "fallback_reason" にする（"annotation_error" は付けない。再アノテーションの対象になる）。
+        
+        cascade_model を指定した場合は、安価なモデルで全発言を評価し、次の発言だけを model_name で評価し直す
+        （各発言の "annotation_tier" に "cheap" / "primary"、評価し直した理由を "escalation" に記録する）。
+        - 重点指標のスコアが境界付近（BORDERLINE_SCORES）。重点指標がない場合は、評価する指標の過半数
+          （BORDERLINE_MAJORITY を超える割合）が境界付近: "borderline"
+        - 安価なモデルのサンプル間でスコアが MAX_SAMPLE_SPREAD を超えて異なる: "disagreement"
+        - 重点指標のスコアが高い（ESCALATE_FOCUS_SCORE 以上。重点指標がない場合は判定しない）: "focus_high"
+        - 安価なモデルで評価できなかった: "cheap_error"
+        
+        metrics を指定した場合は、その指標だけを評価する（プロンプトの指標定義・出力形式もその指標だけになり、
+        1回の呼び出しのトークン数が減る）。各発言の "metrics" には指定した指標だけが入る。
+        残りの指標は reannotate.py（missing モード）で後から評価できる。
+        
         Args:
             scenario: 発言のリスト [{"speaker": "名前", "text": "発言内容"}, ...]
             meeting_purpose: 会議の目的
             meeting_format: 会議の形式
+            max_workers: 同時実行数（Noneの場合はコンストラクタの設定値を使用）
+            batch_size: 1回の呼び出しで評価する発言数（Noneの場合はコンストラクタの設定値を使用）
+            on_progress: 進捗通知コールバック on_progress(アノテーション済み件数, 全件数)
+            focus_metrics: カスケード評価で高スコアなら上位モデルに回す重点指標（Noneの場合は全指標）
+            metrics: 評価する指標（Noneの場合は全指標、METRIC_NAMES にない指標は ValueError）
             
         Returns:
             アノテーション付き発言リスト
         """
-        annotated = []
-        context = []  # これまでの発言履歴
+        items = prepare_items(scenario)
+        annotated = [None] * len(items)
         
-        for utt in scenario:
-            # キー名の正規化（speakerとtextを取得）
-            speaker = self._get_speaker(utt)
-            text = self._get_text(utt)
-            
-            if not speaker or not text:
-                print(f"警告: 発言のフォーマットが不正です。スキップします: {utt}")
-                continue
-            
-            # 正規化された発言オブジェクト
-            normalized_utt = {"speaker": speaker, "text": text}
-            
-            # 各発言に対してアノテーション
-            annotation = self._annotate_utterance(
-                utterance=normalized_utt,
-                context=context,
-                meeting_purpose=meeting_purpose,
-                meeting_format=meeting_format
-            )
-            
-            annotated.append({
-                "speaker": speaker,
-                "text": text,
-                "metrics": annotation
-            })
-            
-            # コンテキストに追加
-            context.append(f"{speaker}: {text}")
+        completed = 0
+        for index, annotated_utt in self._iter_item_annotations(
+            items, meeting_purpose, meeting_format, max_workers, batch_size,
+            focus_metrics=focus_metrics, metrics=metrics
+        ):
+            annotated[index] = annotated_utt
+            completed += 1
+            if on_progress:
+                on_progress(completed, len(items))
         
         return annotated
     
+    def iter_annotations(
+        self,
+        scenario: List[Dict[str, str]],
+        meeting_purpose: str,
+        meeting_format: str,
+        max_workers: Optional[int] = None,
+        batch_size: Optional[int] = None,
+        indices: Optional[Iterable[int]] = None,
+        focus_metrics: Optional[List[str]] = None,
+        metrics: Optional[List[str]] = None
+    ) -> Iterator[Tuple[int, Dict[str, Any]]]:
+        """
+        アノテーションが完了した発言から順に返すジェネレータ
+        
+        並行実行時は完了順（発言順とは限らない）に返す。引数は annotate_scenario と同じ。
+        
+        Args:
+            indices: 評価する発言のインデックス（Noneの場合は全発言）
+                     指定しない発言も、指定した発言のコンテキストとしては使われる
+        
+        Yields:
+            (発言のインデックス, アノテーション付き発言)
+            インデックスは不正な発言を除いた後の位置
+        """
+        items = prepare_items(scenario)
+        yield from self._iter_item_annotations(
+            items, meeting_purpose, meeting_format, max_workers, batch_size, indices, focus_metrics, metrics
+        )
+    
+    def annotation_hashes(self, scenario: List[Dict[str, str]]) -> List[str]:
+        """
+        各発言の現在の評価入力（発言者・発言内容・直近5件のコンテキスト）のハッシュを返す
+        
+        アノテーション時に "annotation_hash" として記録した値と比較すると、
+        発言やその直前の発言が後から変更されたかどうかを判定できる。
+        インデックスは iter_annotations と同じく不正な発言を除いた後の位置。
+        """
+        return [annotation_hash(utt, context) for utt, context in prepare_items(scenario)]
+    
+    def _iter_item_annotations(
+        self,
+        items: List[Tuple[Dict[str, str], List[str]]],
+        meeting_purpose: str,
+        meeting_format: str,
+        max_workers: Optional[int] = None,
+        batch_size: Optional[int] = None,
+        indices: Optional[Iterable[int]] = None,
+        focus_metrics: Optional[List[str]] = None,
+        metrics: Optional[List[str]] = None
+    ) -> Iterator[Tuple[int, Dict[str, Any]]]:
+        """prepare_items で準備済みの発言をアノテーションし、完了したものから返す"""
+        # 指標の検証は最初の呼び出しより前に行う
+        annotator = self._for_metrics(metrics)
+        workers = self.max_workers if max_workers is None else max(1, max_workers)
+        size = self.batch_size if batch_size is None else max(1, batch_size)
+        selected = range(len(items)) if indices is None else sorted(i for i in set(indices) if 0 <= i < len(items))
+        
+        # 連続する発言をsize件までのウィンドウにまとめる（size=1の場合は発言ごと）
+        windows: List[Tuple[int, List[Tuple[Dict[str, str], List[str]]]]] = []
+        for index in selected:
+            if windows and windows[-1][0] + len(windows[-1][1]) == index and len(windows[-1][1]) < size:
+                windows[-1][1].append(items[index])
+            else:
+                windows.append((index, [items[index]]))
+        
+        def annotate(window: List[Tuple[Dict[str, str], List[str]]]) -> List[Tuple[Any, Optional[List[str]]]]:
+            if annotator._cascade_tiers:
+                return annotator._annotate_window_cascade(window, meeting_purpose, meeting_format, focus_metrics)
+            return [(annotation, None) for annotation in annotator._annotate_any(window, meeting_purpose, meeting_format)]
+        
+        def build(start: int, window_result: List[Tuple[Any, Optional[List[str]]]]) -> Iterator[Tuple[int, Dict[str, Any]]]:
+            for offset, (annotation, escalation) in enumerate(window_result):
+                normalized_utt, context = items[start + offset]
+                annotated_utt = {
+                    "speaker": normalized_utt["speaker"],
+                    "text": normalized_utt["text"],
+                    "annotation_hash": annotation_hash(normalized_utt, context)
+                }
+                if isinstance(annotation, Exception):
+                    if self.fallback is not None:
+                        # API障害時はローカル評価モデルの推定で埋める（ネットワーク不要、各指標の "source" は "local"）
+                        predicted = self.fallback.predict_items([items[start + offset]])[0]
+                        annotated_utt["metrics"] = {
+                            name: value for name, value in predicted.items() if name in annotator.metrics
+                        }
+                        annotated_utt["annotation_tier"] = "local"
+                        annotated_utt["fallback_reason"] = str(annotation)
+                        yield start + offset, annotated_utt
+                        continue
+                    # 再試行しても評価できなかった発言は、他の発言の結果を捨てずにエラーを記録して返す
+                    annotated_utt["metrics"] = {}
+                    annotated_utt["annotation_error"] = str(annotation)
+                elif isinstance(annotation, dict):
+                    # 評価していない指標が応答に含まれていても記録しない
+                    annotated_utt["metrics"] = {
+                        name: value for name, value in annotation.items()
+                        if name in annotator.metrics or name not in METRIC_NAMES
+                    }
+                else:
+                    annotated_utt["metrics"] = annotation
+                if self._cascade_tiers:
+                    annotated_utt["annotation_tier"] = "primary" if escalation else "cheap"
+                    if escalation:
+                        annotated_utt["escalation"] = escalation
+                yield start + offset, annotated_utt
+        
+        if workers <= 1 or len(windows) <= 1:
+            for start, window in windows:
+                yield from build(start, annotate(window))
+            return
+        
+        executor = ThreadPoolExecutor(max_workers=min(workers, len(windows)))
+        try:
+            # 呼び出し元の計測トレース（telemetry.trace）をワーカースレッドに引き継ぐ
+            futures = {
+                executor.submit(contextvars.copy_context().run, annotate, window): start
+                for start, window in windows
+            }
+            for future in as_completed(futures):
+                yield from build(futures[future], future.result())
+        finally:
+            # 途中で中断された場合は未着手の呼び出しを取り消す
+            executor.shutdown(wait=True, cancel_futures=True)
+    
+    def _annotate_any(
+        self,
+        window: List[Tuple[Dict[str, str], List[str]]],
+        meeting_purpose: str,
+        meeting_format: str
+    ) -> List[Any]:
+        """1件なら個別に、2件以上ならまとめて評価する（評価に失敗した発言は例外オブジェクト）"""
+        if len(window) == 1:
+            normalized_utt, context = window[0]
+            return [self._annotate_utterance_safely(normalized_utt, context, meeting_purpose, meeting_format)]
+        return self._annotate_window(window, meeting_purpose, meeting_format)
+    
+    def _escalation_reasons(self, samples: List[Any], focus_metrics: Optional[List[str]]) -> List[str]:
+        """安価なモデルのサンプルから、上位モデルで評価し直す理由を求める（空なら安価なモデルの評価を使う）"""
+        valid = [sample for sample in samples if self._is_valid_annotation(sample)]
+        if not valid:
+            return ["cheap_error"]
+        reasons = []
+        scores = {name: [sample[name]["score"] for sample in valid] for name in self.metrics}
+        # 境界付近・高スコアの判定は重点指標だけで行う（全指標で判定するとほぼ全発言が上位モデルに回る）
+        focus = [name for name in focus_metrics or [] if name in scores]
+        borderline = [name for name, values in scores.items() if any(score in BORDERLINE_SCORES for score in values)]
+        if (any(name in borderline for name in focus) if focus
+                else len(borderline) > len(scores) * BORDERLINE_MAJORITY):
+            reasons.append("borderline")
+        if any(max(values) - min(values) > MAX_SAMPLE_SPREAD for values in scores.values()):
+            reasons.append("disagreement")
+        if any(score >= ESCALATE_FOCUS_SCORE for name in focus for score in scores[name]):
+            reasons.append("focus_high")
+        return reasons
+    
+    def _annotate_window_cascade(
+        self,
+        window: List[Tuple[Dict[str, str], List[str]]],
+        meeting_purpose: str,
+        meeting_format: str,
+        focus_metrics: Optional[List[str]]
+    ) -> List[Tuple[Any, Optional[List[str]]]]:
+        """
+        安価なモデルでウィンドウを評価し、不確かな発言だけを model_name で評価し直す
+        
+        Returns:
+            windowと同じ順序の (アノテーションまたは例外, 評価し直した理由（安価なモデルの評価を使った場合はNone）)
+        """
+        if len(self._cascade_tiers) == 1:
+            samples = [self._cascade_tiers[0]._annotate_any(window, meeting_purpose, meeting_format)]
+        else:
+            # サンプルは並行して取得する（呼び出し元の計測トレースを引き継ぐ）
+            with ThreadPoolExecutor(max_workers=len(self._cascade_tiers)) as executor:
+                futures = [
+                    executor.submit(
+                        contextvars.copy_context().run, tier._annotate_any, window, meeting_purpose, meeting_format
+                    )
+                    for tier in self._cascade_tiers
+                ]
+                samples = [future.result() for future in futures]
+        
+        results: List[Tuple[Any, Optional[List[str]]]] = []
+        for i in range(len(window)):
+            utterance_samples = [sample[i] for sample in samples]
+            reasons = self._escalation_reasons(utterance_samples, focus_metrics)
+            if reasons:
+                results.append((None, reasons))
+            else:
+                results.append((next(s for s in utterance_samples if self._is_valid_annotation(s)), None))
+        
+        # 評価し直す発言は、連続するものをまとめて model_name で評価する
+        runs: List[List[int]] = []
+        for i, (_, reasons) in enumerate(results):
+            if reasons is None:
+                continue
+            if runs and runs[-1][-1] == i - 1:
+                runs[-1].append(i)
+            else:
+                runs.append([i])
+        for run in runs:
+            for i, annotation in zip(run, self._annotate_any([window[i] for i in run], meeting_purpose, meeting_format)):
+                results[i] = (annotation, results[i][1])
+        return results
+    
     def _annotate_utterance(
         self,
         utterance: Dict[str, str],
@@ -102,96 +486,177 @@ class MetricAnnotator:
         """
         単一の発言にアノテーションを付与
         
+        プロンプトは「指標定義などの固定部分（システムプロンプト）→ 会議ごとの設定 → 発言ごとの内容」の順に並べ、
+        先頭ほど多くのリクエストで共通になるようにしている。
+        
         Returns:
             {"威圧度": {"score": 5, "reason": "..."}, ...}
         """
         # コンテキストを整形
         context_text = "\n".join(context[-5:]) if context else "（会議の冒頭）"
         
-        # 指標定義を整形
-        metrics_text = self._format_metrics_definition()
-        
-        # プロンプト作成
-        prompt = f"""以下の会議における発言を、4つの指標で評価してください。
+        # プロンプト作成（評価対象の発言は最後に置く）
+        prompt = f"""以下の会議における発言を、{len(self.metrics)}つの指標で評価してください。
 
-【会議の目的】
-{meeting_purpose}
+{self._meeting_block(meeting_purpose, meeting_format)}
 
-【会議の形式】
-{meeting_format}
+{utterance_output_format(self.metrics)}
 
 【これまでの発言（直近5件）】
 {context_text}
 
 【評価対象の発言】
-{utterance['speaker']}: {utterance['text']}
+{utterance['speaker']}: {utterance['text']}"""
 
-【評価指標の定義】
-{metrics_text}
-
-【評価方法】
-各指標について0-9の10段階でスコアを付けてください：
-- 0-3: 低スコア（良好な状態）
-- 4-6: 中スコア（普通）
-- 7-9: 高スコア（問題あり）
+        return self._request_json(prompt)
+    
+    def _annotate_window(
+        self,
+        window: List[Tuple[Dict[str, str], List[str]]],
+        meeting_purpose: str,
+        meeting_format: str
+    ) -> List[Dict[str, Dict[str, Any]]]:
+        """
+        連続する複数の発言を1回のLLM呼び出しでまとめて評価する
+        
+        応答は {"0": {...評価する指標...}, "1": {...}, ...} の形式。
+        応答に含まれない・形式が不正な発言は _annotate_utterance で個別に再評価する。
+        
+        Args:
+            window: [(正規化された発言, それまでの発言履歴), ...]
+            
+        Returns:
+            windowと同じ順序のアノテーションのリスト（評価に失敗した発言は例外オブジェクト）
+        """
+        # ウィンドウ先頭の発言の直前5件を共通コンテキストとし、ウィンドウ内の先行発言も文脈として扱わせる
+        first_context = window[0][1]
+        context_text = "\n".join(first_context[-5:]) if first_context else "（会議の冒頭）"
+        targets_text = "\n".join(
+            f"[{i}] {utt['speaker']}: {utt['text']}" for i, (utt, _) in enumerate(window)
+        )
+        
+        window_format = "\n".join("  " + line for line in metric_format(self.metrics).split("\n"))
+        
+        prompt = f"""以下の会議における連続した{len(window)}件の発言を、それぞれ{len(self.metrics)}つの指標で評価してください。
+各発言について、それ以前の発言（評価対象内の先行発言を含む）を文脈として考慮してください。
 
-各指標について、スコアとその理由を簡潔に説明してください。
+{self._meeting_block(meeting_purpose, meeting_format)}
 
 【出力形式】
-以下のJSON形式で出力してください：
+評価対象の発言番号（0〜{len(window) - 1}）をキーとする以下のJSON形式で出力してください：
 {{
-  "威圧度": {{
-    "score": 数値,
-    "reason": "評価理由"
-  }},
-  "逸脱度": {{
-    "score": 数値,
-    "reason": "評価理由"
+  "0": {{
+{window_format}
   }},
-  "発言無効度": {{
-    "score": 数値,
-    "reason": "評価理由"
-  }},
-  "偏り度": {{
-    "score": 数値,
-    "reason": "評価理由"
-  }}
+  ...
 }}
 
-JSONのみを出力し、説明文は不要です。"""
+JSONのみを出力し、説明文は不要です。
 
-        # LLM呼び出し
-        response = self.client.chat.completions.create(
-            model=self.model_name,
-            messages=[
-                {"role": "system", "content": "あなたは会議の質を評価する専門家です。与えられた指標定義に基づいて、発言を客観的に評価します。必ずJSON形式で出力してください。"},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.3,  # 評価の一貫性のため低めに設定
-            response_format={"type": "json_object"}
-        )
-        
-        # レスポンスをパース
-        content = response.choices[0].message.content
+【これまでの発言（直近5件）】
+{context_text}
+
+【評価対象の発言（発言順）】
+{targets_text}"""
         
-        # contentがNoneの場合のエラーハンドリング
-        if content is None:
-            if hasattr(response.choices[0].message, 'refusal') and response.choices[0].message.refusal:
-                raise ValueError(f"LLMがリクエストを拒否しました: {response.choices[0].message.refusal}")
-            raise ValueError("LLMからの応答が空でした。APIキーやモデル名を確認してください。")
+        try:
+            result = self._request_json(prompt)
+        except ValueError as e:
+            print(f"警告: バッチアノテーションに失敗しました。個別に評価します: {e}")
+            result = {}
+        except Exception as e:
+            # 再試行しても回復しなかったAPIエラーは、個別に呼び直さずウィンドウ全体を失敗として記録
+            print(f"警告: バッチアノテーションに失敗しました: {e}")
+            return [e] * len(window)
+
+        annotations = []
+        for i, (utt, context) in enumerate(window):
+            annotation = result.get(str(i)) if isinstance(result, dict) else None
+            if not self._is_valid_annotation(annotation):
+                print(f"警告: バッチ応答に発言[{i}]の有効な評価がありません。個別に評価します")
+                annotation = self._annotate_utterance_safely(utt, context, meeting_purpose, meeting_format)
+            annotations.append(annotation)
         
+        return annotations
+    
+    def _annotate_utterance_safely(
+        self,
+        utterance: Dict[str, str],
+        context: List[str],
+        meeting_purpose: str,
+        meeting_format: str
+    ) -> Any:
+        """_annotate_utterance を呼び出し、失敗した場合は例外を返す（呼び出し元で発言ごとに記録する）"""
         try:
-            result = json.loads(content)
-        except json.JSONDecodeError as e:
-            raise ValueError(f"LLMの応答をJSONとしてパースできませんでした: {e}\n応答内容: {content[:200]}")
+            return self._annotate_utterance(
+                utterance=utterance,
+                context=context,
+                meeting_purpose=meeting_purpose,
+                meeting_format=meeting_format
+            )
+        except Exception as e:
+            print(f"警告: 発言のアノテーションに失敗しました: {utterance['speaker']}: {e}")
+            return e
+    
+    def _is_valid_annotation(self, annotation: Any) -> bool:
+        """アノテーションが評価する全指標について0-9の整数スコアを持つか検証"""
+        if not isinstance(annotation, dict):
+            return False
+        
+        for name in self.metrics:
+            metric = annotation.get(name)
+            if not isinstance(metric, dict):
+                return False
+            score = metric.get("score")
+            if isinstance(score, bool) or not isinstance(score, int) or not 0 <= score <= 9:
+                return False
         
-        return result
+        return True
+    
+    def _request_json(self, prompt: str) -> Any:
+        """LLMを呼び出し、JSON応答をパースして返す"""
+        request = {
+            "model": self.model_name,
+            "messages": [
+                {"role": "system", "content": self.system_prompt.get()},
+                {"role": "user", "content": prompt}
+            ],
+            "temperature": 0.3,  # 評価の一貫性のため低めに設定
+            "response_format": {"type": "json_object"}
+        }
+        if self.seed is not None:
+            # カスケード評価の2つ目以降のサンプル（応答キャッシュもサンプルごとに分ける）
+            request["seed"] = self.seed
+        return self.llm.request_json(request)
+    
+    def _meeting_block(self, meeting_purpose: str, meeting_format: str) -> str:
+        """会議ごとの設定（同じシナリオ内の全発言で共通）"""
+        return f"""【会議の目的】
+{meeting_purpose}
+
+【会議の形式】
+{meeting_format}"""
+    
+    def _build_system_prompt(self, metrics_def: Dict[str, Any]) -> str:
+        """指標定義と評価方法を含む、全リクエスト共通のシステムプロンプトを組み立てる"""
+        return f"""{SYSTEM_PROMPT}
+
+【評価指標の定義】
+{self._format_metrics_definition(metrics_def)}
+
+【評価方法】
+各指標について0-9の10段階でスコアを付けてください：
+- 0-3: 低スコア（良好な状態）
+- 4-6: 中スコア（普通）
+- 7-9: 高スコア（問題あり）
+
+各指標について、スコアとその理由を簡潔に説明してください。"""
     
-    def _format_metrics_definition(self) -> str:
+    def _format_metrics_definition(self, metrics_def: Dict[str, Any]) -> str:
         """指標定義を文字列として整形"""
         formatted = []
         
-        for metric_name, metric_def in self.metrics_def.items():
+        for metric_name, metric_def in metrics_def.items():
             text = f"\n【{metric_name}】\n"
             text += f"定義: {metric_def.get('定義', '')}\n"
             
@@ -0,0 +1,292 @@
+"""
+mock_openai_server.py
+ベンチマーク・動作確認用に、OpenAI互換の chat completions エンドポイントをローカルで提供するモックサーバー
+
+使用例:
+    python mock_openai_server.py --port 8001 --latency 0.3 --error-rate 0.05
+    OPENAI_BASE_URL=http://127.0.0.1:8001/v1 python app.py
+
+プロンプトの内容から、シナリオ生成・単一発言の評価・バッチ評価のいずれかを判定し、
+決定的なダミーのJSON応答（canned response）を返す。
+"""
+import argparse
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+
+
+METRIC_NAMES = ["威圧度", "逸脱度", "発言無効度", "偏り度"]
+
+
+class MockBehavior:
+    """モックサーバーの応答遅延・エラー率の設定と、受け付けたリクエスト数"""
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        error_rate: float = 0.0,
+        error_status: int = 429,
+        retry_after: Optional[float] = None,
+        seed: Optional[int] = None,
+        chunk_delay: float = 0.0,
+        chunk_chars: int = 16
+    ):
+        """
+        Args:
+            latency: 応答までの平均遅延（秒）
+            jitter: 遅延のばらつき（latency±jitterの一様分布）
+            error_rate: エラー応答を返す確率（0〜1）
+            error_status: エラー応答のステータスコード（429, 500, 503など）
+            retry_after: エラー応答に付けるRetry-Afterヘッダー（秒、Noneの場合は付けない）
+            seed: 乱数シード（遅延・エラーの発生を再現したい場合）
+            chunk_delay: 応答の断片ごとの遅延（秒、トークン生成の速さの代わり）。ストリーミングでない応答は
+                         全断片分の遅延の後に返す
+            chunk_chars: ストリーミング応答の1断片の文字数
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.retry_after = retry_after
+        self.chunk_delay = chunk_delay
+        self.chunk_chars = max(1, chunk_chars)
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._seen_system_prompts = set()
+        self.requests = 0
+        self.errors = 0
+
+    def next_delay_and_error(self) -> Tuple[float, bool]:
+        with self._lock:
+            self.requests += 1
+            delay = max(0.0, self.latency + self._random.uniform(-self.jitter, self.jitter))
+            failed = self._random.random() < self.error_rate
+            if failed:
+                self.errors += 1
+            return delay, failed
+
+    def cached_tokens(self, system_prompt: str) -> int:
+        """同じシステムプロンプトが2回目以降であれば、プロンプトキャッシュが効いたとみなすトークン数"""
+        with self._lock:
+            if system_prompt in self._seen_system_prompts:
+                return len(system_prompt)
+            self._seen_system_prompts.add(system_prompt)
+            return 0
+
+
+def _fake_annotation(target: str, metrics: List[str] = METRIC_NAMES) -> Dict[str, Dict[str, Any]]:
+    """評価対象の発言から決定的なスコアを作る（指標ごとのスコアは評価する指標の組み合わせによらない）"""
+    digest = hashlib.sha256(target.encode("utf-8")).digest()
+    return {
+        name: {"score": digest[i] % 10, "reason": f"モック評価（{name}）"}
+        for i, name in enumerate(METRIC_NAMES) if name in metrics
+    }
+
+
+def _fake_scenario(prompt: str) -> Dict[str, Any]:
+    """シナリオ生成プロンプトの発言数・登場人物から決定的なシナリオを作る"""
+    match = re.search(r"発言数: 約(\d+)個", prompt)
+    num_utterances = int(match.group(1)) if match else 20
+    speakers = re.findall(r"◆ キャラクター: (.+)", prompt) or ["参加者A", "参加者B"]
+    # 分割生成の場合は会議全体での発言番号を使い、要約も返す
+    segment = re.search(r"今回は第(\d+)〜(\d+)発言", prompt)
+    start = int(segment.group(1)) - 1 if segment else 0
+    # Best-of-Nの候補ごとに異なる発言（評価スコアも変わる）にする
+    variant = re.search(r"生成する候補(\d+)です", prompt)
+    suffix = f"（候補{variant.group(1)}）" if variant else ""
+    result = {"scenario": [
+        {"speaker": speakers[i % len(speakers)], "text": f"モック発言{i + 1}です{suffix}。議題について意見を述べます。"}
+        for i in range(start, start + num_utterances)
+    ]}
+    if segment:
+        result["summary"] = f"第{start + num_utterances}発言まで議題について意見を述べた。"
+    return result
+
+
+def canned_response(messages: List[Dict[str, str]]) -> Any:
+    """プロンプトの種類に応じたダミーのJSON応答"""
+    prompt = messages[-1].get("content", "") if messages else ""
+    # 出力形式に含まれる指標だけを評価する（一部の指標だけを評価するプロンプト）
+    metrics = [name for name in METRIC_NAMES if f'"{name}": {{' in prompt] or METRIC_NAMES
+
+    if "【評価対象の発言（発言順）】\n" in prompt:
+        block = prompt.split("【評価対象の発言（発言順）】\n", 1)[1].split("\n\n", 1)[0]
+        result = {}
+        for line in block.split("\n"):
+            match = re.match(r"\[(\d+)\] (.*)", line)
+            if match:
+                result[match.group(1)] = _fake_annotation(match.group(2), metrics)
+        return result
+    if "【評価対象の発言】\n" in prompt:
+        target = prompt.split("【評価対象の発言】\n", 1)[1].split("\n", 1)[0]
+        return _fake_annotation(target, metrics)
+    if "■ 会議設定" in prompt:
+        return _fake_scenario(prompt)
+    return {"ok": True}
+
+
+class MockOpenAIHandler(BaseHTTPRequestHandler):
+    """POST /v1/chat/completions だけを受け付けるハンドラ"""
+
+    behavior: MockBehavior = MockBehavior()
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        try:
+            body = json.loads(self.rfile.read(length) or b"{}")
+        except json.JSONDecodeError:
+            self._send_json(400, {"error": {"message": "invalid JSON", "type": "invalid_request_error"}})
+            return
+
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": f"unknown path: {self.path}", "type": "invalid_request_error"}})
+            return
+
+        delay, failed = self.behavior.next_delay_and_error()
+        time.sleep(delay)
+
+        if failed:
+            headers = {}
+            if self.behavior.retry_after is not None:
+                headers["retry-after"] = str(self.behavior.retry_after)
+            self._send_json(self.behavior.error_status, {"error": {
+                "message": "mock error",
+                "type": "rate_limit_error" if self.behavior.error_status == 429 else "server_error",
+                "code": None
+            }}, headers)
+            return
+
+        messages = body.get("messages", [])
+        content = json.dumps(canned_response(messages), ensure_ascii=False)
+        system_prompt = messages[0].get("content", "") if messages and messages[0].get("role") == "system" else ""
+        prompt_tokens = sum(len(m.get("content") or "") for m in messages)
+        completion_tokens = len(content)
+
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+            "prompt_tokens_details": {"cached_tokens": self.behavior.cached_tokens(system_prompt)}
+        }
+        if body.get("stream"):
+            include_usage = (body.get("stream_options") or {}).get("include_usage", False)
+            self._send_stream(body.get("model", "mock"), content, usage if include_usage else None)
+            return
+        time.sleep(self.behavior.chunk_delay * -(-len(content) // self.behavior.chunk_chars))
+
+        self._send_json(200, {
+            "id": f"chatcmpl-mock-{self.behavior.requests}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "mock"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content, "refusal": None},
+                "finish_reason": "stop"
+            }],
+            "usage": usage
+        })
+
+    def _send_stream(self, model: str, content: str, usage: Optional[Dict[str, Any]]) -> None:
+        """応答をchunk_chars文字ずつServer-Sent Events（chat.completion.chunk）で返す"""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+        base = {"id": f"chatcmpl-mock-{self.behavior.requests}", "object": "chat.completion.chunk",
+                "created": int(time.time()), "model": model}
+        size = self.behavior.chunk_chars
+        events = [{**base, "choices": [{"index": 0, "delta": {"role": "assistant", "content": ""}, "finish_reason": None}]}]
+        events += [
+            {**base, "choices": [{"index": 0, "delta": {"content": content[i:i + size]}, "finish_reason": None}]}
+            for i in range(0, len(content), size)
+        ]
+        events.append({**base, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]})
+        if usage is not None:
+            events.append({**base, "choices": [], "usage": usage})
+
+        for i, event in enumerate(events):
+            if i and self.behavior.chunk_delay:
+                time.sleep(self.behavior.chunk_delay)
+            self.wfile.write(f"data: {json.dumps(event, ensure_ascii=False)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+    def _send_json(self, status: int, data: Any, headers: Optional[Dict[str, str]] = None) -> None:
+        payload = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass  # リクエストごとのアクセスログは出さない
+
+
+class MockServer(ThreadingHTTPServer):
+    """リクエストごとにスレッドで応答するモックサーバー"""
+
+    # 既定の待ち受けキュー（5）では並列リクエストの接続が取りこぼされ、TCPの再送待ちで遅延が測定に混ざる
+    request_queue_size = 1024
+
+
+def start_mock_server(behavior: Optional[MockBehavior] = None, host: str = "127.0.0.1", port: int = 0) -> MockServer:
+    """
+    モックサーバーをバックグラウンドスレッドで起動する
+
+    Args:
+        behavior: 遅延・エラー率の設定
+        port: 待ち受けポート（0の場合は空いているポート）
+
+    Returns:
+        起動したサーバー（server.base_url がOpenAIクライアントの base_url、停止は server.shutdown()）
+    """
+    handler = type("Handler", (MockOpenAIHandler,), {"behavior": behavior or MockBehavior()})
+    server = MockServer((host, port), handler)
+    server.daemon_threads = True
+    server.base_url = f"http://{host}:{server.server_address[1]}/v1"
+    server.behavior = handler.behavior
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main(argv: List[str] = None) -> None:
+    parser = argparse.ArgumentParser(description="OpenAI互換のモックサーバー")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency", type=float, default=0.0, help="平均応答遅延（秒）")
+    parser.add_argument("--jitter", type=float, default=0.0, help="応答遅延のばらつき（秒）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="エラー応答の確率（0〜1）")
+    parser.add_argument("--error-status", type=int, default=429, help="エラー応答のステータスコード")
+    parser.add_argument("--retry-after", type=float, help="エラー応答に付けるRetry-After（秒）")
+    parser.add_argument("--seed", type=int, help="乱数シード")
+    parser.add_argument("--chunk-delay", type=float, default=0.0, help="ストリーミング応答の断片ごとの遅延（秒）")
+    args = parser.parse_args(argv)
+
+    behavior = MockBehavior(
+        args.latency, args.jitter, args.error_rate, args.error_status, args.retry_after, args.seed, args.chunk_delay
+    )
+    server = start_mock_server(behavior, args.host, args.port)
+    print(f"モックサーバー起動中: {server.base_url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
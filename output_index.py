@@ -0,0 +1,349 @@
+"""
+output_index.py
+出力シナリオのメタデータをSQLiteに索引化するモジュール
+
+ディスク全体の走査（refresh）は一覧の取得（query / filenames）では行わず、
+バックグラウンドのスレッド（start_background_refresh）か明示的な呼び出しで行う。
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+
+# 重点指標が記録されていない古い出力で、プロフィール名の接頭辞から推定するための指標名
+KNOWN_METRICS = ["威圧度", "逸脱度", "発言無効度", "偏り度"]
+
+COLUMNS = [
+    "filename",
+    "mtime",
+    "size",
+    "generated_at",
+    "meeting_purpose",
+    "meeting_format",
+    "num_utterances",
+    "profile_filename",
+    "focus_metrics",
+    "target_ratio",
+    "scenario_model",
+    "annotation_model",
+    "has_human_annotations",
+]
+
+
+class OutputIndex:
+    """出力ディレクトリ（サブディレクトリを含む）のシナリオJSONのメタデータを保持する索引"""
+
+    def __init__(self, outputs_dir: str, index_path: str, refresh_interval: float = 10.0):
+        """
+        Args:
+            outputs_dir: シナリオ出力ディレクトリ
+            index_path: 索引のSQLiteファイルのパス
+            refresh_interval: ディスク上の変更を確認する最短間隔（秒、バックグラウンドでの確認間隔）
+        """
+        self.outputs_dir = Path(outputs_dir)
+        self.index_path = index_path
+        self.refresh_interval = refresh_interval
+        self._last_refresh = 0.0
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        Path(index_path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(index_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        with self._conn:
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS outputs (
+                    filename TEXT PRIMARY KEY,
+                    mtime REAL,
+                    size INTEGER,
+                    generated_at TEXT,
+                    meeting_purpose TEXT,
+                    meeting_format TEXT,
+                    num_utterances INTEGER,
+                    profile_filename TEXT,
+                    focus_metrics TEXT,
+                    target_ratio INTEGER,
+                    scenario_model TEXT,
+                    annotation_model TEXT,
+                    has_human_annotations INTEGER
+                )
+            """)
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_outputs_generated_at ON outputs (generated_at)")
+            # シナリオJSONとして読み込めなかったファイル（シナリオ以外のJSON・書き込み前の空ファイルなど）。
+            # mtime・サイズが変わるまで読み直さない
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS skipped (
+                    filename TEXT PRIMARY KEY,
+                    mtime REAL,
+                    size INTEGER
+                )
+            """)
+
+    def refresh(self, force: bool = False) -> int:
+        """
+        ディスク上のファイルとmtime・サイズを比較し、追加・変更されたファイルだけを再読み込みする
+
+        Args:
+            force: Trueの場合はrefresh_intervalに関係なく確認する
+
+        Returns:
+            更新（追加・変更・削除）された件数
+        """
+        now = time.monotonic()
+        if not force and now - self._last_refresh < self.refresh_interval:
+            return 0
+        self._last_refresh = now
+
+        # バックグラウンドのスレッドと明示的な呼び出しが重ならないようにする
+        with self._refresh_lock:
+            with self._lock:
+                known = {
+                    row["filename"]: (row["mtime"], row["size"])
+                    for row in self._conn.execute("SELECT filename, mtime, size FROM outputs")
+                }
+                skipped = {
+                    row["filename"]: (row["mtime"], row["size"])
+                    for row in self._conn.execute("SELECT filename, mtime, size FROM skipped")
+                }
+
+            seen = set()
+            changed = 0
+            for path in self.outputs_dir.rglob("*.json"):
+                filename = self._relative_name(path)
+                seen.add(filename)
+                try:
+                    stat = path.stat()
+                except FileNotFoundError:
+                    continue
+                current = (stat.st_mtime, stat.st_size)
+                if known.get(filename) != current and skipped.get(filename) != current:
+                    if self.upsert(path):
+                        changed += 1
+
+            removed = [filename for filename in known if filename not in seen]
+            with self._lock, self._conn:
+                self._conn.executemany(
+                    "DELETE FROM skipped WHERE filename = ?", [(f,) for f in skipped if f not in seen]
+                )
+                if removed:
+                    self._conn.executemany("DELETE FROM outputs WHERE filename = ?", [(f,) for f in removed])
+            changed += len(removed)
+
+        return changed
+
+    def start_background_refresh(self) -> None:
+        """refresh_interval ごとにディスク上の変更を確認するスレッドを開始する（最初の確認はすぐに行う）"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._refresh_loop, name="output-index-refresh", daemon=True)
+        self._thread.start()
+
+    def stop_background_refresh(self) -> None:
+        """バックグラウンドの確認を止める"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _refresh_loop(self) -> None:
+        while not self._stop.is_set():
+            try:
+                self.refresh(force=True)
+            except (OSError, sqlite3.Error) as e:
+                print(f"警告: 出力索引を更新できませんでした: {e}")
+            self._stop.wait(max(self.refresh_interval, 0.1))
+
+    def upsert(self, path: Path) -> bool:
+        """
+        1ファイル分のメタデータを索引に登録・更新する（出力ファイルの書き込み後に呼び出す）
+
+        Returns:
+            登録できた場合True（シナリオJSONとして読み込めない場合はFalse。変更されるまで refresh で読み直さない）
+        """
+        path = Path(path)
+        try:
+            stat = path.stat()
+        except OSError:
+            return False
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, UnicodeDecodeError, json.JSONDecodeError):
+            data = None
+
+        if not isinstance(data, dict) or not isinstance(data.get("scenario"), list):
+            self._skip(path, stat)
+            return False
+
+        metadata = data.get("metadata", {})
+        row = {
+            "filename": self._relative_name(path),
+            "mtime": stat.st_mtime,
+            "size": stat.st_size,
+            "generated_at": metadata.get("generated_at", ""),
+            "meeting_purpose": metadata.get("meeting_purpose", ""),
+            "meeting_format": metadata.get("meeting_format", ""),
+            "num_utterances": metadata.get("num_utterances", 0),
+            "profile_filename": metadata.get("profile_filename", ""),
+            "focus_metrics": json.dumps(self._focus_metrics(metadata), ensure_ascii=False),
+            "target_ratio": metadata.get("target_ratio"),
+            "scenario_model": metadata.get("scenario_model") or metadata.get("model", ""),
+            "annotation_model": metadata.get("annotation_model") or metadata.get("model", ""),
+            "has_human_annotations": int(any("human_annotations" in utt for utt in data["scenario"] if isinstance(utt, dict))),
+        }
+
+        placeholders = ", ".join("?" for _ in COLUMNS)
+        with self._lock, self._conn:
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO outputs ({', '.join(COLUMNS)}) VALUES ({placeholders})",
+                [row[column] for column in COLUMNS]
+            )
+            self._conn.execute("DELETE FROM skipped WHERE filename = ?", (row["filename"],))
+        return True
+
+    def _skip(self, path: Path, stat: os.stat_result) -> None:
+        """シナリオJSONとして読み込めなかったファイルを記録する（一覧からは外す）"""
+        filename = self._relative_name(path)
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM outputs WHERE filename = ?", (filename,))
+            self._conn.execute(
+                "INSERT OR REPLACE INTO skipped (filename, mtime, size) VALUES (?, ?, ?)",
+                (filename, stat.st_mtime, stat.st_size)
+            )
+
+    def mark_human_annotated(self, path: Path) -> None:
+        """人手アノテーションあり（出力JSONに未反映の編集ログを含む）として記録"""
+        filename = self._relative_name(Path(path))
+        with self._lock:
+            registered = self._conn.execute("SELECT 1 FROM outputs WHERE filename = ?", (filename,)).fetchone()
+        if not registered and not self.upsert(path):
+            return
+        with self._lock, self._conn:
+            self._conn.execute("UPDATE outputs SET has_human_annotations = 1 WHERE filename = ?", (filename,))
+
+    def remove(self, path: Path) -> None:
+        """ファイルを索引から削除"""
+        filename = self._relative_name(Path(path))
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM outputs WHERE filename = ?", (filename,))
+            self._conn.execute("DELETE FROM skipped WHERE filename = ?", (filename,))
+
+    def query(
+        self,
+        page: int = 1,
+        per_page: int = 100,
+        focus_metric: Optional[str] = None,
+        profile: Optional[str] = None,
+        date_from: Optional[str] = None,
+        date_to: Optional[str] = None,
+        directory: Optional[str] = None
+    ) -> Tuple[List[Dict[str, Any]], int]:
+        """
+        条件に合う出力を新しい順に1ページ分取得
+
+        Args:
+            page: ページ番号（1始まり）
+            per_page: 1ページあたりの件数
+            focus_metric: 重点指標（例: "逸脱度"）
+            profile: プロフィールファイル名（部分一致）
+            date_from: 生成日の下限（YYYY-MM-DD、この日を含む）
+            date_to: 生成日の上限（YYYY-MM-DD、この日を含む）
+            directory: 出力ディレクトリからの相対サブディレクトリ（例: "新しいシナリオ"）
+
+        Returns:
+            (出力のリスト, 条件に合う総件数)
+        """
+        where, args = self._where(focus_metric, profile, date_from, date_to, directory)
+
+        page = max(1, page)
+        per_page = max(1, per_page)
+        with self._lock:
+            total = self._conn.execute(f"SELECT COUNT(*) FROM outputs {where}", args).fetchone()[0]
+            rows = self._conn.execute(
+                f"SELECT * FROM outputs {where} ORDER BY generated_at DESC, filename DESC LIMIT ? OFFSET ?",
+                args + [per_page, (page - 1) * per_page]
+            ).fetchall()
+
+        return [self._row_to_dict(row) for row in rows], total
+
+    def filenames(
+        self,
+        focus_metric: Optional[str] = None,
+        profile: Optional[str] = None,
+        date_from: Optional[str] = None,
+        date_to: Optional[str] = None,
+        directory: Optional[str] = None
+    ) -> List[str]:
+        """条件（query と同じ）に合う全出力のファイル名（出力ディレクトリからの相対パス、新しい順）"""
+        where, args = self._where(focus_metric, profile, date_from, date_to, directory)
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT filename FROM outputs {where} ORDER BY generated_at DESC, filename DESC", args
+            ).fetchall()
+        return [row["filename"] for row in rows]
+
+    def _where(
+        self,
+        focus_metric: Optional[str],
+        profile: Optional[str],
+        date_from: Optional[str],
+        date_to: Optional[str],
+        directory: Optional[str]
+    ) -> Tuple[str, List[Any]]:
+        """絞り込み条件のWHERE句とパラメータ"""
+        conditions = []
+        args: List[Any] = []
+        if focus_metric:
+            conditions.append("focus_metrics LIKE ?")
+            args.append(f'%"{focus_metric}"%')
+        if profile:
+            conditions.append("profile_filename LIKE ?")
+            args.append(f"%{profile}%")
+        if date_from:
+            conditions.append("substr(generated_at, 1, 10) >= ?")
+            args.append(date_from[:10])
+        if date_to:
+            conditions.append("substr(generated_at, 1, 10) <= ?")
+            args.append(date_to[:10])
+        if directory is not None:
+            directory = directory.strip("/")
+            if directory:
+                conditions.append("filename LIKE ?")
+                args.append(f"{directory}/%")
+            else:
+                conditions.append("instr(filename, '/') = 0")
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        return where, args
+
+    def _relative_name(self, path: Path) -> str:
+        """出力ディレクトリからの相対パス（区切りは常に/）"""
+        return Path(os.path.relpath(path, self.outputs_dir)).as_posix()
+
+    def _focus_metrics(self, metadata: Dict[str, Any]) -> List[str]:
+        """重点指標を取得（記録がない場合はプロフィール名の接頭辞から推定）"""
+        if metadata.get("focus_metrics"):
+            return list(metadata["focus_metrics"])
+        prefix = Path(metadata.get("profile_filename", "")).stem.split("_", 1)[0]
+        return [prefix] if prefix in KNOWN_METRICS else []
+
+    def _row_to_dict(self, row: sqlite3.Row) -> Dict[str, Any]:
+        return {
+            "filename": row["filename"],
+            "generated_at": row["generated_at"],
+            "meeting_purpose": row["meeting_purpose"],
+            "meeting_format": row["meeting_format"],
+            "num_utterances": row["num_utterances"],
+            "profile_filename": row["profile_filename"],
+            "focus_metrics": json.loads(row["focus_metrics"] or "[]"),
+            "target_ratio": row["target_ratio"],
+            "scenario_model": row["scenario_model"],
+            "annotation_model": row["annotation_model"],
+            "has_human_annotations": bool(row["has_human_annotations"]),
+        }
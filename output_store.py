@@ -0,0 +1,133 @@
+"""
+output_store.py
+シナリオ出力JSONの作成・保存を行うモジュール（app.pyとバッチCLIで共通）
+"""
+import json
+import os
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import telemetry
+
+
+def build_output_data(
+    annotated_scenario: List[Dict[str, Any]],
+    meeting_purpose: str,
+    meeting_format: str,
+    profile_filename: str,
+    focus_metrics: Optional[List[str]],
+    target_ratio: Optional[int],
+    scenario_model: str,
+    annotation_model: str,
+    sanitize_mode: bool,
+    trace_summary: Optional[Dict[str, Any]] = None,
+    selection: Optional[Dict[str, Any]] = None,
+    cascade_model: Optional[str] = None,
+    annotation_metrics: Optional[List[str]] = None
+) -> Dict[str, Any]:
+    """
+    出力JSON（metadata + scenario）を作成
+
+    trace_summary を渡した場合は、生成・アノテーションの所要時間とコスト（telemetry.Trace.summary()）を
+    metadata.telemetry に保存する。
+    selection を渡した場合は、複数の候補から選んだ記録（best_of_n.CandidateSelector.select）を metadata.best_of_n に保存する。
+    cascade_model（カスケード評価の安価なモデル）を渡した場合は、発言ごとの評価段階（annotation_tier）と
+    上位モデルで評価し直した理由の件数を metadata.annotation_cascade に保存する。
+    annotation_metrics（一部の指標だけを評価した場合の指標）を渡した場合は metadata.annotation_metrics に保存する
+    （残りの指標は reannotate.py の missing モードで後から評価できる）
+    """
+    data = {
+        "metadata": {
+            "generated_at": datetime.now().isoformat(),
+            "meeting_purpose": meeting_purpose,
+            "meeting_format": meeting_format,
+            "num_utterances": len(annotated_scenario),
+            "profile_filename": profile_filename,
+            "focus_metrics": focus_metrics or [],
+            "target_ratio": target_ratio if focus_metrics else None,
+            "scenario_model": scenario_model,
+            "annotation_model": annotation_model,
+            "sanitize_mode": sanitize_mode,
+            # 再試行しても評価できなかった発言数（該当発言は "annotation_error" を持つ）
+            "annotation_errors": sum(1 for utt in annotated_scenario if "annotation_error" in utt)
+        },
+        "scenario": annotated_scenario
+    }
+    local_estimates = sum(1 for utt in annotated_scenario if utt.get("annotation_tier") == "local")
+    if local_estimates:
+        # API障害時にローカル評価モデルの推定で補った発言数（MetricAnnotator の fallback）
+        data["metadata"]["local_estimates"] = local_estimates
+    if trace_summary is not None:
+        data["metadata"]["telemetry"] = trace_summary
+    if annotation_metrics:
+        data["metadata"]["annotation_metrics"] = list(annotation_metrics)
+    if selection is not None:
+        data["metadata"]["best_of_n"] = selection
+    if cascade_model:
+        tiers: Dict[str, int] = {}
+        escalations: Dict[str, int] = {}
+        for utt in annotated_scenario:
+            if "annotation_tier" in utt:
+                tiers[utt["annotation_tier"]] = tiers.get(utt["annotation_tier"], 0) + 1
+            for reason in utt.get("escalation", []):
+                escalations[reason] = escalations.get(reason, 0) + 1
+        data["metadata"]["annotation_cascade"] = {
+            "cheap_model": cascade_model,
+            "tiers": tiers,
+            "escalations": escalations
+        }
+    return data
+
+
+def new_output_path(outputs_dir: str, profile_filename: str) -> Path:
+    """
+    {タイムスタンプ}_{プロフィール名}.json 形式の保存先を確保する
+
+    同じ秒に同じプロフィールで複数保存される場合（並列実行時など）は連番を付けて重複を避ける。
+    """
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    profile_base = Path(profile_filename).stem  # 拡張子を除いたファイル名
+    Path(outputs_dir).mkdir(parents=True, exist_ok=True)
+
+    suffix = 1
+    while True:
+        name = f"{timestamp}_{profile_base}.json" if suffix == 1 else f"{timestamp}_{profile_base}_{suffix}.json"
+        output_path = Path(outputs_dir) / name
+        try:
+            # 空ファイルを排他的に作成して名前を予約する
+            with open(output_path, 'x', encoding='utf-8'):
+                pass
+            return output_path
+        except FileExistsError:
+            suffix += 1
+
+
+def read_json(path: Path) -> Any:
+    """出力JSONを読み込む（読み込み時間・サイズを計測する）"""
+    start = time.perf_counter()
+    with open(path, 'rb') as f:
+        raw = f.read()
+    data = json.loads(raw.decode('utf-8'))
+    telemetry.record_file_io("read", path, time.perf_counter() - start, len(raw))
+    return data
+
+
+def write_json_atomic(path: Path, data: Any) -> None:
+    """一時ファイルに書き込んでからリネームし、書き込み途中の状態が見えないようにする"""
+    path = Path(path)
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    start = time.perf_counter()
+    try:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+            size = f.tell()
+        os.replace(tmp_path, path)
+        telemetry.record_file_io("write", path, time.perf_counter() - start, size)
+    finally:
+        if tmp_path.exists():
+            tmp_path.unlink()
@@ -0,0 +1,54 @@
+"""
+prompt_templates.py
+指標定義ファイル（extra.json）から組み立てるプロンプトの静的部分を保持するモジュール
+"""
+import threading
+from typing import Any, Callable, Dict, Generic, Optional, TypeVar
+
+
+T = TypeVar("T")
+
+
+class CompiledPrompt(Generic[T]):
+    """
+    定義ファイルから一度だけ組み立てたプロンプト部品を保持し、定義が読み直された場合だけ組み立て直すクラス
+
+    プロンプトの静的部分を毎回同じ文字列にすることで、リクエストの先頭（prefix）が一致し、
+    OpenAIの自動プロンプトキャッシュが効くようになる。
+    """
+
+    def __init__(
+        self,
+        path: str,
+        load: Callable[[str], Dict[str, Any]],
+        build: Callable[[Dict[str, Any]], T]
+    ):
+        """
+        Args:
+            path: 定義ファイルのパス
+            load: 定義を取得する関数 load(path)（ConfigCacheのように、ファイルが変わらなければ同じオブジェクトを返すこと）
+            build: 読み込んだ定義からプロンプト部品を組み立てる関数 build(定義)
+        """
+        self.path = path
+        self._load = load
+        self._build = build
+        self._lock = threading.Lock()
+        self._definitions: Optional[Dict[str, Any]] = None
+        self._value: Optional[T] = None
+        self.get()
+
+    def get(self) -> T:
+        """組み立て済みのプロンプト部品を返す（定義ファイルが更新されていれば組み立て直す）"""
+        definitions = self._load(self.path)
+        with self._lock:
+            if self._value is None or definitions is not self._definitions:
+                # 組み立て終えてから定義と部品をまとめて差し替える
+                self._value = self._build(definitions)
+                self._definitions = definitions
+            return self._value
+
+    @property
+    def definitions(self) -> Dict[str, Any]:
+        """最後に読み込んだ定義"""
+        self.get()
+        return self._definitions
@@ -0,0 +1,63 @@
+"""
+rate_limiter.py
+複数スレッドから共有するトークンバケット方式のレート制限
+"""
+import threading
+import time
+
+
+class RateLimiter:
+    """1分あたりの上限を平滑化して適用するトークンバケット"""
+
+    def __init__(self, per_minute: float, burst: float = None):
+        """
+        Args:
+            per_minute: 1分あたりに許可する量（リクエスト数など）。0以下の場合は制限しない
+            burst: 一度に消費できる最大量（Noneの場合はper_minuteと同じ）
+        """
+        self.per_minute = per_minute
+        self.capacity = burst if burst is not None else per_minute
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, amount: float = 1.0) -> float:
+        """
+        指定量のトークンが貯まるまで待ってから消費する
+
+        Returns:
+            待機した秒数
+        """
+        if self.per_minute <= 0:
+            return 0.0
+
+        # バケット容量を超える要求は容量分だけ待てば通す
+        amount = min(amount, self.capacity)
+        waited = 0.0
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= amount:
+                    self._tokens -= amount
+                    return waited
+                wait = (amount - self._tokens) * 60.0 / self.per_minute
+            time.sleep(wait)
+            waited += wait
+
+    def adjust(self, amount: float) -> None:
+        """
+        消費量を後から補正する（見積もりで消費した量と実際の量の差を精算する場合など）
+
+        Args:
+            amount: 追加で消費する量（負の場合は返却）。残量がマイナスになった分は後の acquire が待機する
+        """
+        if self.per_minute <= 0:
+            return
+        with self._lock:
+            self._refill()
+            self._tokens = min(self.capacity, self._tokens - amount)
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.per_minute / 60.0)
+        self._updated = now
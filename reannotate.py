@@ -0,0 +1,287 @@
+"""
+reannotate.py
+保存済みシナリオのうち、評価が欠けている・変更された発言だけを再アノテーションするモジュール（CLIとしても実行可能）
+
+使用例:
+    python reannotate.py data/outputs/20241210_172130_トライアル_飲み会ズレ.json
+    python reannotate.py data/outputs/*.json --mode changed
+    python reannotate.py data/outputs/*.json --mode all --model gpt-4o   # モデル変更時の全件再評価
+"""
+import argparse
+import os
+import sys
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+import telemetry
+from llm_cache import LLMCache
+from llm_client import LLMClient
+from metric_annotator import METRIC_NAMES, MetricAnnotator
+from annotation_store import AnnotationStore
+
+
+# missing: 評価がない・評価に失敗した・ローカル評価で補った発言と、一部の指標だけを評価した発言（欠けている指標だけを評価する）
+# changed: missingに加え、評価後に発言（または直前5件の発言）が変更された発言
+# all: 全発言
+MODES = ("missing", "changed", "all")
+
+
+def _annotations(utt: Dict[str, Any]) -> Dict[str, Any]:
+    """発言の機械アノテーション（人手アノテーション保存後は machine_annotations に移動している）"""
+    return utt.get("machine_annotations") or utt.get("metrics") or {}
+
+
+def missing_metrics(utt: Dict[str, Any]) -> List[str]:
+    """発言の機械アノテーションに欠けている指標（METRIC_NAMES の順）"""
+    annotations = _annotations(utt)
+    return [name for name in METRIC_NAMES if name not in annotations]
+
+
+def local_estimate(utt: Dict[str, Any]) -> bool:
+    """API障害時にローカル評価モデルの推定で補った評価を含むか（LLMで評価し直す対象）"""
+    return utt.get("annotation_tier") == "local" or any(
+        isinstance(value, dict) and value.get("source") == "local" for value in _annotations(utt).values()
+    )
+
+
+def _metric_order(name: str) -> int:
+    return METRIC_NAMES.index(name) if name in METRIC_NAMES else len(METRIC_NAMES)
+
+
+def _changed(utt: Dict[str, Any], current_hash: str) -> bool:
+    # ハッシュが記録されていない古い出力は変更を判定できないため変更なしとみなす
+    return bool(utt.get("annotation_hash")) and utt["annotation_hash"] != current_hash
+
+
+def select_utterances(scenario: List[Dict[str, Any]], hashes: List[str], mode: str) -> List[int]:
+    """
+    再アノテーションする発言のインデックスを選ぶ
+
+    Args:
+        scenario: 出力JSONのシナリオ
+        hashes: MetricAnnotator.annotation_hashes で計算した現在の評価入力のハッシュ
+        mode: MODES のいずれか
+
+    Returns:
+        発言のインデックスのリスト
+    """
+    if mode not in MODES:
+        raise ValueError(f"modeは {', '.join(MODES)} のいずれかを指定してください: {mode}")
+
+    selected = []
+    for i, utt in enumerate(scenario):
+        if mode == "all" or "annotation_error" in utt or local_estimate(utt) or missing_metrics(utt):
+            selected.append(i)
+        elif mode == "changed" and _changed(utt, hashes[i]):
+            selected.append(i)
+    return selected
+
+
+def group_by_metrics(
+    scenario: List[Dict[str, Any]],
+    hashes: List[str],
+    mode: str,
+    selected: List[int]
+) -> Dict[Optional[Tuple[str, ...]], List[int]]:
+    """
+    再アノテーションする発言を、評価する指標ごとにまとめる
+
+    一部の指標だけが欠けている発言（重点指標だけを評価した出力など）は、欠けている指標だけを評価する。
+    全発言を評価し直す場合・評価に失敗した発言・ローカル評価で補った発言・評価後に変更された発言は全指標を評価する。
+
+    Returns:
+        {評価する指標のタプル（全指標の場合はNone）: 発言のインデックスのリスト}
+    """
+    groups: Dict[Optional[Tuple[str, ...]], List[int]] = {}
+    for i in selected:
+        utt = scenario[i]
+        missing = missing_metrics(utt)
+        if (mode == "all" or "annotation_error" in utt or local_estimate(utt) or _changed(utt, hashes[i])
+                or len(missing) == len(METRIC_NAMES)):
+            key = None
+        else:
+            key = tuple(missing)
+        groups.setdefault(key, []).append(i)
+    return groups
+
+
+def reannotate_output(
+    annotator: MetricAnnotator,
+    path: Path,
+    mode: str = "missing",
+    on_progress: Optional[Callable[[int, int], None]] = None,
+    store: Optional[AnnotationStore] = None
+) -> Dict[str, Any]:
+    """
+    出力JSONの発言を再アノテーションし、ファイルに書き戻す
+
+    会議の目的・形式は出力JSONのメタデータを使い、コンテキスト（直近5件の発言）は現在の発言から組み立て直す。
+    一部の指標だけが欠けている発言は、欠けている指標だけを評価して既存の評価に加える（group_by_metrics）。
+    人手アノテーションは変更しない。評価中に保存された人手アノテーションを消さないよう、
+    書き戻しは AnnotationStore.update で最新の内容に評価結果だけを反映する。
+
+    Args:
+        annotator: アノテーションに使用するMetricAnnotator
+        path: 出力JSONのパス
+        mode: MODES のいずれか
+        on_progress: 進捗通知コールバック on_progress(再アノテーション済み件数, 対象件数)
+        store: 出力JSONの読み書きに使うAnnotationStore（Noneの場合は既定の設定で作成）
+
+    Returns:
+        {"filename", "mode", "total", "reannotated", "errors"}
+    """
+    path = Path(path)
+    store = store or AnnotationStore()
+    data = store.load(path)
+
+    metadata = data.get("metadata", {})
+    scenario = data.get("scenario", [])
+    if not metadata.get("meeting_purpose") or not metadata.get("meeting_format"):
+        raise ValueError(f"メタデータに会議の目的・形式がありません: {path}")
+    if any(not utt.get("speaker") or not utt.get("text") for utt in scenario):
+        raise ValueError(f"発言者または発言内容のない発言があります: {path}")
+
+    hashes = annotator.annotation_hashes(scenario)
+    selected = select_utterances(scenario, hashes, mode)
+
+    results = {}
+    partial = set()  # 欠けている指標だけを評価した発言
+    errors = 0
+    with telemetry.trace() as trace, telemetry.stage("annotation"):
+        for metrics, indices in group_by_metrics(scenario, hashes, mode, selected).items():
+            if metrics is not None:
+                partial.update(indices)
+            for index, annotated_utt in annotator.iter_annotations(
+                scenario=scenario,
+                meeting_purpose=metadata["meeting_purpose"],
+                meeting_format=metadata["meeting_format"],
+                indices=indices,
+                focus_metrics=metadata.get("focus_metrics") or None,
+                metrics=list(metrics) if metrics else None
+            ):
+                results[index] = annotated_utt
+                if "annotation_error" in annotated_utt or local_estimate(annotated_utt):
+                    errors += 1
+                if on_progress:
+                    on_progress(len(results), len(selected))
+
+    def apply(latest: Dict[str, Any]) -> None:
+        latest_scenario = latest.get("scenario", [])
+        for index, annotated_utt in results.items():
+            utt = latest_scenario[index]
+            key = "machine_annotations" if "machine_annotations" in utt else "metrics"
+            if "annotation_error" in annotated_utt:
+                utt["annotation_error"] = annotated_utt["annotation_error"]
+                # 以前の評価が残っていればそのまま残す
+                utt.setdefault(key, {})
+            elif index in partial:
+                # 欠けていた指標だけを加える（評価済みの指標・評価入力のハッシュはそのまま）
+                merged = {**utt.get(key, {}), **annotated_utt["metrics"]}
+                utt[key] = {name: merged[name] for name in sorted(merged, key=_metric_order)}
+            else:
+                utt.pop("annotation_error", None)
+                utt[key] = annotated_utt["metrics"]
+                utt["annotation_hash"] = annotated_utt["annotation_hash"]
+                # カスケード評価の段階・ローカル評価で補った理由は、今回の評価のものに置き換える
+                for field in ("annotation_tier", "escalation", "fallback_reason"):
+                    if field in annotated_utt:
+                        utt[field] = annotated_utt[field]
+                    else:
+                        utt.pop(field, None)
+
+        latest_metadata = latest.setdefault("metadata", {})
+        if mode == "all" and errors == 0:
+            latest_metadata["annotation_model"] = annotator.model_name
+        latest_metadata["annotation_errors"] = sum(1 for utt in latest_scenario if "annotation_error" in utt)
+        local_estimates = sum(1 for utt in latest_scenario if local_estimate(utt))
+        if local_estimates:
+            latest_metadata["local_estimates"] = local_estimates
+        else:
+            latest_metadata.pop("local_estimates", None)
+        if not any(missing_metrics(utt) for utt in latest_scenario):
+            # 全指標がそろった（一部の指標だけを評価した出力の残りを評価し終えた）
+            latest_metadata.pop("annotation_metrics", None)
+        latest_metadata["last_reannotation"] = {
+            "at": datetime.now().isoformat(),
+            "mode": mode,
+            "model": annotator.model_name,
+            "count": len(selected),
+            "telemetry": trace.summary()
+        }
+        if annotator.cascade_model:
+            latest_metadata["last_reannotation"]["cascade_model"] = annotator.cascade_model
+
+    if selected:
+        store.update(path, apply)
+
+    return {
+        "filename": path.name,
+        "mode": mode,
+        "total": len(scenario),
+        "reannotated": len(selected) - errors,
+        "errors": errors
+    }
+
+
+def main(argv: List[str] = None) -> int:
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description="保存済みシナリオの欠けている・変更された発言だけを再アノテーションする")
+    parser.add_argument("files", nargs="+", help="出力JSONファイル")
+    parser.add_argument("--mode", choices=MODES, default="missing",
+                        help="missing: 評価がない発言・欠けている指標 / changed: 加えて評価後に変更された発言 / all: 全発言")
+    parser.add_argument("--model", default=os.getenv("ANNOTATION_MODEL_NAME") or os.getenv("OPENAI_MODEL_NAME", "gpt-4o"),
+                        help="アノテーションモデル")
+    parser.add_argument("--annotation-concurrency", type=int,
+                        default=int(os.getenv("ANNOTATION_CONCURRENCY", "8")),
+                        help="発言アノテーションの同時実行数")
+    parser.add_argument("--batch-size", type=int, default=int(os.getenv("ANNOTATION_BATCH_SIZE", "1")),
+                        help="1回のLLM呼び出しで評価する発言数")
+    parser.add_argument("--no-cache", action="store_true", help="LLM応答キャッシュを使用しない")
+    args = parser.parse_args(argv)
+
+    cache_enabled = os.getenv("LLM_CACHE_ENABLED", "true").lower() in ("true", "1", "yes") and not args.no_cache
+    cache = LLMCache(
+        os.getenv("LLM_CACHE_DIR", "data/cache"),
+        ttl_seconds=float(os.getenv("LLM_CACHE_TTL_HOURS", "168")) * 3600,
+        max_entries=int(os.getenv("LLM_CACHE_MAX_ENTRIES", "20000"))
+    ) if cache_enabled else None
+    llm_client = LLMClient(
+        os.getenv("OPENAI_API_KEY"),
+        cache=cache,
+        rpm_limit=float(os.getenv("OPENAI_RPM_LIMIT", "0")),
+        tpm_limit=float(os.getenv("OPENAI_TPM_LIMIT", "0")),
+        max_retries=int(os.getenv("OPENAI_MAX_RETRIES", "5"))
+    )
+    annotator = MetricAnnotator(
+        os.getenv("OPENAI_API_KEY"),
+        args.model,
+        os.getenv("EXTRA_JSON_PATH", "data/extra.json"),
+        max_workers=args.annotation_concurrency,
+        batch_size=args.batch_size,
+        llm_client=llm_client,
+        cascade_model=os.getenv("ANNOTATION_CASCADE_MODEL") or None,
+        cascade_samples=int(os.getenv("ANNOTATION_CASCADE_SAMPLES", "1"))
+    )
+
+    failures = 0
+    for filename in args.files:
+        try:
+            summary = reannotate_output(annotator, Path(filename), args.mode)
+        except Exception as e:
+            failures += 1
+            print(f"失敗: {filename}: {e}")
+            continue
+        print(f"{filename}: {summary['reannotated']}/{summary['total']}件を再アノテーション"
+              + (f"（{summary['errors']}件は評価に失敗）" if summary["errors"] else ""))
+        if summary["errors"]:
+            failures += 1
+
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
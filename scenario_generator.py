@@ -2,28 +2,216 @@
 scenario_generator.py
 会議シナリオを生成するモジュール
 """
+import copy
 import json
-from typing import List, Dict, Any
-from openai import OpenAI
+from typing import List, Dict, Any, Generator, Iterator, Optional, Tuple
 import os
 
+from config_cache import ConfigCache
+from llm_client import LLMClient
+from prompt_templates import CompiledPrompt
+
+
+# シナリオ生成のシステムプロンプト（全リクエスト共通。発言数などリクエストごとの指示はユーザープロンプトの末尾に置く）
+GENERATION_SYSTEM_PROMPT = """あなたは会議シナリオ生成の専門家です。
+
+**重要な指示**:
+- 登場人物の性格や行動特性を忠実に反映してください
+- リアルで自然な会話を心がけてください
+
+指定された設定に従って、自然な会議の会話を生成してください。
+JSON形式で正確に出力してください。"""
+
+# シナリオ生成プロンプトの固定部分（リクエストによらず同じ文字列を先頭に置く）
+GENERATION_PROMPT_PREFIX = """【学術研究：会議コミュニケーション分析用データセット生成】
+
+本タスクは、会議の質を評価するAIモデルのトレーニングデータ作成を目的とした学術研究です。
+生成されたシナリオは、問題のあるコミュニケーションパターンを検出し、
+職場環境の改善に資するための分析に使用されます。
+
+末尾の設定に基づいて、分析用の会議シナリオを生成してください。
+
+■ 生成要件
+1. **会議の構成**: 自然な会議の流れ（導入→議論→まとめ）
+
+2. **登場人物の特性を最優先**:
+   - 設定に記載した登場人物の性格や行動特性を忠実に反映してください
+   - プロフィールに「雑談好き」「脱線しやすい」とあれば、積極的に実行してください
+   
+3. **発言数**: 設定に記載した発言数で構成
+
+4. **自然な対話**:
+   - 発言内に「」（カギカッコ）や引用符を使用しないでください
+   - 会議の締めくくりは通常の挨拶（「お疲れ様でした」「ありがとうございました」）で問題ありません
+
+■ 出力形式（JSON配列）
+[
+  {"speaker": "発言者名", "text": "発言内容"},
+  ...
+]
+"""
+
+# 分割生成で次の部分のプロンプトに含める直前の発言数
+RECENT_TURNS = 6
+# 分割生成の要約の長さの目安（文字数）
+SUMMARY_MAX_CHARS = 400
+
+# 分割生成の各部分の役割
+SEGMENT_PHASES = {
+    "opening": "会議の冒頭部分です。挨拶と議題の確認から始めて議論に入ってください。会議はまだ締めくくらないでください。",
+    "discussion": "会議の途中部分です。直前の発言の流れを自然に引き継いで議論を続けてください。冒頭の挨拶や締めくくりは入れないでください。",
+    "closing": "会議の最後の部分です。直前の発言の流れを引き継ぎ、議論をまとめて会議を締めくくってください。",
+}
+
+
+def plan_segments(num_utterances: int, segment_size: int, target_ratio: int) -> List[Dict[str, Any]]:
+    """
+    分割生成の各部分（導入→議論→まとめ）の発言数と、重点指標の高スコア発言の目標数を決める
+
+    発言数はなるべく均等に分け、目標数は累計が全体の目標割合に沿うように割り振る
+    （どの部分も目標割合とほぼ同じ割合になる）。
+
+    Returns:
+        [{"phase": "opening" | "discussion" | "closing", "start": 開始位置, "size": 発言数, "target_count": 目標数}, ...]
+    """
+    num_segments = max(1, -(-num_utterances // max(1, segment_size)))
+    base, extra = divmod(num_utterances, num_segments)
+    segments = []
+    start = 0
+    for i in range(num_segments):
+        size = base + (1 if i < extra else 0)
+        end = start + size
+        target_count = round(end * target_ratio / 100) - round(start * target_ratio / 100)
+        phase = "opening" if i == 0 else "closing" if i == num_segments - 1 else "discussion"
+        segments.append({"phase": phase, "start": start, "size": size, "target_count": target_count})
+        start = end
+    return segments
+
+
+def normalize_utterance(utt: Any) -> Optional[Dict[str, str]]:
+    """LLMが出力した1発言のキー名を正規化する（発言者・発言内容のどちらかがなければNone）"""
+    if not isinstance(utt, dict):
+        return None
+    
+    # speakerキーの正規化
+    speaker = None
+    for key in ["speaker", "name", "発言者", "話者", "参加者"]:
+        if key in utt:
+            speaker = utt[key]
+            break
+    
+    # textキーの正規化
+    text = None
+    for key in ["text", "content", "message", "発言", "発言内容", "内容", "セリフ"]:
+        if key in utt:
+            text = utt[key]
+            break
+    
+    if speaker and text:
+        return {"speaker": speaker, "text": text}
+    return None
+
+
+class ScenarioStreamParser:
+    """
+    ストリーミングで届くシナリオ生成の応答（JSON）から、閉じた発言オブジェクトを順に取り出すパーサー
+    
+    配列の要素になっているオブジェクト（{"speaker": .., "text": ..}）が閉じた時点でそのオブジェクトだけを
+    パースし、normalize_utterance で正規化して返す。文字列中の括弧・エスケープは読み飛ばす。
+    """
+    
+    def __init__(self):
+        self._text = ""
+        self._pos = 0
+        self._stack: List[Tuple[str, int]] = []  # 開いている括弧と開始位置
+        self._in_string = False
+        self._escape = False
+    
+    def feed(self, piece: str) -> List[Dict[str, str]]:
+        """応答の断片を加え、この断片で閉じた発言を返す"""
+        self._text += piece
+        utterances = []
+        text, stack = self._text, self._stack
+        for pos in range(self._pos, len(text)):
+            char = text[pos]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char in "{[":
+                stack.append((char, pos))
+            elif char in "}]" and stack:
+                opener, start = stack.pop()
+                if opener == "{" and stack and stack[-1][0] == "[":
+                    try:
+                        utt = normalize_utterance(json.loads(text[start:pos + 1]))
+                    except json.JSONDecodeError:
+                        utt = None
+                    if utt:
+                        utterances.append(utt)
+        self._pos = len(text)
+        return utterances
+    
+    def result(self) -> Any:
+        """
+        受け取った応答全体をパースして返す
+        
+        Raises:
+            ValueError: 応答全体がJSONとしてパースできない場合
+        """
+        content = self._text
+        try:
+            return json.loads(content)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"LLMの応答をJSONとしてパースできませんでした: {e}\n応答内容: {content[:200]}")
+
 
 class ScenarioGenerator:
     """会議シナリオを自動生成するクラス"""
     
-    def __init__(self, api_key: str, model_name: str, sanitize_mode: bool = True, extra_json_path: str = "data/extra.json"):
+    def __init__(
+        self,
+        api_key: str,
+        model_name: str,
+        sanitize_mode: bool = True,
+        extra_json_path: str = "data/extra.json",
+        llm_client: Optional[LLMClient] = None,
+        config_cache: Optional[ConfigCache] = None,
+        segment_size: int = 0,
+        stream: bool = False,
+        cache_responses: bool = False
+    ):
         """
         Args:
             api_key: OpenAI APIキー
             model_name: 使用するモデル名
             sanitize_mode: プロフィールの過激表現を緩和するかどうか（デフォルト: True）
             extra_json_path: 指標定義JSONのパス
+            llm_client: API呼び出し層（キャッシュ・レート制限・リトライ、複数インスタンスで共有可能）
+                        Noneの場合はapi_keyから制限なしのクライアントを作成
+            config_cache: 指標定義・プロフィールを読み込む設定キャッシュ（MetricAnnotator・APIと共有可能）
+            segment_size: 発言数がこれを超える会議は、この発言数程度の部分に分けて生成する（0の場合は常に1回で生成）
+            stream: iter_generation で応答をストリーミングで受け取り、発言が1つ届くごとに返すかどうか
+            cache_responses: 生成の応答をLLM応答キャッシュに保存・再利用するかどうか
+                             （生成は temperature が高く毎回異なるシナリオを返すべきなので、既定では使わない）
         """
-        self.client = OpenAI(api_key=api_key)
+        self.llm = llm_client or LLMClient(api_key)
+        self.config_cache = config_cache or ConfigCache()
+        self._missing_definitions: Dict[str, Any] = {}
+        self._warned_missing_definitions = False
         self.model_name = model_name
         self.sanitize_mode = sanitize_mode
         self.extra_json_path = extra_json_path
-        self.metric_definitions = self._load_metric_definitions()
+        self.segment_size = max(0, segment_size)
+        self.stream = stream
+        self.cache_responses = cache_responses
+        # 指標ごとの説明文は一度だけ組み立て、extra.jsonが更新された場合だけ組み立て直す
+        self.metric_sections = CompiledPrompt(extra_json_path, self._load_metric_definitions, self._build_metric_sections)
     
     def load_profiles(self, profile_path: str) -> List[Dict[str, Any]]:
         """
@@ -33,10 +221,9 @@ class ScenarioGenerator:
             profile_path: プロフィールJSONのパス
             
         Returns:
-            参加者プロフィールのリスト
+            参加者プロフィールのリスト（呼び出し元で変更してもキャッシュに影響しないコピー）
         """
-        with open(profile_path, 'r', encoding='utf-8') as f:
-            return json.load(f)
+        return copy.deepcopy(self.config_cache.load(profile_path))
     
     def generate_scenario(
         self,
@@ -45,7 +232,8 @@ class ScenarioGenerator:
         meeting_format: str,
         num_utterances: int = 40,
         focus_metrics: List[str] = None,
-        target_ratio: int = 50
+        target_ratio: int = 50,
+        variant: int = 0
     ) -> List[Dict[str, str]]:
         """
         会議シナリオを生成する
@@ -59,33 +247,174 @@ class ScenarioGenerator:
                           Noneまたは空の場合は全指標をバランスよく含める
             target_ratio: 重点指標の高スコア（7-9）発言の目標割合（10-90%）
                          focus_metricsが指定されている場合のみ有効
+            variant: 同じ設定で別の候補を生成する場合の候補番号（0以外ではプロンプトの末尾に候補番号を加え、
+                     応答キャッシュも候補ごとに分ける）
             
         Returns:
             発言のリスト [{"speaker": "名前", "text": "発言内容"}, ...]
         """
-        # プロフィール情報を整形
-        profile_text = self._format_profiles(profiles)
+        if self.is_segmented(num_utterances):
+            return [
+                utt
+                for segment in self.iter_segments(
+                    profiles, meeting_purpose, meeting_format, num_utterances, focus_metrics, target_ratio, variant
+                )
+                for utt in segment
+            ]
         
         # 重点指標の設定（Noneまたは空の場合は全指標）
         if not focus_metrics:
             focus_metrics = ["威圧度", "逸脱度", "発言無効度", "偏り度"]
         
+        prompt = self._build_prompt(profiles, meeting_purpose, meeting_format, num_utterances, focus_metrics, target_ratio)
+        prompt += self._variant_instructions(variant)
+        result = self._request_scenario(prompt)
+        return self._normalize_scenario(result)
+    
+    def is_segmented(self, num_utterances: int) -> bool:
+        """指定した発言数の会議を分割して生成するかどうか"""
+        return bool(self.segment_size) and num_utterances > self.segment_size
+    
+    def iter_segments(
+        self,
+        profiles: List[Dict[str, Any]],
+        meeting_purpose: str,
+        meeting_format: str,
+        num_utterances: int = 40,
+        focus_metrics: List[str] = None,
+        target_ratio: int = 50,
+        variant: int = 0
+    ) -> Iterator[List[Dict[str, str]]]:
+        """
+        長い会議を部分（導入→議論→まとめ）ごとに生成し、生成できた部分から順に返すジェネレータ
+        
+        各部分は、それまでの会議の要約（前の部分の応答に含めさせたもの）と直前の発言を条件に生成するため、
+        1回のLLM呼び出しの出力トークン数と待ち時間は会議全体の長さによらずほぼ一定になる。
+        重点指標の高スコア発言の目標数は、各部分が目標割合に沿うように割り振る（plan_segments）。
+        引数は generate_scenario と同じ。分割しない発言数の場合は1回で生成した全体を1つの部分として返す。
+        
+        Yields:
+            その部分の発言のリスト [{"speaker": "名前", "text": "発言内容"}, ...]
+        """
+        for kind, payload in self.iter_generation(
+            profiles, meeting_purpose, meeting_format, num_utterances, focus_metrics, target_ratio, variant, stream=False
+        ):
+            if kind == "segment":
+                yield payload
+    
+    def iter_generation(
+        self,
+        profiles: List[Dict[str, Any]],
+        meeting_purpose: str,
+        meeting_format: str,
+        num_utterances: int = 40,
+        focus_metrics: List[str] = None,
+        target_ratio: int = 50,
+        variant: int = 0,
+        stream: Optional[bool] = None
+    ) -> Iterator[Tuple[str, Any]]:
+        """
+        シナリオを生成し、発言と部分の区切りを生成できた順に返すジェネレータ
+        
+        ストリーミングの場合は、応答の中で発言オブジェクトが閉じるたびにその発言を返す
+        （ScenarioStreamParser、キー名の正規化は generate_scenario と同じ）。
+        引数は generate_scenario と同じ。
+        
+        Args:
+            stream: 応答をストリーミングで受け取るかどうか（Noneの場合はコンストラクタの設定値を使用）
+        
+        Yields:
+            ("utterance", 発言) … 1発言の生成完了時（ストリーミングでない場合は部分の応答の受信後にまとめて）
+            ("segment", その部分の発言のリスト) … 部分の生成完了時（分割しない場合は全体で1回）
+        """
+        stream = self.stream if stream is None else stream
+        if not focus_metrics:
+            focus_metrics = ["威圧度", "逸脱度", "発言無効度", "偏り度"]
+        
+        if not self.is_segmented(num_utterances):
+            prompt = self._build_prompt(profiles, meeting_purpose, meeting_format, num_utterances, focus_metrics, target_ratio)
+            prompt += self._variant_instructions(variant)
+            utterances, _ = yield from self._generate_part(prompt, None, stream)
+            yield "segment", utterances
+            return
+        
+        balanced = focus_metrics == ["威圧度", "逸脱度", "発言無効度", "偏り度"]
+        summary = ""
+        recent: List[Dict[str, str]] = []
+        for segment in plan_segments(num_utterances, self.segment_size, target_ratio):
+            size = segment["size"]
+            prompt = self._build_prompt(profiles, meeting_purpose, meeting_format, size, focus_metrics, target_ratio)
+            prompt += self._segment_instructions(segment, num_utterances, summary, recent, None if balanced else focus_metrics)
+            prompt += self._variant_instructions(variant)
+            utterances, result = yield from self._generate_part(prompt, size, stream)
+            
+            if not utterances:
+                raise ValueError(f"{segment['start'] + 1}発言目からの部分を生成できませんでした")
+            if isinstance(result, dict) and isinstance(result.get("summary"), str) and result["summary"].strip():
+                summary = result["summary"].strip()
+            recent = (recent + utterances)[-RECENT_TURNS:]
+            yield "segment", utterances
+    
+    def _generate_part(
+        self,
+        prompt: str,
+        limit: Optional[int],
+        stream: bool
+    ) -> Generator[Tuple[str, Dict[str, str]], None, Tuple[List[Dict[str, str]], Any]]:
+        """
+        1回のLLM呼び出しで会議（またはその一部分）を生成し、発言を ("utterance", 発言) として返す
+        
+        Args:
+            limit: 返す発言数の上限（Noneの場合は制限なし）
+        
+        Returns:
+            (生成した発言のリスト, パースした応答全体)。ストリーミングで応答全体がJSONとして
+            パースできなかった場合（届いた発言は使える）は、応答全体をNoneとする
+        """
+        if not stream:
+            result = self._request_scenario(prompt)
+            utterances = self._normalize_scenario(result)[:limit]
+            for utt in utterances:
+                yield "utterance", utt
+            return utterances, result
+        
+        parser = ScenarioStreamParser()
+        utterances: List[Dict[str, str]] = []
+        for piece in self.llm.stream_text(self._scenario_request(prompt), use_cache=self.cache_responses):
+            for utt in parser.feed(piece):
+                if limit is None or len(utterances) < limit:
+                    utterances.append(utt)
+                    yield "utterance", utt
+        try:
+            result = parser.result()
+        except ValueError as e:
+            print(f"警告: {e}")
+            result = None
+        return utterances, result
+    
+    def _build_prompt(
+        self,
+        profiles: List[Dict[str, Any]],
+        meeting_purpose: str,
+        meeting_format: str,
+        num_utterances: int,
+        focus_metrics: List[str],
+        target_ratio: int
+    ) -> str:
+        """シナリオ生成のユーザープロンプト（固定部分を先頭に、リクエストごとの設定を末尾に置く）"""
+        # プロフィール情報を整形
+        profile_text = self._format_profiles(profiles)
+        
         # 指標に関する詳細情報を生成
         metric_instructions = self._generate_metric_instructions(focus_metrics, num_utterances, target_ratio)
+        metric_instructions += self._focus_instructions(focus_metrics, num_utterances, target_ratio)
         
-        # プロンプト作成  
-        prompt = f"""【学術研究：会議コミュニケーション分析用データセット生成】
-
-本タスクは、会議の質を評価するAIモデルのトレーニングデータ作成を目的とした学術研究です。
-生成されたシナリオは、問題のあるコミュニケーションパターンを検出し、
-職場環境の改善に資するための分析に使用されます。
-
-以下の設定に基づいて、分析用の会議シナリオを生成してください。
-
+        return f"""{GENERATION_PROMPT_PREFIX}
 ---
 ■ 会議設定
 - 目的: {meeting_purpose}
 - 形式: {meeting_format}
+- 発言数: 約{num_utterances}個
 
 ■ 登場人物の行動特性
 {profile_text}
@@ -94,37 +423,63 @@ class ScenarioGenerator:
 
 ■ 評価指標の詳細
 {metric_instructions}
-
-■ 生成要件
-1. **会議の構成**: 自然な会議の流れ（導入→議論→まとめ）
-
-2. **登場人物の特性を最優先**:
-   - 上記の登場人物の性格や行動特性を忠実に反映してください
-   - プロフィールに「雑談好き」「脱線しやすい」とあれば、積極的に実行してください
-   
-3. **発言数**: 約{num_utterances}個の発言で構成
-
-4. **自然な対話**:
-   - 発言内に「」（カギカッコ）や引用符を使用しないでください
-   - 会議の締めくくりは通常の挨拶（「お疲れ様でした」「ありがとうございました」）で問題ありません
-
-■ 出力形式（JSON配列）
-[
-  {{"speaker": "発言者名", "text": "発言内容"}},
-  ...
-]
 """
+    
+    def _variant_instructions(self, variant: int) -> str:
+        """候補番号の指示（候補0は何も加えないため、通常の生成と同じプロンプト・応答キャッシュになる）"""
+        if not variant:
+            return ""
+        return f"\n■ 生成候補\nこれは同じ設定で生成する候補{variant + 1}です。他の候補とは異なる話の展開にしてください。\n"
+    
+    def _segment_instructions(
+        self,
+        segment: Dict[str, Any],
+        num_utterances: int,
+        summary: str,
+        recent: List[Dict[str, str]],
+        focus_metrics: Optional[List[str]]
+    ) -> str:
+        """分割生成の1部分についての指示（プロンプトの末尾に加える）"""
+        start, size = segment["start"], segment["size"]
+        lines = [
+            "",
+            "■ 分割生成",
+            f"この会議は全{num_utterances}発言を複数回に分けて生成しています。今回は第{start + 1}〜{start + size}発言の{size}発言だけを生成してください。",
+            f"- この部分の役割: {SEGMENT_PHASES[segment['phase']]}",
+        ]
+        if focus_metrics:
+            lines.append(
+                f"- この部分の{size}発言のうち約{segment['target_count']}発言で、"
+                f"重点指標（{'、'.join(focus_metrics)}）のスコアが7-9になるようにしてください"
+            )
+        if summary:
+            lines += ["", "■ これまでの会議の要約", summary]
+        if recent:
+            lines += ["", "■ 直前の発言"] + [f"{utt['speaker']}: {utt['text']}" for utt in recent]
+        lines += [
+            "",
+            "■ 出力形式（JSONオブジェクト）",
+            '{"scenario": [{"speaker": "発言者名", "text": "発言内容"}, ...], '
+            f'"summary": "会議の冒頭から今回の部分までの要約（{SUMMARY_MAX_CHARS}字以内。議題・決まったこと・脱線中の話題・各登場人物の様子）"}}',
+            "",
+        ]
+        return "\n".join(lines)
+    
+    def _focus_instructions(self, focus_metrics: List[str], num_utterances: int, target_ratio: int) -> str:
+        """
+        重点指標に逸脱度を含む場合の脱線の指示（発言数・割合を含むため、システムプロンプトではなくユーザープロンプトの末尾に置く）
+        """
+        if not focus_metrics or '逸脱度' not in focus_metrics:
+            return ""
+        target_count = int(num_utterances * target_ratio / 100)
+        if target_ratio >= 50:
+            return f"""
 
-        # LLM呼び出し - 指標に応じたシステムプロンプトを生成
-        if focus_metrics and '逸脱度' in focus_metrics:
-            if target_ratio >= 50:
-                system_prompt = f"""あなたは会議シナリオ生成の専門家です。
-
-**最重要指示**: 
+■ 最重要指示（逸脱度）
 - このシナリオでは、話が脱線しやすい会議を作成してください
 - 登場人物の「雑談好き」「脱線しやすい」という性格を最大限に発揮させてください
 - 会議の目的から**頻繁に**話題を逸らし、個人的な話題（趣味、週末、家族、食べ物、旅行など）を**積極的に**含めてください
-- 全{num_utterances}発言のうち、約{int(num_utterances * target_ratio / 100)}発言は会議と無関係な雑談にしてください
+- 全{num_utterances}発言のうち、約{target_count}発言は会議と無関係な雑談にしてください
 
 **脱線のパターン例**:
 - 会議の話題 → 個人的な経験談 → 趣味の話 → 完全に雑談
@@ -132,52 +487,33 @@ class ScenarioGenerator:
 - 本題に戻そうとする発言は流される
 
 **注意**: 会議の締めくくりの挨拶（「お疲れ様でした」「ありがとうございました」など）は通常の終了表現であり、脱線ではありません。
+"""
+        return f"""
 
-JSON形式で正確に出力してください。"""
-            else:
-                system_prompt = f"""あなたは会議シナリオ生成の専門家です。
-
-**重要指示**:
+■ 重要指示（逸脱度）
 - 基本的には正常な会議ですが、時々話が脱線します
-- 全{num_utterances}発言のうち、約{int(num_utterances * target_ratio / 100)}発言だけ脱線させてください
+- 全{num_utterances}発言のうち、約{target_count}発言だけ脱線させてください
 - 脱線は自然な流れで発生させてください
-
-JSON形式で正確に出力してください。"""
-        else:
-            system_prompt = """あなたは会議シナリオ生成の専門家です。
-
-**重要な指示**:
-- 登場人物の性格や行動特性を忠実に反映してください
-- リアルで自然な会話を心がけてください
-
-指定された設定に従って、自然な会議の会話を生成してください。
-JSON形式で正確に出力してください。"""
-
-        response = self.client.chat.completions.create(
-            model=self.model_name,
-            messages=[
-                {"role": "system", "content": system_prompt},
+"""
+    
+    def _request_scenario(self, prompt: str) -> Any:
+        """シナリオ生成のLLM呼び出し"""
+        return self.llm.request_json(self._scenario_request(prompt), use_cache=self.cache_responses)
+    
+    def _scenario_request(self, prompt: str) -> Dict[str, Any]:
+        """シナリオ生成のリクエスト（システムプロンプトは全リクエスト共通）"""
+        return {
+            "model": self.model_name,
+            "messages": [
+                {"role": "system", "content": GENERATION_SYSTEM_PROMPT},
                 {"role": "user", "content": prompt}
             ],
-            temperature=0.95,  # 多様性を向上
-            response_format={"type": "json_object"}
-        )
-        
-        # レスポンスをパース
-        content = response.choices[0].message.content
-        
-        # contentがNoneの場合のエラーハンドリング
-        if content is None:
-            # refusal messageをチェック
-            if hasattr(response.choices[0].message, 'refusal') and response.choices[0].message.refusal:
-                raise ValueError(f"LLMがリクエストを拒否しました: {response.choices[0].message.refusal}")
-            raise ValueError("LLMからの応答が空でした。APIキーやモデル名を確認してください。")
-        
-        try:
-            result = json.loads(content)
-        except json.JSONDecodeError as e:
-            raise ValueError(f"LLMの応答をJSONとしてパースできませんでした: {e}\n応答内容: {content[:200]}")
-        
+            "temperature": 0.95,  # 多様性を向上
+            "response_format": {"type": "json_object"}
+        }
+    
+    def _normalize_scenario(self, result: Any) -> List[Dict[str, str]]:
+        """LLMの応答から発言のリストを取り出し、キー名を正規化する"""
         # リスト形式に変換（キーが異なる場合の対応）
         scenario_list = []
         if isinstance(result, dict):
@@ -201,42 +537,37 @@ JSON形式で正確に出力してください。"""
             scenario_list = result
         
         # 各発言のキー名を正規化
-        normalized = []
-        for utt in scenario_list:
-            if not isinstance(utt, dict):
-                continue
-            
-            # speakerキーの正規化
-            speaker = None
-            for key in ["speaker", "name", "発言者", "話者", "参加者"]:
-                if key in utt:
-                    speaker = utt[key]
-                    break
-            
-            # textキーの正規化
-            text = None
-            for key in ["text", "content", "message", "発言", "発言内容", "内容", "セリフ"]:
-                if key in utt:
-                    text = utt[key]
-                    break
-            
-            if speaker and text:
-                normalized.append({"speaker": speaker, "text": text})
-        
-        return normalized
+        normalized = [normalize_utterance(utt) for utt in scenario_list]
+        return [utt for utt in normalized if utt]
     
-    def _load_metric_definitions(self) -> Dict[str, Any]:
-        """extra.jsonから指標定義を読み込む"""
+    def _load_metric_definitions(self, path: str) -> Dict[str, Any]:
+        """extra.jsonから指標定義を読み込む（更新されていなければキャッシュ済みの定義）"""
         try:
-            with open(self.extra_json_path, 'r', encoding='utf-8') as f:
-                return json.load(f)
+            definitions = self.config_cache.load(path)
+            self._warned_missing_definitions = False
+            return definitions
         except FileNotFoundError:
-            print(f"警告: {self.extra_json_path} が見つかりません。デフォルトの指標定義を使用します。")
-            return {}
+            # ファイルがない間は同じ空の定義を返し、組み立て直しと警告を繰り返さない
+            if not self._warned_missing_definitions:
+                print(f"警告: {path} が見つかりません。デフォルトの指標定義を使用します。")
+                self._warned_missing_definitions = True
+            return self._missing_definitions
+    
+    def _build_metric_sections(self, metric_definitions: Dict[str, Any]) -> Dict[str, str]:
+        """重点指標として指定された場合に使う、指標ごとの定義・高スコア基準の説明文を組み立てる"""
+        sections = {}
+        for metric_name, metric_def in metric_definitions.items():
+            sections[metric_name] = "\n".join([
+                f"\n### {metric_name}",
+                f"- **定義**: {metric_def.get('定義', 'N/A')}",
+                f"- **高スコア基準（7-9）**: {metric_def.get('スコア基準', {}).get('高スコア（7-9）', 'N/A')}",
+            ])
+        return sections
     
     def _generate_metric_instructions(self, focus_metrics: List[str], num_utterances: int, target_ratio: int) -> str:
         """重点指標の詳細説明を生成"""
-        if not self.metric_definitions:
+        metric_sections = self.metric_sections.get()
+        if not metric_sections:
             return "※指標定義ファイルが読み込まれていません"
         
         # 重点指標が指定されていない場合
@@ -253,11 +584,8 @@ JSON形式で正確に出力してください。"""
         instructions.append(f"以下の指標について、**全発言の約{target_ratio}%**がスコア7-9になるよう意図的に調整してください：\n")
         
         for metric_name in focus_metrics:
-            if metric_name in self.metric_definitions:
-                metric_def = self.metric_definitions[metric_name]
-                instructions.append(f"\n### {metric_name}")
-                instructions.append(f"- **定義**: {metric_def.get('定義', 'N/A')}")
-                instructions.append(f"- **高スコア基準（7-9）**: {metric_def.get('スコア基準', {}).get('高スコア（7-9）', 'N/A')}")
+            if metric_name in metric_sections:
+                instructions.append(metric_sections[metric_name])
                 instructions.append(f"- **目標**: 全発言の約{target_ratio}%が{metric_name}のスコア7-9になるようにする\n")
         
         # 具体的な指示を追加
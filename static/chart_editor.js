@@ -10,6 +10,8 @@ class ChartEditor {
         this.currentScenario = null;
         this.currentFilename = null;
         this.humanAnnotations = {}; // { utteranceIdx: { metricName: { score, note } } }
+        this.pendingAnnotations = {}; // 前回の保存以降に変更したアノテーション（保存時はこれだけを送る）
+        this.annotationMetrics = null; // 一部の指標だけを評価した場合の指標（nullの場合は全指標）
         this.hasUnsavedChanges = false;
 
         // メトリクス定義
@@ -34,10 +36,12 @@ class ChartEditor {
     /**
      * シナリオデータからグラフを初期化
      */
-    initializeCharts(scenario, filename = null) {
+    initializeCharts(scenario, filename = null, annotationMetrics = null) {
         this.currentScenario = scenario;
         this.currentFilename = filename;
+        this.annotationMetrics = annotationMetrics || null;
         this.humanAnnotations = {};
+        this.pendingAnnotations = {};
         this.hasUnsavedChanges = false;
 
         // グラフセクションを表示
@@ -51,9 +55,50 @@ class ChartEditor {
             this.createChart(metricName);
         });
 
+        this.updateUnscoredNotes();
         this.updateSaveButton();
     }
 
+    /**
+     * 機械アノテーションのない指標か（重点指標だけを評価した場合の残りの指標）
+     */
+    isUnscored(metricName) {
+        if (this.annotationMetrics) {
+            return !this.annotationMetrics.includes(metricName);
+        }
+        // 保存済みの出力: 評価済みの発言のどれにもその指標がない
+        const scored = this.currentScenario.filter(utterance => utterance.machine_annotations || utterance.metrics);
+        return scored.length > 0 && scored.every(utterance => {
+            const machineAnnotations = utterance.machine_annotations || utterance.metrics || {};
+            return !(metricName in machineAnnotations);
+        });
+    }
+
+    /**
+     * 機械アノテーションのない指標のグラフに、未評価であることを表示する
+     */
+    updateUnscoredNotes() {
+        this.metrics.forEach(metricName => {
+            const canvas = document.getElementById(`chart-${this.metricIds[metricName]}`);
+            const item = canvas ? canvas.closest('.graph-item') : null;
+            if (!item) {
+                return;
+            }
+
+            const unscored = this.isUnscored(metricName);
+            item.classList.toggle('graph-item-unscored', unscored);
+            let note = item.querySelector('.graph-unscored-note');
+            if (unscored && !note) {
+                note = document.createElement('small');
+                note.className = 'form-hint graph-unscored-note';
+                note.textContent = '未評価の指標です（再アノテーションで後から評価できます。人手アノテーションはCSVで取り込めます）';
+                item.insertBefore(note, canvas);
+            } else if (!unscored && note) {
+                note.remove();
+            }
+        });
+    }
+
     /**
      * 特定のメトリクスのグラフを作成
      */
@@ -237,6 +282,64 @@ class ChartEditor {
         return { labels, machineScores, humanScores };
     }
 
+    /**
+     * 1発言分の機械アノテーションを反映（ストリーミング受信時）
+     */
+    updateUtteranceMetrics(utteranceIdx, metrics) {
+        if (!this.currentScenario || !this.currentScenario[utteranceIdx]) {
+            return;
+        }
+
+        this.currentScenario[utteranceIdx].metrics = metrics;
+
+        this.metrics.forEach(metricName => {
+            const chart = this.charts[metricName];
+            if (!chart || this.isUnscored(metricName)) {
+                return;
+            }
+
+            const machineScore = metrics[metricName]?.score ?? null;
+            const humanScore = this.humanAnnotations[utteranceIdx]?.[metricName]?.score ?? machineScore;
+
+            // dataset 0: 人手アノテーション, dataset 1: 機械アノテーション
+            chart.data.datasets[0].data[utteranceIdx] = humanScore;
+            chart.data.datasets[1].data[utteranceIdx] = machineScore;
+            chart.update('none');
+        });
+    }
+
+    /**
+     * 分割生成の続きの発言を追加（ストリーミング受信時、機械アノテーションは後から届く）
+     */
+    appendUtterances(utterances) {
+        if (!this.currentScenario) {
+            return;
+        }
+
+        const start = this.currentScenario.length;
+        this.currentScenario.push(...utterances);
+
+        this.metrics.forEach(metricName => {
+            const chart = this.charts[metricName];
+            if (!chart) {
+                return;
+            }
+
+            utterances.forEach((utterance, offset) => {
+                chart.data.labels.push(`#${start + offset + 1}`);
+                chart.data.datasets.forEach(dataset => dataset.data.push(null));
+            });
+            chart.update('none');
+        });
+    }
+
+    /**
+     * 保存先ファイル名を設定（ストリーミング生成の保存完了時）
+     */
+    setFilename(filename) {
+        this.currentFilename = filename;
+    }
+
     /**
      * 人手アノテーションを更新
      */
@@ -250,6 +353,11 @@ class ChartEditor {
             note: ''
         };
 
+        if (!this.pendingAnnotations[utteranceIdx]) {
+            this.pendingAnnotations[utteranceIdx] = {};
+        }
+        this.pendingAnnotations[utteranceIdx][metricName] = this.humanAnnotations[utteranceIdx][metricName];
+
         this.hasUnsavedChanges = true;
         this.updateSaveButton();
 
@@ -280,11 +388,15 @@ class ChartEditor {
             return;
         }
 
-        if (Object.keys(this.humanAnnotations).length === 0) {
+        if (Object.keys(this.pendingAnnotations).length === 0) {
             alert('変更がありません');
             return;
         }
 
+        // 送信中に編集された分は次回の保存で送る
+        const pending = this.pendingAnnotations;
+        this.pendingAnnotations = {};
+
         try {
             const response = await fetch(`/api/output/${encodeURIComponent(this.currentFilename)}/annotations`, {
                 method: 'POST',
@@ -292,27 +404,41 @@ class ChartEditor {
                     'Content-Type': 'application/json'
                 },
                 body: JSON.stringify({
-                    annotations: this.humanAnnotations
+                    annotations: pending
                 })
             });
 
             const data = await response.json();
 
             if (data.error) {
+                this.restorePendingAnnotations(pending);
                 alert('エラー: ' + data.error);
                 return;
             }
 
             alert('✅ 人手アノテーションを保存しました');
-            this.hasUnsavedChanges = false;
+            this.hasUnsavedChanges = Object.keys(this.pendingAnnotations).length > 0;
             this.updateSaveButton();
 
         } catch (error) {
+            this.restorePendingAnnotations(pending);
             alert('保存に失敗しました: ' + error.message);
             console.error(error);
         }
     }
 
+    /**
+     * 保存に失敗した変更を未保存に戻す（送信中に同じ項目が再編集されていればそちらを優先）
+     */
+    restorePendingAnnotations(pending) {
+        Object.entries(pending).forEach(([utteranceIdx, metrics]) => {
+            this.pendingAnnotations[utteranceIdx] = {
+                ...metrics,
+                ...(this.pendingAnnotations[utteranceIdx] || {})
+            };
+        });
+    }
+
     /**
      * すべてのチャートを破棄
      */
@@ -17,6 +17,8 @@ const saveAnnotationsBtn = document.getElementById('save-annotations-btn');
 const targetRatioGroup = document.getElementById('target-ratio-group');
 const targetRatioSlider = document.getElementById('target-ratio-slider');
 const targetRatioInput = document.getElementById('target-ratio');
+const candidatesInput = document.getElementById('candidates');
+const focusOnlyCheckbox = document.getElementById('focus-only');
 
 // State
 let currentProfile = null;
@@ -192,88 +194,187 @@ async function handleGenerate() {
     scenarioSection.style.display = 'none';
     generateBtn.disabled = true;
 
-    try {
-        const response = await fetch('/api/generate-scenario', {
-            method: 'POST',
-            headers: {
-                'Content-Type': 'application/json'
-            },
-            body: JSON.stringify({
-                meeting_purpose: purpose,
-                meeting_format: format,
-                profile_filename: filename,
-                num_utterances: numUtts,
-                focus_metrics: focusMetrics,
-                target_ratio: focusMetrics.length > 0 ? parseInt(targetRatioInput.value) : null
-            })
-        });
-
-        const data = await response.json();
+    const requestBody = {
+        meeting_purpose: purpose,
+        meeting_format: format,
+        profile_filename: filename,
+        num_utterances: numUtts,
+        focus_metrics: focusMetrics,
+        target_ratio: focusMetrics.length > 0 ? parseInt(targetRatioInput.value) : null
+    };
+    if (focusMetrics.length > 0 && candidatesInput && parseInt(candidatesInput.value) > 1) {
+        requestBody.candidates = parseInt(candidatesInput.value);
+    }
+    if (focusMetrics.length > 0 && focusOnlyCheckbox && focusOnlyCheckbox.checked) {
+        requestBody.focus_only = true;
+    }
 
-        if (data.error) {
-            showError(data.error);
-            return;
+    try {
+        // ストリーミング非対応のブラウザではジョブのポーリングで生成する
+        if (window.ReadableStream && window.TextDecoder) {
+            await generateWithStream(requestBody);
+        } else {
+            await generateWithJob(requestBody);
         }
-
-        displayScenario(data.scenario, data.metadata);
     } catch (error) {
         showError('シナリオの生成に失敗しました: ' + error.message);
     } finally {
         loading.style.display = 'none';
+        setLoadingMessage('シナリオを生成中...');
         generateBtn.disabled = false;
     }
 }
 
+// Generate via Server-Sent Events: show the scenario first, then fill in metrics as they arrive
+async function generateWithStream(requestBody) {
+    const response = await fetch('/api/generate-scenario/stream', {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json'
+        },
+        body: JSON.stringify(requestBody)
+    });
+
+    // 入力エラーはJSONで返る
+    const contentType = response.headers.get('Content-Type') || '';
+    if (!contentType.startsWith('text/event-stream')) {
+        const data = await response.json();
+        throw new Error(data.error || `HTTP ${response.status}`);
+    }
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    let total = 0;
+    let annotated = 0;
+
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+
+        let separator;
+        while ((separator = buffer.indexOf('\n\n')) !== -1) {
+            const { event, data } = parseSseEvent(buffer.slice(0, separator));
+            buffer = buffer.slice(separator + 2);
+
+            if (event === 'scenario') {
+                total = data.scenario.length;
+                displayScenario(data.scenario, data.metadata, true);
+                setLoadingMessage(total === 0 && requestBody.candidates
+                    ? `${requestBody.candidates}個の候補を生成・比較中...`
+                    : `アノテーション中... (0/${total})`);
+            } else if (event === 'selection') {
+                // 複数の候補から目標割合に最も近い候補が選ばれた（ここから選んだ候補の発言が届く）
+                setLoadingMessage(`候補${data.selected + 1}を選択しました（${data.scored.length}/${data.candidates}候補を評価）。アノテーション中...`);
+            } else if (event === 'utterance') {
+                // ストリーミング生成: 発言が1つ届くたびに追加（前の発言のアノテーションと並行して届く）
+                total += 1;
+                appendScenarioSegment(data.index, [{ speaker: data.speaker, text: data.text }]);
+                setLoadingMessage(`生成・アノテーション中... (${annotated}/${total})`);
+            } else if (event === 'segment') {
+                // 分割生成の続きの部分（前の部分のアノテーションと並行して届く）
+                total += data.utterances.length;
+                appendScenarioSegment(data.start, data.utterances);
+                setLoadingMessage(`アノテーション中... (${annotated}/${total})`);
+            } else if (event === 'annotation') {
+                annotated += 1;
+                updateUtteranceMetrics(data.index, data.metrics, data.annotation_error);
+                setLoadingMessage(`アノテーション中... (${annotated}/${total})`);
+            } else if (event === 'done') {
+                finalizeScenario(data.metadata);
+            } else if (event === 'error') {
+                throw new Error(data.error);
+            }
+        }
+    }
+}
+
+// Parse one Server-Sent Events block into { event, data }
+function parseSseEvent(block) {
+    let event = 'message';
+    const dataLines = [];
+    block.split('\n').forEach(line => {
+        if (line.startsWith('event:')) {
+            event = line.slice(6).trim();
+        } else if (line.startsWith('data:')) {
+            dataLines.push(line.slice(5).trim());
+        }
+    });
+    return { event, data: dataLines.length > 0 ? JSON.parse(dataLines.join('\n')) : null };
+}
+
+// Generate via a background job and poll until it finishes
+async function generateWithJob(requestBody) {
+    const response = await fetch('/api/jobs', {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json'
+        },
+        body: JSON.stringify(requestBody)
+    });
+
+    const data = await response.json();
+
+    if (data.error) {
+        throw new Error(data.error);
+    }
+
+    const job = await waitForJob(data.job_id);
+
+    if (job.status === 'failed') {
+        throw new Error(job.error);
+    }
+
+    displayScenario(job.result.scenario, job.result.metadata);
+}
+
+// Poll a generation job until it completes or fails
+async function waitForJob(jobId, intervalMs = 1500) {
+    while (true) {
+        const response = await fetch(`/api/jobs/${jobId}`);
+        const job = await response.json();
+
+        if (job.error && !job.status) {
+            throw new Error(job.error);
+        }
+
+        if (job.status === 'completed' || job.status === 'failed') {
+            return job;
+        }
+
+        if (job.stage === 'annotating' && job.progress.total > 0) {
+            setLoadingMessage(`アノテーション中... (${job.progress.annotated}/${job.progress.total})`);
+        } else if (job.stage === 'saving') {
+            setLoadingMessage('保存中...');
+        } else if (job.status === 'queued') {
+            setLoadingMessage('順番待ち中...');
+        } else {
+            setLoadingMessage('シナリオを生成中...');
+        }
+
+        await new Promise(resolve => setTimeout(resolve, intervalMs));
+    }
+}
+
+// Update the loading message
+function setLoadingMessage(message) {
+    const messageEl = loading.querySelector('p');
+    if (messageEl) messageEl.textContent = message;
+}
+
 // Display scenario with annotations
-function displayScenario(scenario, metadata) {
+// pending=true の場合、metricsのない発言には評価中の表示を出す
+function displayScenario(scenario, metadata, pending = false) {
     // Display metadata
-    scenarioMetadata.innerHTML = `
-        <strong>会議の目的:</strong> ${metadata.meeting_purpose} &nbsp;|&nbsp;
-        <strong>形式:</strong> ${metadata.meeting_format} &nbsp;|&nbsp;
-        <strong>発言数:</strong> ${metadata.num_utterances}
-    `;
+    renderScenarioMetadata(metadata);
 
     // Clear previous scenario
     scenarioDisplay.innerHTML = '';
 
     // Display each utterance
     scenario.forEach((utterance, index) => {
-        const uttDiv = document.createElement('div');
-        uttDiv.className = 'utterance';
-
-        let metricsHtml = '';
-        if (utterance.metrics) {
-            metricsHtml = '<div class="metrics">';
-
-            for (const [metricName, metricData] of Object.entries(utterance.metrics)) {
-                const score = metricData.score;
-                const reason = metricData.reason || '';
-                const scoreClass = getScoreClass(score);
-
-                metricsHtml += `
-                    <div class="metric">
-                        <div class="metric-name">${metricName}</div>
-                        <div class="metric-score">
-                            <span class="score-badge ${scoreClass}">${score}</span>
-                        </div>
-                        <div class="metric-reason">${reason}</div>
-                    </div>
-                `;
-            }
-
-            metricsHtml += '</div>';
-        }
-
-        uttDiv.innerHTML = `
-            <div class="utterance-header">
-                <span class="speaker">${utterance.speaker}</span>
-                <span class="utterance-number">#${index + 1}</span>
-            </div>
-            <div class="utterance-text">${utterance.text}</div>
-            ${metricsHtml}
-        `;
-
-        scenarioDisplay.appendChild(uttDiv);
+        scenarioDisplay.appendChild(createUtteranceElement(utterance, index, pending));
     });
 
     // Show scenario section
@@ -284,12 +385,125 @@ function displayScenario(scenario, metadata) {
     if (typeof chartEditor !== 'undefined') {
         // ファイル名を取得（保存された場合）
         const filename = metadata.saved_to ? metadata.saved_to.split('/').pop() : null;
-        chartEditor.initializeCharts(scenario, filename);
+        chartEditor.initializeCharts(scenario, filename, metadata.annotation_metrics);
+    }
+
+    setSavedTo(metadata.saved_to);
+}
+
+// Append the next segment of a segmented generation (metrics pending)
+function appendScenarioSegment(start, utterances) {
+    utterances.forEach((utterance, offset) => {
+        scenarioDisplay.appendChild(createUtteranceElement(utterance, start + offset, true));
+    });
+
+    if (typeof chartEditor !== 'undefined') {
+        chartEditor.appendUtterances(utterances);
+    }
+}
+
+// Build the element for one utterance
+function createUtteranceElement(utterance, index, pending) {
+    const uttDiv = document.createElement('div');
+    uttDiv.className = 'utterance';
+    uttDiv.id = `utterance-${index}`;
+
+    let metricsHtml = '';
+    if (utterance.annotation_error) {
+        metricsHtml = renderAnnotationError(utterance.annotation_error);
+    } else if (utterance.metrics) {
+        metricsHtml = renderMetrics(utterance.metrics);
+    } else if (pending) {
+        metricsHtml = '<div class="metrics metrics-pending">評価中...</div>';
+    }
+
+    uttDiv.innerHTML = `
+        <div class="utterance-header">
+            <span class="speaker">${utterance.speaker}</span>
+            <span class="utterance-number">#${index + 1}</span>
+        </div>
+        <div class="utterance-text">${utterance.text}</div>
+        ${metricsHtml}
+    `;
+    return uttDiv;
+}
+
+// Render metadata summary
+function renderScenarioMetadata(metadata) {
+    scenarioMetadata.innerHTML = `
+        <strong>会議の目的:</strong> ${metadata.meeting_purpose} &nbsp;|&nbsp;
+        <strong>形式:</strong> ${metadata.meeting_format} &nbsp;|&nbsp;
+        <strong>発言数:</strong> ${metadata.num_utterances}
+    `;
+}
+
+// Render metric badges and reasons for one utterance
+function renderMetrics(metrics) {
+    // Scores filled in by the local model while the API was unavailable
+    const local = Object.values(metrics).some(metricData => metricData.source === 'local');
+    let metricsHtml = local
+        ? '<div class="metrics metrics-local" title="APIで評価できなかったため、ローカル評価モデルで推定しました">'
+        : '<div class="metrics">';
+
+    for (const [metricName, metricData] of Object.entries(metrics)) {
+        const score = metricData.score;
+        const reason = metricData.reason || '';
+        const scoreClass = getScoreClass(score);
+        const estimateLabel = metricData.source === 'local' ? '<span class="metric-estimate">ローカル推定</span>' : '';
+
+        metricsHtml += `
+            <div class="metric">
+                <div class="metric-name">${metricName}${estimateLabel}</div>
+                <div class="metric-score">
+                    <span class="score-badge ${scoreClass}">${score}</span>
+                </div>
+                <div class="metric-reason">${reason}</div>
+            </div>
+        `;
     }
 
-    // Save metadata for CSV download
-    if (metadata.saved_to) {
-        scenarioMetadata.setAttribute('data-saved-to', metadata.saved_to);
+    metricsHtml += '</div>';
+    return metricsHtml;
+}
+
+// Shown in place of metrics when the utterance could not be annotated
+function renderAnnotationError(error) {
+    return `<div class="metrics metrics-pending" title="${error}">評価に失敗しました</div>`;
+}
+
+// Fill in metrics for one utterance as its annotation arrives
+function updateUtteranceMetrics(index, metrics, error = null) {
+    const uttDiv = document.getElementById(`utterance-${index}`);
+    if (!uttDiv) return;
+
+    const html = error ? renderAnnotationError(error) : renderMetrics(metrics);
+    const existing = uttDiv.querySelector('.metrics');
+    if (existing) {
+        existing.outerHTML = html;
+    } else {
+        uttDiv.insertAdjacentHTML('beforeend', html);
+    }
+
+    if (typeof chartEditor !== 'undefined') {
+        chartEditor.updateUtteranceMetrics(index, metrics);
+    }
+}
+
+// Called when the streamed scenario has been saved
+function finalizeScenario(metadata) {
+    renderScenarioMetadata(metadata);
+
+    if (typeof chartEditor !== 'undefined' && metadata.saved_to) {
+        chartEditor.setFilename(metadata.saved_to.split('/').pop());
+    }
+
+    setSavedTo(metadata.saved_to);
+}
+
+// Save metadata for CSV download
+function setSavedTo(savedTo) {
+    if (savedTo) {
+        scenarioMetadata.setAttribute('data-saved-to', savedTo);
         if (downloadCsvBtn) downloadCsvBtn.disabled = false;
         if (saveAnnotationsBtn) saveAnnotationsBtn.disabled = false;
     } else {
@@ -0,0 +1,282 @@
+"""
+telemetry.py
+LLM呼び出し・ファイル入出力・HTTPリクエストの計測を行うモジュール
+
+- Prometheusのテキスト形式で出力できるカウンター・ヒストグラム（GET /metrics）
+- 1シナリオ分の処理中に記録したスパン（LLM呼び出し・ファイル入出力・処理段階）を集計するトレース
+  （出力JSONの metadata.telemetry に保存する）
+"""
+import contextvars
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+# モデルごとの料金（USD / 100万トークン）。環境変数 LLM_PRICING（同じ形式のJSON）で上書き・追加できる
+MODEL_PRICING = {
+    "gpt-4o": {"input": 2.50, "cached_input": 1.25, "output": 10.00},
+    "gpt-4o-mini": {"input": 0.15, "cached_input": 0.075, "output": 0.60},
+}
+MODEL_PRICING.update(json.loads(os.getenv("LLM_PRICING", "{}")))
+
+
+def _format_labels(label_names: Sequence[str], label_values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(label_names, label_values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class Counter:
+    """ラベルごとに単調増加する値"""
+
+    def __init__(self, name: str, help_text: str, label_names: Sequence[str] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels: Any) -> None:
+        key = tuple(str(labels.get(name, "")) for name in self.label_names)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.label_names, key)} {value}")
+        return lines
+
+
+class Histogram:
+    """ラベルごとの値の分布（累積バケット・合計・件数）"""
+
+    def __init__(self, name: str, help_text: str, label_names: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(sorted(buckets))
+        self._values: Dict[Tuple[str, ...], Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: Any) -> None:
+        key = tuple(str(labels.get(name, "")) for name in self.label_names)
+        with self._lock:
+            state = self._values.setdefault(key, {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0})
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state["counts"][i] += 1
+            state["sum"] += value
+            state["count"] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, state in sorted(self._values.items()):
+                labels = _format_labels(self.label_names, key)
+                for bound, count in zip(self.buckets, state["counts"]):
+                    bucket_labels = _format_labels(self.label_names, key, 'le="%s"' % bound)
+                    lines.append(f"{self.name}_bucket{bucket_labels} {count}")
+                inf_labels = _format_labels(self.label_names, key, 'le="+Inf"')
+                lines.append(f"{self.name}_bucket{inf_labels} {state['count']}")
+                lines.append(f"{self.name}_sum{labels} {round(state['sum'], 6)}")
+                lines.append(f"{self.name}_count{labels} {state['count']}")
+        return lines
+
+
+class Registry:
+    """メトリクスをまとめてPrometheusのテキスト形式で出力する"""
+
+    def __init__(self):
+        self._metrics: List[Any] = []
+
+    def counter(self, name: str, help_text: str, label_names: Sequence[str] = ()) -> Counter:
+        metric = Counter(name, help_text, label_names)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, help_text: str, label_names: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        metric = Histogram(name, help_text, label_names, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+LLM_REQUESTS = REGISTRY.counter(
+    "well_scenario_llm_requests_total", "LLM呼び出し数（outcome: success / error / cache_hit）", ["model", "outcome"])
+LLM_SECONDS = REGISTRY.histogram(
+    "well_scenario_llm_request_seconds", "LLM呼び出しの所要時間（再試行・レート制限の待機を含む）", ["model"])
+LLM_TOKENS = REGISTRY.counter(
+    "well_scenario_llm_tokens_total", "LLMのトークン数（type: prompt / cached_prompt / completion）", ["model", "type"])
+LLM_RETRIES = REGISTRY.counter(
+    "well_scenario_llm_retries_total", "LLM呼び出しの再試行回数", ["model"])
+FILE_IO_SECONDS = REGISTRY.histogram(
+    "well_scenario_file_io_seconds", "出力ファイルの読み書きの所要時間", ["operation"])
+FILE_IO_BYTES = REGISTRY.counter(
+    "well_scenario_file_io_bytes_total", "出力ファイルの読み書きのバイト数", ["operation"])
+STAGE_SECONDS = REGISTRY.histogram(
+    "well_scenario_stage_seconds", "処理段階（生成・アノテーションなど）の所要時間", ["stage"])
+HTTP_SECONDS = REGISTRY.histogram(
+    "well_scenario_http_request_seconds", "HTTPリクエストの処理時間（ストリーミングは応答開始まで）", ["method", "endpoint", "status"])
+
+
+class Trace:
+    """1シナリオ分の処理中に記録したスパンを保持し、所要時間・コストを集計するクラス"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.spans: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+
+    def add(self, span: Dict[str, Any]) -> None:
+        with self._lock:
+            self.spans.append(span)
+
+    def summary(self) -> Dict[str, Any]:
+        """metadata.telemetry に保存する集計"""
+        with self._lock:
+            spans = list(self.spans)
+
+        llm_calls = [s for s in spans if s["type"] == "llm"]
+        api_calls = [s for s in llm_calls if not s.get("cache_hit")]
+        file_io = [s for s in spans if s["type"] == "file_io"]
+        stages: Dict[str, float] = {}
+        for s in spans:
+            if s["type"] == "stage":
+                stages[s["name"]] = round(stages.get(s["name"], 0.0) + s["seconds"], 3)
+
+        costs = [estimate_cost(s["model"], s.get("prompt_tokens", 0), s.get("cached_prompt_tokens", 0), s.get("completion_tokens", 0)) for s in api_calls]
+        return {
+            "total_seconds": round(time.perf_counter() - self.started, 3),
+            "stages": stages,
+            "llm": {
+                "calls": len(api_calls),
+                "cache_hits": len(llm_calls) - len(api_calls),
+                "errors": sum(1 for s in llm_calls if s.get("error")),
+                "retries": sum(s.get("retries", 0) for s in llm_calls),
+                "prompt_tokens": sum(s.get("prompt_tokens", 0) for s in api_calls),
+                "cached_prompt_tokens": sum(s.get("cached_prompt_tokens", 0) for s in api_calls),
+                "completion_tokens": sum(s.get("completion_tokens", 0) for s in api_calls),
+                "max_latency_seconds": round(max((s["seconds"] for s in api_calls), default=0.0), 3),
+                # 料金表にないモデルを含む場合はNone
+                "estimated_cost_usd": round(sum(costs), 6) if all(c is not None for c in costs) else None,
+            },
+            "file_io": {
+                "reads": sum(1 for s in file_io if s["name"] == "read"),
+                "writes": sum(1 for s in file_io if s["name"] == "write"),
+                "seconds": round(sum(s["seconds"] for s in file_io), 3),
+            },
+        }
+
+
+_current_trace: contextvars.ContextVar = contextvars.ContextVar("well_scenario_trace", default=None)
+
+
+@contextmanager
+def trace() -> Iterator[Trace]:
+    """ブロック内（ワーカースレッドへは contextvars.copy_context で引き継ぐ）のスパンを1つのトレースに集める"""
+    current = Trace()
+    token = _current_trace.set(current)
+    try:
+        yield current
+    finally:
+        _current_trace.reset(token)
+
+
+def _add_span(span: Dict[str, Any]) -> None:
+    current = _current_trace.get()
+    if current is not None:
+        current.add(span)
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """処理段階（generation, annotation など）の所要時間を記録"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - start)
+
+
+def record_stage(name: str, seconds: float) -> None:
+    """処理段階の所要時間を記録（1つのブロックで囲めない段階用）"""
+    STAGE_SECONDS.observe(seconds, stage=name)
+    _add_span({"type": "stage", "name": name, "seconds": seconds})
+
+
+def record_llm_call(
+    model: str,
+    seconds: float,
+    cache_hit: bool = False,
+    retries: int = 0,
+    prompt_tokens: int = 0,
+    cached_prompt_tokens: int = 0,
+    completion_tokens: int = 0,
+    error: Optional[str] = None
+) -> None:
+    """1回のLLM呼び出し（キャッシュヒットを含む）を記録"""
+    outcome = "error" if error else ("cache_hit" if cache_hit else "success")
+    LLM_REQUESTS.inc(model=model, outcome=outcome)
+    if not cache_hit:
+        LLM_SECONDS.observe(seconds, model=model)
+    if retries:
+        LLM_RETRIES.inc(retries, model=model)
+    LLM_TOKENS.inc(prompt_tokens, model=model, type="prompt")
+    LLM_TOKENS.inc(cached_prompt_tokens, model=model, type="cached_prompt")
+    LLM_TOKENS.inc(completion_tokens, model=model, type="completion")
+
+    span = {
+        "type": "llm",
+        "name": "chat.completions",
+        "model": model,
+        "seconds": seconds,
+        "cache_hit": cache_hit,
+        "retries": retries,
+        "prompt_tokens": prompt_tokens,
+        "cached_prompt_tokens": cached_prompt_tokens,
+        "completion_tokens": completion_tokens,
+    }
+    if error:
+        span["error"] = error
+    _add_span(span)
+
+
+def record_file_io(operation: str, path: str, seconds: float, size: int) -> None:
+    """出力ファイルの読み書き（operation: read / write）を記録"""
+    FILE_IO_SECONDS.observe(seconds, operation=operation)
+    FILE_IO_BYTES.inc(size, operation=operation)
+    _add_span({"type": "file_io", "name": operation, "path": str(path), "seconds": seconds, "bytes": size})
+
+
+def estimate_cost(model: str, prompt_tokens: int, cached_prompt_tokens: int, completion_tokens: int) -> Optional[float]:
+    """料金表からAPI呼び出しの概算料金（USD）を計算（料金表にないモデルはNone）"""
+    # "gpt-4o-2024-08-06" のような日付付きのモデル名は、最も長く一致する料金表のモデル名で計算
+    matches = [name for name in MODEL_PRICING if model == name or model.startswith(name + "-")]
+    if not matches:
+        return None
+    pricing = MODEL_PRICING[max(matches, key=len)]
+    fresh_tokens = prompt_tokens - cached_prompt_tokens
+    return (
+        fresh_tokens * pricing["input"]
+        + cached_prompt_tokens * pricing.get("cached_input", pricing["input"])
+        + completion_tokens * pricing["output"]
+    ) / 1_000_000
@@ -0,0 +1,53 @@
+import numpy as np
+
+from agreement import AgreementEngine, _rankdata, agreement_stats, confusion_matrix, weighted_kappa
+from annotation_store import AnnotationStore
+from corpus_export import CorpusExporter
+
+
+def test_weighted_kappa_and_ranks():
+    assert weighted_kappa(np.diag([3, 0, 2, 0, 0, 0, 0, 0, 0, 1])) == 1.0
+    assert weighted_kappa(np.zeros((10, 10), dtype=int)) is None
+    assert list(_rankdata(np.array([3.0, 1.0, 3.0, 2.0]))) == [3.5, 1.0, 3.5, 2.0]
+
+
+def test_zero_and_one_are_different_scores():
+    human, machine = np.array([0.0, 0.0, 9.0]), np.array([1.0, 0.0, 9.0])
+    confusion = confusion_matrix(human, machine)
+    assert confusion.shape == (10, 10)
+    # 人手0・機械1は対角線外（不一致）
+    assert confusion[0, 1] == 1 and confusion[0, 0] == 1 and np.trace(confusion) == 2
+    stats = agreement_stats(human, machine)
+    assert stats["exact"] == 0.667 and stats["kappa"] < 1.0
+
+
+def test_agreement_from_json_and_csv(tmp_path, write_output, scored_scenario, write_sheet):
+    outputs = tmp_path / "outputs"
+    outputs.mkdir()
+    write_output(outputs / "a.json", scored_scenario([1, 5, 9, 3]))
+    write_output(outputs / "b.json", scored_scenario([2, 2, 8]), annotation_model="cheap-model")
+    # a: JSONに保存した人手アノテーション（発言1）はCSVより優先する。発言3は内容が一致しないため使わない
+    AnnotationStore().save_human_annotations(outputs / "a.json", {"1": {"威圧度": {"score": 5}}})
+    write_sheet(outputs / "a_annotation.csv", ["発言0,1,,,", "発言1,2,,,", "発言2,9,,,", "別の発言,3,,,"])
+    write_sheet(outputs / "b_annotation_rater2.csv", ["発言0,4,,,", "発言1,,,,", "発言2,８,,,"])
+    write_sheet(outputs / "missing_annotation.csv", ["発言0,1,,,"])
+
+    engine = AgreementEngine(CorpusExporter(str(outputs), str(tmp_path / "corpus")))
+    result = engine.get()
+
+    sources = result["sources"]
+    assert (sources["human_annotations"], sources["csv"], sources["csv_files"]) == (1, 4, 2)
+    reasons = sorted(m["reason"] for m in sources["mismatches"])
+    assert reasons == ["missing_output", "text"]
+
+    exact = result["by_annotation_model"]["ann-model"]["威圧度"]
+    assert exact["count"] == 3 and exact["kappa"] == 1.0 and exact["mae"] == 0.0
+    cheap = result["by_annotation_model"]["cheap-model"]["威圧度"]
+    assert cheap["count"] == 2 and cheap["mae"] == 1.0 and cheap["bias"] == -1.0
+    overall = result["metrics"]["威圧度"]
+    assert overall["count"] == 5 and sum(map(sum, overall["confusion"])) == 5
+    assert result["metrics"]["逸脱度"] == {"count": 0}
+
+    # 変更がなければ前回の結果を返す
+    assert engine.get() is result
+    assert engine.get(include_csv=False)["sources"]["csv"] == 0
@@ -0,0 +1,36 @@
+from analytics import CorpusAnalytics
+from corpus_export import CorpusExporter
+
+
+def test_distribution_and_target_attainment(tmp_path, write_output, scored_scenario):
+    outputs = tmp_path / "outputs"
+    outputs.mkdir()
+    write_output(outputs / "a.json", scored_scenario([8, 9, 0, 2], speakers=2), target_ratio=50)  # 高スコア 50%（目標 50%）
+    write_output(outputs / "b.json", scored_scenario([1, 7, 1, 1], speakers=2), target_ratio=50,
+                 annotation_model="other")  # 高スコア 25%（目標 50%）
+    analytics = CorpusAnalytics(CorpusExporter(str(outputs), str(tmp_path / "corpus")))
+
+    result = analytics.get()
+    stats = result["metrics"]["威圧度"]
+    assert (result["num_scenarios"], result["num_utterances"]) == (2, 8)
+    # 0点は1点に寄せずに数える
+    assert stats["histogram"] == {"0": 1, "1": 3, "2": 1, "3": 0, "4": 0, "5": 0, "6": 0, "7": 1, "8": 1, "9": 1}
+    assert stats["high_ratio"] == 0.375
+
+    attainment = result["target_attainment"]["威圧度"]
+    assert attainment["scenarios"] == 2
+    assert attainment["mean_high_ratio"] == 0.375
+    assert attainment["attained_ratio"] == 0.5
+    assert attainment["by_target_ratio"]["50"]["scenarios"] == 2
+
+    assert result["by_speaker"]["話者0"]["威圧度"]["mean"] == 2.5
+    assert result["by_annotation_model"]["other"]["威圧度"]["drift"] == 2.5 - 3.625
+
+    # 出力ファイルに変更がなければ集計結果を使い回し、変更があれば集計し直す
+    cached = analytics._result
+    assert analytics.get()["corpus"]["version"] == result["corpus"]["version"]
+    assert analytics._result is cached
+    write_output(outputs / "c.json", scored_scenario([9, 9], speakers=2), target_ratio=50)
+    updated = analytics.get()
+    assert updated["corpus"]["added"] == 1
+    assert updated["metrics"]["威圧度"]["histogram"]["9"] == 3
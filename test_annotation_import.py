@@ -0,0 +1,67 @@
+import codecs
+import io
+import zipfile
+
+from annotation_csv import csv_name, iter_annotation_csv, iter_annotation_zip, read_annotation_csv
+from annotation_import import import_annotation_sheets
+from annotation_store import AnnotationStore
+from metric_annotator import METRIC_NAMES
+
+
+def test_import_sheets_in_one_pass(tmp_path, write_output, scored_scenario, write_sheet):
+    outputs = tmp_path / "outputs"
+    write_output(outputs / "sub" / "a.json", scored_scenario([1] * 3))
+    write_output(outputs / "b.json", scored_scenario([1] * 2))
+    store = AnnotationStore()
+    # 取り込み前に保存された編集（編集ログ）も残る
+    store.save_human_annotations(outputs / "sub" / "a.json", {"2": {"偏り度": {"score": 4}}})
+
+    write_sheet(outputs / "sub" / "a_annotation.csv", ["発言0,8,2,,", "発言1,12,,,", "発言 2 ,abc,,,"])
+    write_sheet(tmp_path / "a_annotation_rater2.csv", ["発言0,9,,,"])
+    write_sheet(tmp_path / "b_annotation.csv", ["発言0,3,,,", "違う発言,5,,,"])
+    write_sheet(tmp_path / "c_annotation.csv", ["発言0,1,,,"])
+    paths = [outputs / "sub" / "a_annotation.csv", tmp_path / "a_annotation_rater2.csv",
+             tmp_path / "b_annotation.csv", tmp_path / "c_annotation.csv"]
+    sheets = [read_annotation_csv(p) for p in paths]
+
+    result = import_annotation_sheets(sheets, str(outputs), store=store, metric_names=METRIC_NAMES)
+    assert sorted(result["updated_files"]) == ["b.json", "sub/a.json"]
+    assert result["applied"] == 3
+    reports = {r["csv"]: r for r in result["sheets"]}
+    assert reports["a_annotation.csv"]["superseded"] == 1
+    assert sorted(m["reason"] for m in reports["a_annotation.csv"]["mismatches"]) == ["invalid_score", "out_of_range"]
+    assert [m["reason"] for m in reports["b_annotation.csv"]["mismatches"]] == ["text"]
+    assert [m["reason"] for m in reports["c_annotation.csv"]["mismatches"]] == ["missing_output"]
+
+    a = store.load(outputs / "sub" / "a.json")["scenario"]
+    assert a[0]["human_annotations"]["威圧度"]["score"] == 9
+    assert a[0]["human_annotations"]["逸脱度"]["score"] == 2
+    assert a[2]["human_annotations"]["偏り度"]["score"] == 4
+    assert a[0]["machine_annotations"]["威圧度"]["score"] == 1
+    b = store.load(outputs / "b.json")["scenario"]
+    assert b[0]["human_annotations"]["威圧度"]["score"] == 3 and "human_annotations" not in b[1]
+
+    # 同じCSVを取り込み直しても何も書き換えない
+    mtime = (outputs / "b.json").stat().st_mtime_ns
+    again = import_annotation_sheets(sheets, str(outputs), store=store, metric_names=METRIC_NAMES)
+    assert (again["applied"], again["unchanged"], again["updated_files"]) == (0, 3, [])
+    assert (outputs / "b.json").stat().st_mtime_ns == mtime
+
+
+def test_zip_export_round_trip(tmp_path, write_output, scored_scenario):
+    outputs = tmp_path / "outputs"
+    scenario = write_output(outputs / "a.json", scored_scenario([1] * 2))["scenario"]
+
+    chunks = iter_annotation_zip([(csv_name("sub/a.json"), lambda: iter_annotation_csv(scenario, METRIC_NAMES, True))])
+    archive = zipfile.ZipFile(io.BytesIO(b"".join(chunks)))
+    assert archive.namelist() == ["sub/a_annotation.csv"]
+    content = archive.read("sub/a_annotation.csv")
+    assert content.startswith(codecs.BOM_UTF8)
+
+    # 評価者が記入したCSVをそのまま取り込める（機械アノテーションの参考列は無視される）
+    filled = content.decode("utf-8-sig").replace("発言0,,,,,1,", "発言0,6,,,,1,")
+    (tmp_path / "a_annotation.csv").write_bytes(filled.encode("utf-8-sig"))
+    sheet = read_annotation_csv(tmp_path / "a_annotation.csv")
+    assert list(sheet.scores) == METRIC_NAMES
+    result = import_annotation_sheets([sheet], str(outputs), metric_names=METRIC_NAMES)
+    assert result["applied"] == 1 and result["mismatches"] == 0
@@ -0,0 +1,87 @@
+import json
+import threading
+
+from annotation_store import AnnotationStore, edit_log_path, file_lock, lock_path
+from reannotate import reannotate_output
+
+
+def test_concurrent_saves_keep_every_edit(tmp_path, write_output, scored_scenario):
+    path = tmp_path / "output.json"
+    write_output(path, scored_scenario([99] * 5))
+    store = AnnotationStore(compact_every=7)
+
+    def save(metric):
+        for index in range(5):
+            store.save_human_annotations(path, {str(index): {metric: {"score": index, "note": metric}}})
+
+    threads = [threading.Thread(target=save, args=(metric,)) for metric in ["威圧度", "逸脱度", "発言無効度", "偏り度"]]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    data = store.load(path)
+    for index, utt in enumerate(data["scenario"]):
+        assert utt["machine_annotations"]["威圧度"]["score"] == 99
+        assert {metric: a["score"] for metric, a in utt["human_annotations"].items()} == {
+            "威圧度": index, "逸脱度": index, "発言無効度": index, "偏り度": index
+        }
+
+    # 20件の編集のうち、コンパクション済みの分は出力JSONに反映され、残りだけがログに残る
+    assert store.pending_edits(path) == 20 % 7
+    store.compact(path)
+    assert not edit_log_path(path).exists()
+    assert json.loads(path.read_text(encoding="utf-8")) == data
+
+
+def test_file_lock_is_reentrant_and_per_file(tmp_path, write_output, scored_scenario):
+    path, other = tmp_path / "output.json", tmp_path / "other.json"
+    write_output(path, scored_scenario([99] * 5))
+    write_output(other, scored_scenario([99] * 5))
+    store = AnnotationStore()
+
+    # 更新中の関数から同じファイルを読み込んでもロック待ちにならない
+    store.update(path, lambda data: data["metadata"].update(num_utterances=len(store.load(path)["scenario"])))
+    assert store.load(path)["metadata"]["num_utterances"] == 5
+    assert lock_path(path).exists() and lock_path(path).name == ".output.json.lock"
+
+    # 別のファイルは、あるファイルのロック中にも別のスレッドから読み書きできる
+    done = threading.Event()
+    with file_lock(path):
+        thread = threading.Thread(target=lambda: (store.load(other), done.set()))
+        thread.start()
+        assert done.wait(5)
+    thread.join()
+
+
+def test_out_of_range_and_truncated_log_lines_are_ignored(tmp_path, write_output, scored_scenario):
+    path = tmp_path / "output.json"
+    write_output(path, scored_scenario([99] * 2))
+    store = AnnotationStore()
+
+    assert store.save_human_annotations(path, {"5": {"威圧度": {"score": 3}}}) == 0
+    store.save_human_annotations(path, {"0": {"威圧度": {"score": 3}}})
+    # 追記中の中断を模して、改行のない壊れた行を残す
+    with open(edit_log_path(path), "a", encoding="utf-8") as f:
+        f.write('{"utterance": 1, "metr')
+    store.save_human_annotations(path, {"1": {"偏り度": {"score": 8}}})
+
+    data = store.load(path)
+    assert data["scenario"][0]["human_annotations"]["威圧度"]["score"] == 3
+    assert data["scenario"][1]["human_annotations"] == {"偏り度": {**data["scenario"][1]["human_annotations"]["偏り度"], "score": 8}}
+
+
+def test_reannotation_keeps_unsaved_human_edits(tmp_path, write_output, scored_scenario, make_annotator):
+    path = tmp_path / "output.json"
+    write_output(path, scored_scenario([99] * 3))
+    store = AnnotationStore()
+    store.save_human_annotations(path, {"2": {"威圧度": {"score": 9}}})
+
+    annotator, _ = make_annotator()
+    reannotate_output(annotator, path, "all", store=store)
+
+    data = json.loads(path.read_text(encoding="utf-8"))
+    assert not edit_log_path(path).exists()
+    assert data["scenario"][2]["human_annotations"]["威圧度"]["score"] == 9
+    assert data["scenario"][2]["machine_annotations"]["威圧度"]["score"] != 99
+    assert data["scenario"][0]["metrics"]["威圧度"]["score"] != 99
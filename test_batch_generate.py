@@ -0,0 +1,55 @@
+import json
+import threading
+import uuid
+from types import SimpleNamespace
+
+from batch_generate import BatchRunner, expand_tasks
+from llm_cache import LLMCache
+from llm_client import LLMClient
+from metric_annotator import MetricAnnotator
+from mock_openai_server import canned_response
+from scenario_generator import ScenarioGenerator
+
+
+class RandomScenarioCompletions:
+    """シナリオ生成の呼び出しごとに異なる発言を返し、生成プロンプトを記録する"""
+
+    def __init__(self):
+        self.generation_prompts = []
+        self._lock = threading.Lock()
+
+    def create(self, **kwargs):
+        result = canned_response(kwargs["messages"])
+        prompt = kwargs["messages"][-1]["content"]
+        if "■ 会議設定" in prompt:
+            with self._lock:
+                self.generation_prompts.append(prompt)
+            result = {"scenario": [{"speaker": "田中", "text": f"発言{uuid.uuid4().hex}"} for _ in range(3)]}
+        message = SimpleNamespace(content=json.dumps(result, ensure_ascii=False), refusal=None)
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=None)
+
+
+def test_repetitions_are_generated_separately(tmp_path):
+    (tmp_path / "profiles").mkdir()
+    (tmp_path / "profiles" / "p.json").write_text(json.dumps([{"id": "田中"}], ensure_ascii=False), encoding="utf-8")
+    # 応答キャッシュが有効でも、繰り返しごとに新しいシナリオを生成する
+    llm_client = LLMClient("dummy", cache=LLMCache(str(tmp_path / "cache")))
+    completions = RandomScenarioCompletions()
+    llm_client.client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+    generator = ScenarioGenerator("dummy", "gen-model", llm_client=llm_client, cache_responses=True)
+    annotator = MetricAnnotator("dummy", "ann-model", "data/extra.json", llm_client=llm_client)
+    runner = BatchRunner(
+        generator, annotator, str(tmp_path / "profiles"), str(tmp_path / "outputs"),
+        tmp_path / "checkpoint.jsonl", sanitize_mode=True
+    )
+
+    item = {"id": "a", "profile": "p.json", "meeting_purpose": "目的", "meeting_format": "形式",
+            "num_utterances": 3, "repetitions": 3}
+    assert runner.run(expand_tasks([item]), workers=1) == 0
+
+    assert len(completions.generation_prompts) == 3 and len(set(completions.generation_prompts)) == 3
+    scenarios = [
+        tuple(utt["text"] for utt in json.loads(path.read_text(encoding="utf-8"))["scenario"])
+        for path in sorted((tmp_path / "outputs").glob("*.json"))
+    ]
+    assert len(scenarios) == 3 and len(set(scenarios)) == 3
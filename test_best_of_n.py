@@ -0,0 +1,77 @@
+import re
+import threading
+
+from best_of_n import CandidateSelector, sample_indices, target_gap
+from generation_pipeline import generate_and_annotate
+from metric_annotator import METRIC_NAMES, MetricAnnotator
+from mock_openai_server import canned_response
+from scenario_generator import ScenarioGenerator
+
+
+class CandidateLLM:
+    """候補2の偶数番目の発言だけ威圧度を高く評価し、モデルごとの評価件数を数える"""
+
+    def __init__(self):
+        self.annotations = {}
+        self.system_prompts = {}
+        self._lock = threading.Lock()
+
+    def request_json(self, request, use_cache=True):
+        prompt = request["messages"][-1]["content"]
+        if "【評価対象の発言】\n" not in prompt:
+            return canned_response(request["messages"])
+        with self._lock:
+            self.annotations[request["model"]] = self.annotations.get(request["model"], 0) + 1
+            self.system_prompts.setdefault(request["model"], set()).add(request["messages"][0]["content"])
+        target = prompt.split("【評価対象の発言】\n", 1)[1].split("\n", 1)[0]
+        number = int(re.search(r"モック発言(\d+)", target).group(1))
+        high = "（候補2）" in target and number % 2 == 0
+        return {name: {"score": 8 if high else 1, "reason": ""} for name in METRIC_NAMES}
+
+
+def test_sample_indices_and_gap():
+    assert sample_indices(5, 12) == [0, 1, 2, 3, 4]
+    assert sample_indices(40, 4) == [5, 15, 25, 35]
+    annotated = [{"metrics": {"威圧度": {"score": s}}} for s in (8, 1, 9, 2)] + [{"metrics": {}}]
+    assert target_gap(annotated, ["威圧度"], 30) == 20.0
+    assert target_gap(annotated, ["逸脱度"], 30) is None
+
+
+def test_best_of_n_annotates_only_the_selected_candidate():
+    llm = CandidateLLM()
+    generator = ScenarioGenerator("dummy", "gen-model", llm_client=llm)
+    annotator = MetricAnnotator("dummy", "main-model", "data/extra.json", max_workers=4, llm_client=llm)
+    proxy = MetricAnnotator("dummy", "proxy-model", "data/extra.json", max_workers=4, llm_client=llm)
+    selector = CandidateSelector(generator, proxy, candidates=3, tolerance=10, sample_size=4)
+    selections = []
+
+    annotated = generate_and_annotate(
+        generator, annotator, [{"id": "田中"}, {"id": "佐藤"}], "目的", "形式",
+        num_utterances=20, focus_metrics=["威圧度"], target_ratio=50,
+        selector=selector, on_selection=selections.append
+    )
+
+    report = selections[0]
+    assert report["selected"] == 1 and report["early_stop"] and report["proxy_model"] == "proxy-model"
+    assert {s["variant"]: s["gap"] for s in report["scored"]}[1] == 0.0
+    assert len(report["scored"]) + report["cancelled"] == 3
+    # 選ばれた候補だけを本来のモデルで全発言評価し、代理評価は候補ごとに sample_size 発言まで
+    assert len(annotated) == 20 and all("（候補2）" in utt["text"] for utt in annotated)
+    assert llm.annotations["main-model"] == 20
+    assert llm.annotations["proxy-model"] <= 3 * 4
+    # 代理評価は重点指標だけを評価する
+    assert all("【威圧度】" in s and "【逸脱度】" not in s for s in llm.system_prompts["proxy-model"])
+    assert all("【逸脱度】" in s for s in llm.system_prompts["main-model"])
+
+
+def test_selector_is_unused_without_focus_metrics():
+    llm = CandidateLLM()
+    generator = ScenarioGenerator("dummy", "gen-model", llm_client=llm)
+    annotator = MetricAnnotator("dummy", "main-model", "data/extra.json", llm_client=llm)
+    proxy = MetricAnnotator("dummy", "proxy-model", "data/extra.json", llm_client=llm)
+    selections = []
+    annotated = generate_and_annotate(
+        generator, annotator, [{"id": "田中"}], "目的", "形式", num_utterances=5,
+        selector=CandidateSelector(generator, proxy, candidates=3), on_selection=selections.append
+    )
+    assert len(annotated) == 5 and not selections and "proxy-model" not in llm.annotations
@@ -0,0 +1,52 @@
+import json
+import os
+import time
+
+from config_cache import ConfigCache
+from metric_annotator import MetricAnnotator
+from scenario_generator import ScenarioGenerator
+
+
+def touch_later(path, seconds):
+    os.utime(path, (time.time() + seconds, time.time() + seconds))
+
+
+def test_definitions_are_shared_and_swapped_on_change(tmp_path):
+    extra_path = tmp_path / "extra.json"
+    extra_path.write_text(open("data/extra.json", encoding="utf-8").read(), encoding="utf-8")
+    cache = ConfigCache()
+    annotator = MetricAnnotator("dummy", "fake-model", str(extra_path), config_cache=cache)
+    generator = ScenarioGenerator("dummy", "fake-model", extra_json_path=str(extra_path), config_cache=cache)
+
+    first_prompt = annotator.system_prompt.get()
+    assert annotator.system_prompt.definitions is generator.metric_sections.definitions
+    assert annotator.system_prompt.get() is first_prompt
+    assert cache.stats()["loads"] == 1
+
+    definitions = json.loads(extra_path.read_text(encoding="utf-8"))
+    definitions["威圧度"]["定義"] = "更新された定義"
+    extra_path.write_text(json.dumps(definitions, ensure_ascii=False), encoding="utf-8")
+    touch_later(extra_path, 10)
+
+    assert "更新された定義" in annotator.system_prompt.get()
+    assert "更新された定義" in generator.metric_sections.get()["威圧度"]
+    assert cache.stats()["loads"] == 2
+
+    # 編集途中の壊れたファイルは無視し、前回の定義を使い続ける
+    extra_path.write_text("{", encoding="utf-8")
+    touch_later(extra_path, 20)
+    assert "更新された定義" in annotator.system_prompt.get()
+
+
+def test_etag_follows_content(tmp_path):
+    path = tmp_path / "profile.json"
+    path.write_text('[{"name": "A"}]', encoding="utf-8")
+    cache = ConfigCache()
+
+    etag = cache.get(str(path)).etag
+    assert cache.get(str(path)).etag == etag
+
+    path.write_text('[{"name": "B"}]', encoding="utf-8")
+    touch_later(path, 10)
+    entry = cache.get(str(path))
+    assert entry.etag != etag and entry.data == [{"name": "B"}]
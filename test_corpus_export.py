@@ -0,0 +1,36 @@
+import math
+
+from annotation_store import AnnotationStore
+from corpus_export import CorpusExporter, load_corpus
+
+
+def test_incremental_export_matches_full_export(tmp_path, write_output, scored_scenario):
+    outputs = tmp_path / "outputs"
+    write_output(outputs / "a.json", scored_scenario([2] * 3, speakers=2, text="発言{}です"))
+    write_output(outputs / "sub" / "b.json", scored_scenario([5] * 2, speakers=2, text="発言{}です"))
+    exporter = CorpusExporter(str(outputs), str(tmp_path / "corpus"))
+
+    assert exporter.export()["added"] == 2
+    corpus = load_corpus(str(tmp_path / "corpus"))
+    assert len(corpus) == 5
+    assert list(corpus["scenario_id"]) == ["a"] * 3 + ["sub/b"] * 2
+    assert corpus["text"][3] == "発言0です"
+    assert list(corpus["machine.威圧度"]) == [2, 2, 2, 5, 5]
+    assert math.isnan(corpus["human.威圧度"][0])
+    assert corpus["focus_metrics"][0] == "威圧度" and corpus["target_ratio"][0] == 30
+
+    # 未反映の人手アノテーション（編集ログ）と新しいファイルだけが読み込まれる
+    AnnotationStore().save_human_annotations(outputs / "a.json", {"1": {"威圧度": {"score": 8}}})
+    write_output(outputs / "c.json", scored_scenario([9], speakers=2, text="発言{}です"))
+    summary = exporter.export()
+    assert (summary["added"], summary["changed"], summary["removed"]) == (1, 1, 0)
+
+    (outputs / "sub" / "b.json").unlink()
+    assert exporter.export()["removed"] == 1
+
+    incremental = load_corpus(str(tmp_path / "corpus")).to_pandas()
+    exporter.export(full=True)
+    full = load_corpus(str(tmp_path / "corpus")).to_pandas()
+    assert incremental.equals(full)
+    assert list(full["human.威圧度"].fillna(-1)) == [-1, 8, -1, -1]
+    assert list(full["machine.威圧度"]) == [2, 2, 2, 9]
@@ -0,0 +1,133 @@
+import json
+import threading
+
+import telemetry
+from generation_pipeline import generate_and_annotate, iter_generate_and_annotate
+from llm_client import LLMClient
+from metric_annotator import MetricAnnotator
+from mock_openai_server import MockBehavior, canned_response, start_mock_server
+from scenario_generator import (
+    GENERATION_PROMPT_PREFIX, GENERATION_SYSTEM_PROMPT, RECENT_TURNS, ScenarioGenerator, ScenarioStreamParser, plan_segments
+)
+
+
+class RecordingLLM:
+    """モックサーバーと同じ応答を返し、シナリオ生成のプロンプトを記録する"""
+
+    def __init__(self):
+        self.prompts = []
+        self._lock = threading.Lock()
+
+    def request_json(self, request, use_cache=True):
+        prompt = request["messages"][-1]["content"]
+        if "■ 会議設定" in prompt:
+            with self._lock:
+                self.prompts.append(prompt)
+        return canned_response(request["messages"])
+
+
+def test_plan_segments_keeps_target_ratio():
+    plan = plan_segments(100, 40, 30)
+    assert [s["phase"] for s in plan] == ["opening", "discussion", "closing"]
+    assert [s["size"] for s in plan] == [34, 33, 33]
+    assert [s["start"] for s in plan] == [0, 34, 67]
+    assert sum(s["target_count"] for s in plan) == 30
+    assert all(abs(s["target_count"] - s["size"] * 0.3) < 1 for s in plan)
+    assert plan_segments(10, 40, 50) == [{"phase": "opening", "start": 0, "size": 10, "target_count": 5}]
+
+
+def test_generation_system_prompt_is_static():
+    requests = []
+
+    class CapturingLLM:
+        def request_json(self, request, use_cache=True):
+            requests.append(request["messages"])
+            return canned_response(request["messages"])
+
+    generator = ScenarioGenerator("dummy", "mock-model", llm_client=CapturingLLM())
+    profiles = [{"id": "田中"}, {"id": "佐藤"}]
+    generator.generate_scenario(profiles, "目的", "形式", num_utterances=10)
+    generator.generate_scenario(profiles, "目的", "形式", num_utterances=20, focus_metrics=["逸脱度"], target_ratio=70)
+    generator.generate_scenario(profiles, "目的", "形式", num_utterances=30, focus_metrics=["逸脱度"], target_ratio=20)
+
+    # システムプロンプトと生成要件は全リクエストで同じで、発言数・割合はユーザープロンプトの末尾にだけ入る
+    assert {messages[0]["content"] for messages in requests} == {GENERATION_SYSTEM_PROMPT}
+    assert all(messages[1]["content"].startswith(GENERATION_PROMPT_PREFIX) for messages in requests)
+    settings = [messages[1]["content"][len(GENERATION_PROMPT_PREFIX):] for messages in requests]
+    assert "全20発言のうち、約14発言は会議と無関係な雑談" in settings[1]
+    assert "全30発言のうち、約6発言だけ脱線" in settings[2]
+    assert "全10発言のうち、約5発言は会議と無関係な雑談" in settings[0]
+
+
+def test_segmented_generation_overlaps_annotation():
+    llm = RecordingLLM()
+    generator = ScenarioGenerator("dummy", "mock-model", llm_client=llm, segment_size=4)
+    annotator = MetricAnnotator("dummy", "mock-model", "data/extra.json", max_workers=2, llm_client=llm)
+    progress = []
+
+    with telemetry.trace() as trace:
+        annotated = generate_and_annotate(
+            generator, annotator, [{"id": "田中"}, {"id": "佐藤"}], "目的", "形式",
+            num_utterances=10, focus_metrics=["威圧度"], target_ratio=30,
+            on_progress=lambda done, total: progress.append((done, total))
+        )
+
+    assert [utt["text"] for utt in annotated] == [f"モック発言{i + 1}です。議題について意見を述べます。" for i in range(10)]
+    assert all("metrics" in utt for utt in annotated)
+    assert progress[-1] == (10, 10) and all(total == 10 for _, total in progress)
+    assert set(trace.summary()["stages"]) == {"generation", "annotation"}
+
+    # 2つ目以降の部分は、前の部分の要約と直前の発言を条件に生成する
+    assert len(llm.prompts) == 3
+    assert "今回は第1〜4発言" in llm.prompts[0] and "■ これまでの会議の要約" not in llm.prompts[0]
+    assert "第4発言まで議題について意見を述べた。" in llm.prompts[1]
+    recent = llm.prompts[2].split("■ 直前の発言\n", 1)[1].split("\n\n", 1)[0].splitlines()
+    assert len(recent) == RECENT_TURNS and recent[-1].endswith("モック発言7です。議題について意見を述べます。")
+    assert "発言数: 約3個" in llm.prompts[2] and "会議を締めくくってください" in llm.prompts[2]
+
+
+def test_short_meeting_is_generated_in_one_call():
+    llm = RecordingLLM()
+    generator = ScenarioGenerator("dummy", "mock-model", llm_client=llm, segment_size=40)
+    scenario = generator.generate_scenario([{"id": "田中"}], "目的", "形式", num_utterances=12)
+    assert len(scenario) == 12 and len(llm.prompts) == 1 and "■ 分割生成" not in llm.prompts[0]
+
+
+def test_stream_parser_yields_closed_utterances():
+    content = json.dumps({"scenario": [
+        {"speaker": "田中", "text": "括弧 {[\"]} を含む発言\\"},
+        {"名前": "無効"},
+        {"発言者": "佐藤", "発言内容": "二つ目"},
+    ], "summary": "要約"}, ensure_ascii=False)
+    parser = ScenarioStreamParser()
+    found = [(i, utt) for i in range(0, len(content), 7) for utt in parser.feed(content[i:i + 7])]
+    assert [utt for _, utt in found] == [
+        {"speaker": "田中", "text": "括弧 {[\"]} を含む発言\\"},
+        {"speaker": "佐藤", "text": "二つ目"},
+    ]
+    # 発言オブジェクトが閉じた断片で返し、応答の終わりを待たない
+    assert found[0][0] < content.index("佐藤")
+    assert parser.result()["summary"] == "要約"
+
+
+def test_streamed_generation_overlaps_annotation():
+    server = start_mock_server(MockBehavior(chunk_delay=0.003))
+    try:
+        llm_client = LLMClient("dummy", base_url=server.base_url)
+        generator = ScenarioGenerator("dummy", "mock-model", llm_client=llm_client, stream=True)
+        annotator = MetricAnnotator("dummy", "mock-model", "data/extra.json", max_workers=4, llm_client=llm_client)
+        events = list(iter_generate_and_annotate(generator, annotator, [{"id": "田中"}, {"id": "佐藤"}], "目的", "形式", 20))
+    finally:
+        server.shutdown()
+
+    kinds = [kind for kind, _ in events]
+    assert kinds.count("utterance") == 20 and kinds.count("annotation") == 20 and kinds.count("segment") == 1
+    # 生成が終わる前にアノテーションが届き始める
+    last_utterance = max(i for i, kind in enumerate(kinds) if kind == "utterance")
+    assert kinds.index("annotation") < last_utterance
+    # 各発言は、そのアノテーションより先に届く
+    seen = set()
+    for kind, (index, _) in ((k, p) for k, p in events if k != "segment"):
+        assert kind == "utterance" or index in seen
+        seen.add(index)
+    assert llm_client.usage_stats()["models"]["mock-model"]["completion_tokens"] > 0
@@ -0,0 +1,115 @@
+import json
+from types import SimpleNamespace
+
+import httpx
+import openai
+import pytest
+
+from llm_cache import LLMCache
+from llm_client import LLMClient
+
+
+def rate_limit_error(retry_after=None, code=None):
+    headers = {"retry-after": str(retry_after)} if retry_after is not None else {}
+    response = httpx.Response(429, headers=headers, request=httpx.Request("POST", "https://api.openai.com/v1/chat/completions"))
+    return openai.RateLimitError("rate limited", response=response, body={"code": code} if code else None)
+
+
+class FlakyCompletions:
+    """指定した例外を順に送出した後、JSON応答を返す"""
+
+    def __init__(self, errors):
+        self.errors = list(errors)
+        self.calls = 0
+
+    def create(self, **kwargs):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        if kwargs.get("stream"):
+            return FakeStream(['{"ok"', ': tr', 'ue}'])
+        message = SimpleNamespace(content=json.dumps({"ok": True}), refusal=None)
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=SimpleNamespace(total_tokens=50))
+
+
+class FakeStream:
+    """ストリーミング応答（断片ごとのchunk、最後に使用量だけのchunk）"""
+
+    def __init__(self, pieces):
+        self.chunks = [
+            SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=piece, refusal=None))], usage=None)
+            for piece in pieces
+        ]
+        self.chunks.append(SimpleNamespace(choices=[], usage=SimpleNamespace(total_tokens=50, prompt_tokens=40, completion_tokens=10)))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def __iter__(self):
+        return iter(self.chunks)
+
+
+def make_client(errors, **kwargs):
+    client = LLMClient("dummy", base_delay=0.01, **kwargs)
+    completions = FlakyCompletions(errors)
+    client.client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+    return client, completions
+
+
+REQUEST = {"model": "fake-model", "messages": [{"role": "user", "content": "評価してください"}]}
+
+
+def test_retries_transient_errors_and_honours_retry_after(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr("llm_client.time.sleep", lambda seconds: sleeps.append(seconds))
+
+    client, completions = make_client([rate_limit_error(retry_after=2), openai.APITimeoutError(request=None)])
+
+    assert client.request_json(REQUEST) == {"ok": True}
+    assert completions.calls == 3
+    assert 2 <= sleeps[0] <= 2.01
+
+
+def test_gives_up_on_quota_errors_and_after_max_retries(monkeypatch):
+    monkeypatch.setattr("llm_client.time.sleep", lambda seconds: None)
+
+    client, completions = make_client([rate_limit_error(code="insufficient_quota")])
+    with pytest.raises(openai.RateLimitError):
+        client.request_json(REQUEST)
+    assert completions.calls == 1
+
+    client, completions = make_client([rate_limit_error()] * 3, max_retries=2)
+    with pytest.raises(openai.RateLimitError):
+        client.request_json(REQUEST)
+    assert completions.calls == 3
+
+
+def test_stream_text_retries_before_first_chunk_and_caches(monkeypatch, tmp_path):
+    monkeypatch.setattr("llm_client.time.sleep", lambda seconds: None)
+
+    client, completions = make_client([openai.APITimeoutError(request=None)], cache=LLMCache(str(tmp_path)))
+    request = {**REQUEST, "temperature": 0.9}
+    assert list(client.stream_text(request)) == ['{"ok"', ': tr', 'ue}']
+    assert completions.calls == 2
+    assert client.usage_stats()["models"]["fake-model"]["completion_tokens"] == 10
+
+    # 最後まで受け取った応答はキャッシュから1つの断片として返す
+    assert list(client.stream_text(request)) == ['{"ok": true}']
+    assert completions.calls == 2
+
+
+def test_use_cache_false_bypasses_the_cache(tmp_path):
+    client, completions = make_client([], cache=LLMCache(str(tmp_path)))
+    request = {**REQUEST, "temperature": 0.95}
+    # シナリオ生成のように毎回新しい応答が欲しい呼び出しは、キャッシュを読み書きしない
+    client.request_json(request, use_cache=False)
+    client.request_json(request, use_cache=False)
+    assert list(client.stream_text(request, use_cache=False)) == ['{"ok"', ': tr', 'ue}']
+    assert completions.calls == 3 and not [p for p in tmp_path.rglob("*") if p.is_file()]
+
+    client.request_json(request)
+    client.request_json(request)
+    assert completions.calls == 4
@@ -0,0 +1,72 @@
+import json
+import math
+import random
+from types import SimpleNamespace
+
+from corpus_export import CorpusExporter, flatten_output, load_corpus
+from llm_client import LLMClient
+from local_annotator import LocalAnnotator
+from metric_annotator import MetricAnnotator
+from output_store import build_output_data
+from reannotate import select_utterances
+
+HOSTILE = ["ふざけるな、早く結論を言え", "そんなこともできないのか", "言い訳はいい、黙って聞け"]
+NEUTRAL = ["特に異論ありません。", "資料を共有します。", "ありがとうございました。"]
+
+
+def write_corpus(tmp_path, scenarios=20):
+    rnd = random.Random(0)
+    for k in range(scenarios):
+        scenario = []
+        for i in range(10):
+            hostile = rnd.random() < 0.4
+            scenario.append({
+                "speaker": f"話者{i % 3}",
+                "text": rnd.choice(HOSTILE if hostile else NEUTRAL),
+                "metrics": {"威圧度": {"score": 8 if hostile else 1, "reason": ""}, "逸脱度": {"score": 2, "reason": ""}},
+            })
+        # 評価に失敗した発言は学習に使わない
+        scenario.append({"speaker": "話者0", "text": "特に異論ありません。", "metrics": {"威圧度": {"score": 9}},
+                         "annotation_error": "timeout"})
+        data = build_output_data(scenario, "目的", "形式", "p.json", ["威圧度"], 40, "gen-model", "ann-model", True)
+        path = tmp_path / "outputs" / f"s{k}.json"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+    CorpusExporter(str(tmp_path / "outputs"), str(tmp_path / "corpus")).export()
+    return load_corpus(str(tmp_path / "corpus"))
+
+
+def test_train_save_and_annotate_offline(tmp_path):
+    model = LocalAnnotator.train(write_corpus(tmp_path), hash_dim=2 ** 12)
+    assert model.info["rows"] == 200 and model.info["holdout"]["威圧度"]["mae"] < 1
+    loaded = LocalAnnotator.load(str(model.save(str(tmp_path / "model.npz"))))
+
+    scenario = [{"speaker": "前田", "text": HOSTILE[0]}, {"発言者": "田中", "発言内容": NEUTRAL[0]}, {"speaker": "不正"}]
+    annotated = loaded.annotate_scenario(scenario, "目的", "形式")
+    assert [utt["metrics"]["威圧度"]["score"] for utt in annotated] == [8, 1]
+    assert annotated[1]["speaker"] == "田中" and annotated[1]["annotation_tier"] == "local"
+    assert set(annotated[0]["metrics"]) == {"威圧度", "逸脱度", "発言無効度", "偏り度"}
+    # 評価入力のハッシュは MetricAnnotator と同じ（変更検出・再アノテーションと組み合わせられる）
+    assert [utt["annotation_hash"] for utt in annotated] == MetricAnnotator(
+        "dummy", "m", "data/extra.json", llm_client=LLMClient("dummy")
+    ).annotation_hashes(scenario)
+
+
+def test_fallback_fills_failed_utterances(tmp_path):
+    model = LocalAnnotator.train(write_corpus(tmp_path, scenarios=5), hash_dim=2 ** 12, holdout=0)
+
+    def fail(**kwargs):
+        raise ValueError("API unavailable")
+
+    llm_client = LLMClient("dummy", max_retries=0)
+    llm_client.client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=fail)))
+    annotator = MetricAnnotator("dummy", "m", "data/extra.json", llm_client=llm_client, fallback=model)
+    annotated = annotator.annotate_scenario([{"speaker": "前田", "text": HOSTILE[1]}], "目的", "形式")
+    assert annotated[0]["metrics"]["威圧度"]["score"] >= 7
+    assert {value["source"] for value in annotated[0]["metrics"].values()} == {"local"}
+    assert annotated[0]["annotation_tier"] == "local" and "API unavailable" in annotated[0]["fallback_reason"]
+    assert "annotation_error" not in annotated[0]
+    # LLMで評価し直す対象になり、ローカル評価モデルの学習には使わない
+    assert select_utterances(annotated, [None], "missing") == [0]
+    row = flatten_output("s", {"scenario": annotated})[0]
+    assert row["annotation_error"] == 1 and all(math.isnan(score) for score in row["machine"].values())
@@ -0,0 +1,203 @@
+import json
+import random
+import threading
+import time
+from types import SimpleNamespace
+
+from llm_client import LLMClient
+from metric_annotator import METRIC_NAMES, MetricAnnotator
+
+
+def test_concurrent_annotation_matches_sequential(make_annotator, sample_scenario):
+    scenario = sample_scenario()
+    scenario.insert(3, {"speaker": "", "text": "不正な発言"})
+
+    annotator, completions = make_annotator()
+    sequential = annotator.annotate_scenario(scenario, "目的", "形式", max_workers=1)
+    sequential_prompts = [c['messages'][-1]['content'] for c in completions.calls]
+
+    annotator, completions = make_annotator(max_workers=4)
+    concurrent = annotator.annotate_scenario(scenario, "目的", "形式")
+    concurrent_prompts = sorted(c['messages'][-1]['content'] for c in completions.calls)
+
+    assert concurrent == sequential
+    assert len(concurrent) == len(scenario) - 1
+    assert concurrent_prompts == sorted(sequential_prompts)
+
+
+def test_batch_annotation_falls_back_for_missing_items(make_annotator, sample_scenario):
+    scenario = sample_scenario(10)
+
+    annotator, completions = make_annotator()
+    sequential = annotator.annotate_scenario(scenario, "目的", "形式")
+
+    annotator, completions = make_annotator(max_workers=3, batch_size=4)
+    batched = annotator.annotate_scenario(scenario, "目的", "形式")
+
+    assert batched == sequential
+    # 3バッチ（4+4+2件）+ 各バッチで欠落した1件ずつの個別再評価
+    assert len(completions.calls) == 6
+
+
+def test_reannotation_is_served_from_cache(tmp_path, make_annotator, sample_scenario):
+    from llm_cache import LLMCache
+
+    scenario = sample_scenario(6)
+    cache = LLMCache(str(tmp_path / "cache"))
+
+    annotator, completions = make_annotator(cache=cache, max_workers=2)
+    first = annotator.annotate_scenario(scenario, "目的", "形式")
+    assert len(completions.calls) == 6
+
+    annotator, completions = make_annotator(cache=cache, max_workers=2)
+    second = annotator.annotate_scenario(scenario, "目的", "形式")
+
+    assert second == first
+    assert len(completions.calls) == 0
+    assert cache.stats()["hits"] == 6
+
+
+def test_failed_utterance_keeps_other_results(make_annotator, sample_scenario):
+    scenario = sample_scenario(6)
+
+    annotator, completions = make_annotator()
+    expected = annotator.annotate_scenario(scenario, "目的", "形式")
+
+    # 4番目の発言（"発言"×4）だけが常に失敗する
+    annotator, completions = make_annotator(max_workers=3, fail_on="【評価対象の発言】\n話者0: " + "発言" * 4)
+    annotated = annotator.annotate_scenario(scenario, "目的", "形式")
+
+    assert annotated[3]["metrics"] == {}
+    assert "simulated failure" in annotated[3]["annotation_error"]
+    assert annotated[:3] + annotated[4:] == expected[:3] + expected[4:]
+
+
+def test_system_prompt_is_a_stable_prefix_reloaded_on_change(tmp_path, make_annotator, sample_scenario):
+    import os
+    import shutil
+
+    extra_path = tmp_path / "extra.json"
+    shutil.copy("data/extra.json", extra_path)
+    annotator, completions = make_annotator(max_workers=2)
+    annotator.system_prompt = type(annotator.system_prompt)(
+        str(extra_path), annotator._load_metrics, annotator._build_system_prompt
+    )
+
+    annotator.annotate_scenario(sample_scenario(4), "目的", "形式", batch_size=2)
+    annotator.annotate_scenario(sample_scenario(4), "目的", "形式")
+    system_prompts = {c['messages'][0]['content'] for c in completions.calls}
+    assert len(system_prompts) == 1
+    assert "【評価指標の定義】" in system_prompts.pop()
+    # 発言ごとの内容はユーザーメッセージの末尾
+    assert all("【評価対象の発言" in c['messages'][-1]['content'].rsplit('\n\n', 1)[1] for c in completions.calls)
+
+    definitions = json.loads(extra_path.read_text(encoding="utf-8"))
+    definitions["威圧度"]["定義"] = "更新後の定義"
+    extra_path.write_text(json.dumps(definitions, ensure_ascii=False), encoding="utf-8")
+    os.utime(extra_path, (time.time() + 10, time.time() + 10))
+
+    assert "更新後の定義" in annotator.system_prompt.get()
+
+
+class CascadeCompletions:
+    """安価なモデルは発言の種類に応じたスコア、上位モデルは常にスコア2を返す"""
+
+    CHEAP_SCORES = {
+        "中立": {},
+        "境界": {"威圧度": 4},
+        # 重点指標以外の指標が境界付近でも上位モデルには回さない
+        "逸脱": {"逸脱度": 8, "偏り度": 4},
+        "威圧": {"威圧度": 8},
+    }
+
+    def __init__(self):
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def create(self, **kwargs):
+        target = kwargs['messages'][-1]['content'].split('【評価対象の発言】\n', 1)[1].split('\n', 1)[0]
+        text = target.split(': ', 1)[1]
+        with self.lock:
+            self.calls.append((kwargs['model'], kwargs.get('seed'), text))
+        if kwargs['model'] == "primary-model":
+            result = {m: {"score": 2, "reason": "primary"} for m in METRIC_NAMES}
+        else:
+            scores = dict(self.CHEAP_SCORES.get(text, {}))
+            if text == "揺れ" and kwargs.get('seed') == 1:
+                scores["発言無効度"] = 5
+            result = {m: {"score": scores.get(m, 1), "reason": "cheap"} for m in METRIC_NAMES}
+        message = SimpleNamespace(content=json.dumps(result, ensure_ascii=False), refusal=None)
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+
+def test_cascade_escalates_only_uncertain_utterances():
+    llm_client = LLMClient("dummy")
+    completions = CascadeCompletions()
+    llm_client.client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+    annotator = MetricAnnotator(
+        "dummy", "primary-model", "data/extra.json", max_workers=4, llm_client=llm_client,
+        cascade_model="cheap-model", cascade_samples=2
+    )
+    texts = ["中立", "境界", "揺れ", "逸脱", "威圧"]
+    annotated = annotator.annotate_scenario(
+        [{"speaker": "田中", "text": t} for t in texts], "目的", "形式", focus_metrics=["威圧度"]
+    )
+
+    assert [utt["annotation_tier"] for utt in annotated] == ["cheap", "primary", "primary", "cheap", "primary"]
+    assert [utt.get("escalation") for utt in annotated] == [
+        None, ["borderline"], ["disagreement"], None, ["focus_high"]
+    ]
+    # 安価なモデルの評価をそのまま使った発言と、上位モデルで評価し直した発言
+    assert annotated[3]["metrics"]["逸脱度"] == {"score": 8, "reason": "cheap"}
+    assert annotated[4]["metrics"]["威圧度"] == {"score": 2, "reason": "primary"}
+    # 安価なモデルは全発言を2回（2回目はseed付き）、上位モデルは不確かな3発言だけ評価する
+    cheap_calls = [(seed, text) for model, seed, text in completions.calls if model == "cheap-model"]
+    assert sorted(cheap_calls, key=str) == sorted([(None, t) for t in texts] + [(1, t) for t in texts], key=str)
+    assert sorted(text for model, _, text in completions.calls if model == "primary-model") == ["境界", "威圧", "揺れ"]
+
+    # カスケードなしの場合は段階を記録しない
+    plain = MetricAnnotator("dummy", "primary-model", "data/extra.json", llm_client=llm_client)
+    assert "annotation_tier" not in plain.annotate_scenario([{"speaker": "田中", "text": "中立"}], "目的", "形式")[0]
+
+
+def test_cascade_escalation_rate_on_realistic_scores():
+    # 実際の評価に近い分布（大半の発言は低スコア、指標ごとに独立）で、安価なモデルの評価1回分を作る
+    weights = [20, 25, 20, 10, 7, 5, 4, 4, 3, 2]
+    rnd = random.Random(0)
+    samples = [
+        {m: {"score": rnd.choices(range(10), weights)[0], "reason": "cheap"} for m in METRIC_NAMES}
+        for _ in range(2000)
+    ]
+    annotator = MetricAnnotator(
+        "dummy", "primary-model", "data/extra.json", llm_client=LLMClient("dummy"), cascade_model="cheap-model"
+    )
+
+    def escalation_rate(focus_metrics):
+        return sum(bool(annotator._escalation_reasons([sample], focus_metrics)) for sample in samples) / len(samples)
+
+    # 重点指標がない場合は、過半数の指標が境界付近の発言だけを上位モデルに回す
+    assert escalation_rate(None) < 0.1
+    # 重点指標がある場合は、重点指標のスコアだけで判定する（1指標なら境界付近・高スコアの割合）
+    assert 0.2 < escalation_rate(["威圧度"]) < 0.4
+    assert escalation_rate(["威圧度", "逸脱度"]) < 0.6
+
+
+def test_selected_metrics_are_the_only_ones_prompted(make_annotator, sample_scenario, fake_annotation):
+    annotator, completions = make_annotator(batch_size=3)
+    annotated = annotator.annotate_scenario(sample_scenario(5), "目的", "形式", metrics=["偏り度", "逸脱度"])
+
+    # 指標の指定順によらず METRIC_NAMES の順、応答に含まれていても評価していない指標は記録しない
+    assert [list(utt["metrics"]) for utt in annotated] == [["逸脱度", "偏り度"]] * 5
+    assert annotated[0]["metrics"]["逸脱度"] == fake_annotation("話者0: 発言")["逸脱度"]
+    for call in completions.calls:
+        system, prompt = (m["content"] for m in call["messages"])
+        assert "【逸脱度】" in system and "【偏り度】" in system and "【威圧度】" not in system
+        assert '"逸脱度": {' in prompt and '"威圧度": {' not in prompt and "2つの指標" in prompt
+    assert len(completions.calls[0]["messages"][0]["content"]) < len(annotator.system_prompt.get())
+
+    try:
+        annotator.annotate_scenario(sample_scenario(1), "目的", "形式", metrics=["存在しない指標"])
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("未知の指標はValueError")
@@ -0,0 +1,23 @@
+from llm_client import LLMClient
+from metric_annotator import MetricAnnotator
+from mock_openai_server import MockBehavior, start_mock_server
+from scenario_generator import ScenarioGenerator
+
+
+def test_generation_and_annotation_against_mock_server():
+    # 約3割のリクエストが429（Retry-After付き）になるモックでも、再試行で全件完了する
+    server = start_mock_server(MockBehavior(latency=0.005, error_rate=0.3, retry_after=0.01, seed=1))
+    try:
+        llm_client = LLMClient("dummy", base_url=server.base_url, base_delay=0.01, max_retries=10)
+        generator = ScenarioGenerator("dummy", "mock-model", llm_client=llm_client)
+        annotator = MetricAnnotator("dummy", "mock-model", "data/extra.json", max_workers=4, batch_size=3, llm_client=llm_client)
+
+        scenario = generator.generate_scenario([{"id": "田中"}, {"id": "佐藤"}], "目的", "形式", num_utterances=9)
+        annotated = annotator.annotate_scenario(scenario, "目的", "形式")
+    finally:
+        server.shutdown()
+
+    assert [utt["speaker"] for utt in scenario] == ["田中", "佐藤"] * 4 + ["田中"]
+    assert all(annotator._is_valid_annotation(utt["metrics"]) for utt in annotated)
+    assert server.behavior.errors > 0
+    assert llm_client.usage_stats()["models"]["mock-model"]["cached_prompt_tokens"] > 0
@@ -0,0 +1,95 @@
+import json
+import os
+import time
+
+from output_index import OutputIndex
+
+
+def write_output(path, generated_at, profile_filename, focus_metrics=None, num_utterances=2):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    metadata = {
+        "generated_at": generated_at,
+        "meeting_purpose": "目的",
+        "meeting_format": "形式",
+        "num_utterances": num_utterances,
+        "profile_filename": profile_filename,
+    }
+    if focus_metrics is not None:
+        metadata["focus_metrics"] = focus_metrics
+    scenario = [{"speaker": "A", "text": "発言"}] * num_utterances
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({"metadata": metadata, "scenario": scenario}, f, ensure_ascii=False)
+
+
+def test_index_filters_pages_and_tracks_changes(tmp_path):
+    outputs = tmp_path / "outputs"
+    write_output(outputs / "a.json", "2025-12-18T10:00:00", "逸脱度_脱線王.json")
+    write_output(outputs / "b.json", "2025-12-19T10:00:00", "威圧度_上司.json", focus_metrics=["威圧度", "偏り度"])
+    write_output(outputs / "sub" / "c.json", "2025-12-22T10:00:00", "トライアル_ズレ.json")
+    (outputs / "sub" / "c_annotation.csv").write_text("Speaker,Content\n", encoding='utf-8')
+
+    index = OutputIndex(str(outputs), str(tmp_path / "index.sqlite3"), refresh_interval=0)
+    assert index.refresh(force=True) == 3
+
+    rows, total = index.query(per_page=2)
+    assert total == 3
+    assert [r["filename"] for r in rows] == ["sub/c.json", "b.json"]
+    rows, _ = index.query(page=2, per_page=2)
+    assert [r["filename"] for r in rows] == ["a.json"]
+
+    # 重点指標はメタデータ、なければプロフィール名の接頭辞から
+    assert [r["filename"] for r in index.query(focus_metric="逸脱度")[0]] == ["a.json"]
+    assert [r["filename"] for r in index.query(focus_metric="偏り度")[0]] == ["b.json"]
+    assert index.query(date_from="2025-12-19", date_to="2025-12-19")[1] == 1
+    assert index.query(directory="sub")[1] == 1
+    assert index.query(directory="")[1] == 2
+
+    # 変更されたファイルだけが再読み込みされ、削除されたファイルは索引から消える
+    write_output(outputs / "a.json", "2025-12-18T10:00:00", "逸脱度_脱線王.json", num_utterances=5)
+    stat = os.stat(outputs / "a.json")
+    os.utime(outputs / "a.json", (stat.st_atime, stat.st_mtime + 10))
+    os.remove(outputs / "b.json")
+    assert index.refresh(force=True) == 2
+    rows, total = index.query()
+    assert total == 2
+    assert {r["filename"]: r["num_utterances"] for r in rows}["a.json"] == 5
+
+
+def test_unreadable_files_are_not_reread_until_changed(tmp_path, monkeypatch):
+    outputs = tmp_path / "outputs"
+    write_output(outputs / "a.json", "2025-12-18T10:00:00", "逸脱度_脱線王.json")
+    (outputs / "placeholder.json").write_text("", encoding='utf-8')
+    (outputs / "settings.json").write_text('{"theme": "dark"}', encoding='utf-8')
+    index = OutputIndex(str(outputs), str(tmp_path / "index.sqlite3"), refresh_interval=0)
+    assert index.refresh(force=True) == 1
+
+    reads = []
+    original_upsert = OutputIndex.upsert
+    monkeypatch.setattr(OutputIndex, "upsert", lambda self, path: reads.append(path.name) or original_upsert(self, path))
+    assert index.refresh(force=True) == 0
+    assert reads == []
+    # 別のインスタンス（サーバーの再起動後）でも読み直さない
+    assert OutputIndex(str(outputs), str(tmp_path / "index.sqlite3")).refresh(force=True) == 0
+    assert reads == []
+
+    # 空のファイルにシナリオが書き込まれたら索引に加わる
+    write_output(outputs / "placeholder.json", "2025-12-19T10:00:00", "威圧度_上司.json")
+    assert index.refresh(force=True) == 1
+    assert reads == ["placeholder.json"]
+    assert index.query()[1] == 2
+
+
+def test_listing_does_not_scan_and_background_refresh_picks_up_files(tmp_path):
+    outputs = tmp_path / "outputs"
+    index = OutputIndex(str(outputs), str(tmp_path / "index.sqlite3"), refresh_interval=0.05)
+    write_output(outputs / "a.json", "2025-12-18T10:00:00", "逸脱度_脱線王.json")
+    assert index.query()[1] == 0 and index.filenames() == []
+
+    index.start_background_refresh()
+    try:
+        deadline = time.monotonic() + 5
+        while index.query()[1] == 0 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert index.filenames() == ["a.json"]
+    finally:
+        index.stop_background_refresh()
@@ -0,0 +1,62 @@
+import json
+
+from reannotate import reannotate_output
+
+
+def test_reannotates_only_missing_and_changed_utterances(tmp_path, make_annotator, sample_scenario, write_output):
+    annotator, completions = make_annotator()
+    annotated = annotator.annotate_scenario(sample_scenario(8), "目的", "形式")
+    expected = [dict(utt) for utt in annotated]
+
+    # 発言1は評価失敗、発言2は人手アノテーション保存済み（machine_annotationsに移動）で評価が欠落
+    annotated[1] = {**annotated[1], "metrics": {}, "annotation_error": "timeout"}
+    annotated[2] = {**annotated[2], "machine_annotations": {}, "human_annotations": {"威圧度": {"score": 1}}}
+    del annotated[2]["metrics"]
+    path = tmp_path / "output.json"
+    write_output(path, annotated, focus_metrics=[], target_ratio=50, scenario_model="fake-model",
+                 annotation_model="fake-model")
+
+    annotator, completions = make_annotator()
+    summary = reannotate_output(annotator, path, "missing")
+    data = json.loads(path.read_text(encoding="utf-8"))
+
+    assert summary["reannotated"] == 2 and len(completions.calls) == 2
+    assert data["scenario"][1]["metrics"] == expected[1]["metrics"]
+    assert "annotation_error" not in data["scenario"][1]
+    assert data["scenario"][2]["machine_annotations"] == expected[2]["metrics"]
+    assert data["scenario"][2]["human_annotations"] == {"威圧度": {"score": 1}}
+    assert data["metadata"]["annotation_errors"] == 0
+
+    # 発言6を編集すると、発言6とそれをコンテキストに含む発言7だけが再評価される
+    data["scenario"][6]["text"] = "編集後の発言"
+    path.write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+
+    annotator, completions = make_annotator()
+    summary = reannotate_output(annotator, path, "changed")
+    data = json.loads(path.read_text(encoding="utf-8"))
+
+    assert summary["reannotated"] == 2
+    targets = sorted(c["messages"][-1]["content"].split("【評価対象の発言】\n", 1)[1].split("\n", 1)[0] for c in completions.calls)
+    assert targets == sorted(["話者0: 編集後の発言", "話者1: " + "発言" * 8])
+    assert data["scenario"][6]["metrics"]["威圧度"]["reason"] == "話者0: 編集後の発言"
+
+
+def test_deferred_pass_fills_only_missing_metrics(tmp_path, make_annotator, sample_scenario, write_output):
+    annotator, _ = make_annotator()
+    expected = annotator.annotate_scenario(sample_scenario(4), "目的", "形式")
+    annotated = annotator.annotate_scenario(sample_scenario(4), "目的", "形式", metrics=["逸脱度"])
+    annotated[0]["metrics"]["逸脱度"] = {"score": 9, "reason": "評価済み"}
+    path = tmp_path / "output.json"
+    write_output(path, annotated, focus_metrics=["逸脱度"], target_ratio=50, scenario_model="fake-model",
+                 annotation_model="fake-model", annotation_metrics=["逸脱度"])
+
+    annotator, completions = make_annotator()
+    summary = reannotate_output(annotator, path, "missing")
+    data = json.loads(path.read_text(encoding="utf-8"))
+
+    assert summary["reannotated"] == 4
+    assert all("3つの指標" in c["messages"][-1]["content"] for c in completions.calls)
+    assert [utt["metrics"] for utt in data["scenario"][1:]] == [utt["metrics"] for utt in expected[1:]]
+    # 評価済みの指標は評価し直さない
+    assert data["scenario"][0]["metrics"]["逸脱度"] == {"score": 9, "reason": "評価済み"}
+    assert "annotation_metrics" not in data["metadata"]
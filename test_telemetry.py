@@ -0,0 +1,48 @@
+import json
+
+import pytest
+
+import telemetry
+from llm_cache import LLMCache
+from output_store import read_json, write_json_atomic
+
+
+def test_trace_collects_llm_calls_from_worker_threads(tmp_path, make_annotator, sample_scenario):
+    cache = LLMCache(str(tmp_path / "cache"))
+    annotator, completions = make_annotator(cache=cache, max_workers=4)
+
+    with telemetry.trace() as trace:
+        with telemetry.stage("annotation"):
+            annotator.annotate_scenario(sample_scenario(6), "目的", "形式")
+            annotator.annotate_scenario(sample_scenario(6), "目的", "形式")
+        write_json_atomic(tmp_path / "output.json", {"scenario": []})
+        read_json(tmp_path / "output.json")
+    summary = trace.summary()
+
+    assert summary["llm"]["calls"] == len(completions.calls) == 6
+    assert summary["llm"]["cache_hits"] == 6
+    assert summary["llm"]["errors"] == 0
+    assert summary["file_io"] == {**summary["file_io"], "reads": 1, "writes": 1}
+    assert summary["stages"]["annotation"] > 0
+    # 料金表にないモデルはコストを見積もらない
+    assert summary["llm"]["estimated_cost_usd"] is None
+    json.dumps(summary)
+
+    rendered = telemetry.REGISTRY.render()
+    assert 'well_scenario_llm_requests_total{model="fake-model",outcome="cache_hit"}' in rendered
+    assert 'well_scenario_file_io_seconds_bucket{operation="write",le="+Inf"}' in rendered
+
+
+def test_failed_calls_are_recorded_as_errors(make_annotator, sample_scenario):
+    annotator, _ = make_annotator(fail_on="話者1: 発言発言")
+    annotator.llm.max_retries = 0
+
+    with telemetry.trace() as trace:
+        annotator.annotate_scenario(sample_scenario(3), "目的", "形式")
+
+    assert trace.summary()["llm"]["errors"] == 1
+
+
+def test_estimate_cost_matches_dated_model_names():
+    cost = telemetry.estimate_cost("gpt-4o-mini-2024-07-18", 1_000_000, 500_000, 1_000_000)
+    assert cost == pytest.approx(0.5 * 0.15 + 0.5 * 0.075 + 0.60)